@@ -0,0 +1,308 @@
+"""
+End to end benchmark of `BaseConnector.run`, offline.
+
+Every scenario runs a connector over a synthetic table through the real writer
+strategies, on a local SparkSession writing to a moto S3 server (through s3a), with a
+fake lakehouse hook standing in for the catalog. The throughput and the per-step
+timings of each run are appended to a JSON lines results file.
+
+    python benchmarks/bench_connector_run.py [--rows 100000 1000000] [--partitions 1 8]
+        [--formats PARQUET DELTA] [--repeat 3] [--results benchmarks/results/connector_run.jsonl]
+
+Needs pyspark, xenpy and moto[server]. The s3a connector (and delta for DELTA runs)
+are pulled with `--packages`, so the first run needs them in the ivy cache or network.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from shadowtool.interfaces.connector import BaseConnector
+from shadowtool.main.general.instrumentation_utils import Instrumentation, RunRecord
+from shadowtool.main.vendors.lakehouse import DELTA_MANIFEST_MARKER, catalog_cache
+
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results", "connector_run.jsonl")
+HADOOP_AWS_PACKAGE = "org.apache.hadoop:hadoop-aws:3.3.1"
+DELTA_PACKAGE = "io.delta:delta-core_2.12:1.1.0"
+
+
+class FakeLakehouseHook:
+    """
+    in-memory catalog, registering a table records a DDL like the metastore would
+    return it, so the drop/recreate decision of the next run sees it
+    """
+
+    def __init__(self):
+        self.ddls: Dict[str, str] = {}
+        self.calls: List[str] = []
+
+    def create_table_by_data_prefix(
+        self, s3_data_prefix, data_format, partition_keys, fq_tbl_name, drop_original=False
+    ):
+        self.calls.append("create_table_by_data_prefix")
+        location = s3_data_prefix
+        if getattr(data_format, "name", data_format) == "DELTA":
+            location = f"{s3_data_prefix}/{DELTA_MANIFEST_MARKER}"
+        self.ddls[fq_tbl_name] = f"CREATE EXTERNAL TABLE {fq_tbl_name} LOCATION '{location}'"
+
+    def get_ddl_from_system(self, fq_tbl_name: str) -> Optional[str]:
+        self.calls.append("get_ddl_from_system")
+        return self.ddls.get(fq_tbl_name)
+
+    def get_ddls_from_system(self, fq_tbl_names: List[str]) -> Dict[str, Optional[str]]:
+        self.calls.append("get_ddls_from_system")
+        return {name: self.ddls.get(name) for name in fq_tbl_names}
+
+    def __getattr__(self, name: str):
+        # grants, repairs and any other catalog statement are accepted and recorded
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+
+        return call
+
+
+@dataclass
+class SyntheticConnector(BaseConnector):
+    """connector whose extraction generates `bench_rows` rows in `bench_partitions` partitions"""
+
+    bench_rows: int = 100000
+    bench_partitions: int = 8
+
+    def __post_init__(self):
+        super().__post_init__()
+        if self._writer_strategy is None:
+            self._init_writer()
+
+    def extract(self):
+        return (
+            self.spark_session.range(self.bench_rows, numPartitions=self.bench_partitions)
+            .selectExpr(
+                "id",
+                "id % 1000 AS customer_id",
+                "rand(7) * 100 AS amount",
+                "CAST(date_add('2021-01-01', CAST(id % 365 AS INT)) AS STRING) AS dt",
+                "sha2(CAST(id AS STRING), 256) AS payload",
+            )
+        )
+
+    def _init_datadog_monitoring(self):
+        pass
+
+    def _report_pipeline_run_meta(self):
+        pass
+
+
+class _RecordSink:
+    def __init__(self):
+        self.records: List[RunRecord] = []
+
+    def emit(self, record: RunRecord) -> None:
+        self.records.append(record)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_s3_server():
+    """a moto S3 server on a free local port, with fake credentials in the environment"""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as e:
+        raise ImportError("moto[server] is required to run the benchmark offline") from e
+
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ[name] = "benchmark"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def build_spark_session(master: str, endpoint: str, with_delta: bool, shuffle_partitions: int):
+    from pyspark.sql import SparkSession
+
+    packages = [HADOOP_AWS_PACKAGE] + ([DELTA_PACKAGE] if with_delta else [])
+    builder = (
+        SparkSession.builder.master(master)
+        .appName("shadowtool-connector-benchmark")
+        .config("spark.ui.enabled", "false")
+        .config("spark.jars.packages", ",".join(packages))
+        .config("spark.sql.shuffle.partitions", str(shuffle_partitions))
+        .config("spark.hadoop.fs.s3a.endpoint", endpoint)
+        .config("spark.hadoop.fs.s3a.path.style.access", "true")
+        .config("spark.hadoop.fs.s3a.connection.ssl.enabled", "false")
+        .config("spark.hadoop.fs.s3a.access.key", "benchmark")
+        .config("spark.hadoop.fs.s3a.secret.key", "benchmark")
+    )
+    # the data paths of the connectors use the s3 and s3n schemes as well
+    for scheme in ("s3", "s3n"):
+        builder = builder.config(
+            f"spark.hadoop.fs.{scheme}.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem"
+        )
+    if with_delta:
+        builder = builder.config(
+            "spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension"
+        ).config(
+            "spark.sql.catalog.spark_catalog", "org.apache.spark.sql.delta.catalog.DeltaCatalog"
+        )
+    return builder.getOrCreate()
+
+
+def _bucket_of(s3_path: str) -> str:
+    return s3_path.split("://", 1)[1].split("/", 1)[0]
+
+
+def run_scenario(
+    spark_session,
+    endpoint: str,
+    rows: int,
+    partitions: int,
+    data_format: str,
+    etl_mode: str,
+    repeat: int,
+) -> List[Dict[str, Any]]:
+    import boto3
+
+    hook = FakeLakehouseHook()
+    sink = _RecordSink()
+    results = []
+    for attempt in range(repeat):
+        connector = SyntheticConnector(
+            source_name="benchmark",
+            db_name="synthetic",
+            tbl_name=f"bench_{data_format.lower()}_{rows}_{partitions}",
+            data_format=data_format,
+            etl_mode=etl_mode,
+            spark_session=spark_session,
+            lakehouse_hook=hook,
+            run_quality_check=False,
+            bench_rows=rows,
+            bench_partitions=partitions,
+            partitions_count=partitions,
+        )
+        connector.instrumentation = Instrumentation(
+            [sink], tags={"fq_tbl_name": connector._data_directory.fq_tbl_name}
+        )
+        if attempt == 0:
+            s3 = boto3.client("s3", endpoint_url=endpoint)
+            bucket = _bucket_of(connector._data_directory.clean_s3_data_path)
+            if bucket not in [b["Name"] for b in s3.list_buckets()["Buckets"]]:
+                s3.create_bucket(Bucket=bucket)
+
+        started = time.perf_counter()
+        connector.run()
+        elapsed = time.perf_counter() - started
+
+        record = sink.records[-1]
+        steps: Dict[str, float] = {}
+        for step in record.steps:
+            steps[step.path] = steps.get(step.path, 0.0) + step.wall_seconds
+        results.append(
+            {
+                "rows": rows,
+                "partitions": partitions,
+                "data_format": data_format,
+                "etl_mode": etl_mode,
+                "attempt": attempt,
+                "wall_seconds": elapsed,
+                "rows_per_second": rows / elapsed if elapsed else None,
+                "peak_memory_bytes": record.peak_memory_bytes,
+                "steps": steps,
+            }
+        )
+    catalog_cache.clear()
+    return results
+
+
+def summarise(results: List[Dict[str, Any]]) -> str:
+    lines = []
+    for r in results:
+        if r["attempt"] != 0:
+            continue
+        same = [
+            x["wall_seconds"]
+            for x in results
+            if (x["rows"], x["partitions"], x["data_format"])
+            == (r["rows"], r["partitions"], r["data_format"])
+        ]
+        best = min(same)
+        lines.append(
+            f"{r['data_format']:>8} {r['rows']:>10,} rows {r['partitions']:>4} partitions: "
+            f"best {best:8.2f}s, median {statistics.median(same):8.2f}s, "
+            f"{r['rows'] / best:12,.0f} rows/s"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--formats", nargs="+", default=["PARQUET", "DELTA"])
+    parser.add_argument("--etl-mode", default="FULL_RELOAD")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--master", default="local[*]")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH)
+    args = parser.parse_args()
+
+    formats = [f.upper() for f in args.formats]
+    server, endpoint = start_s3_server()
+    spark_session = build_spark_session(
+        args.master, endpoint, with_delta="DELTA" in formats, shuffle_partitions=max(args.partitions)
+    )
+
+    session_id = uuid.uuid4().hex
+    results = []
+    try:
+        for data_format in formats:
+            for rows in args.rows:
+                for partitions in args.partitions:
+                    results.extend(
+                        run_scenario(
+                            spark_session,
+                            endpoint,
+                            rows,
+                            partitions,
+                            data_format,
+                            args.etl_mode,
+                            args.repeat,
+                        )
+                    )
+    finally:
+        spark_session.stop()
+        server.stop()
+
+    environment = {
+        "session_id": session_id,
+        "recorded_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "spark": spark_session.version,
+        "master": args.master,
+        "host": platform.node(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "a") as f:
+        for result in results:
+            f.write(json.dumps({**environment, **result}, sort_keys=True) + "\n")
+
+    print(summarise(results))
+    print(f"Results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the registra models validation, with and without the field alias cache.
+
+    python benchmarks/bench_registra_models.py [--tables 2000] [--repeat 5]
+"""
+import argparse
+import timeit
+
+import shadowtool.main.registra.models as models
+
+
+def build_raw_source(n_tables: int) -> dict:
+    return {
+        "source_name": "bench",
+        "source_type": "DATABASE",
+        "is_active": True,
+        "data_config": {
+            f"db_{i % 10}": {
+                "tables": {
+                    f"tbl_{j}": {
+                        "etl_mode": "INCREMENTAL",
+                        "data_format": "parquet",
+                        "upsert_key": ["id"],
+                        "run_quality_check": True,
+                        "owner": "data-team",
+                    }
+                    for j in range(i, n_tables, 10)
+                }
+            }
+            for i in range(min(10, n_tables))
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tables", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw = build_raw_source(args.tables)
+
+    cached_aliases = models.get_field_aliases
+
+    for name, get_field_aliases in [
+        # the aliases computed again for every model instance
+        ("uncached", cached_aliases.__wrapped__),
+        ("cached", cached_aliases),
+    ]:
+        models.get_field_aliases = get_field_aliases
+        try:
+            best = min(
+                timeit.repeat(
+                    lambda: models.ReplicationSourceRegistra(**raw), number=1, repeat=args.repeat
+                )
+            )
+        finally:
+            models.get_field_aliases = cached_aliases
+        print(
+            f"{name:>10}: {best * 1000:8.2f} ms per source, "
+            f"{args.tables / best:12,.0f} tables/s"
+        )
+
+if __name__ == "__main__":
+    main()
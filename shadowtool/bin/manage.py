@@ -1,10 +1,15 @@
 import click
 
+from shadowtool.bin.subcommands.registra import registra
+
 
 @click.group()
 def cli():
     pass
 
 
+cli.add_command(registra)
+
+
 def main():
     cli()
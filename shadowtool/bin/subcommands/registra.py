@@ -0,0 +1,43 @@
+import importlib
+
+import click
+
+from shadowtool.main.registra.manager import RegistraManager
+
+
+@click.group()
+def registra():
+    """manage the registra configuration files"""
+    pass
+
+
+@registra.command()
+@click.argument("registra_path", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Snapshot file to write, defaults to `<REGISTRA_PATH>.snapshot.pkl`.",
+)
+@click.option(
+    "--setup-module",
+    "-m",
+    multiple=True,
+    help="Module to import before compiling, e.g. one registering the registra parsers.",
+)
+def compile(registra_path: str, output: str, setup_module: tuple):
+    """
+    parse every yaml file under REGISTRA_PATH and write the compiled registra snapshot,
+    so connectors load it with a single read
+    """
+    for module in setup_module:
+        importlib.import_module(module)
+
+    RegistraManager.local_registra_path = registra_path
+    compiled = RegistraManager.compile_registra(snapshot_path=output)
+
+    click.echo(
+        f"Compiled {len(compiled.registra)} sources from {len(compiled.file_hashes)} files "
+        f"into {output or RegistraManager.get_snapshot_path()} (hash {compiled.content_hash[:12]})"
+    )
@@ -1,4 +1,26 @@
 import os
 
 # configuration
-ST__LOG_LEVEL = "ST__LOG_LEVEL"
\ No newline at end of file
+ST__LOG_LEVEL = "ST__LOG_LEVEL"
+# secret manager cache
+ST__SECRET_CACHE_PATH = "ST__SECRET_CACHE_PATH"
+ST__SECRET_CACHE_KEY = "ST__SECRET_CACHE_KEY"
+
+# aws
+ST__AWS_MAX_POOL_CONNECTIONS = "ST__AWS_MAX_POOL_CONNECTIONS"
+
+# registra
+ST__REGISTRA_PATH = "ST__REGISTRA_PATH"
+ST__REGISTRA_S3_BUCKET_NAME = "ST__REGISTRA_S3_BUCKET_NAME"
+
+# lakehouse
+ST__CATALOG_CACHE_TTL = "ST__CATALOG_CACHE_TTL"
+
+# incremental extraction
+ST__WATERMARK_STORE_URL = "ST__WATERMARK_STORE_URL"
+
+# streaming runs
+ST__CHECKPOINT_STORE_URL = "ST__CHECKPOINT_STORE_URL"
+
+# instrumentation
+ST__INSTRUMENTATION_SINKS = "ST__INSTRUMENTATION_SINKS"
@@ -1,6 +1,15 @@
+from dataclasses import dataclass
+from typing import Optional
+
 from shadowtool.interfaces.connector import ThirdPartyConnector
 
 
+@dataclass
 class FutuConnector(ThirdPartyConnector):
 
-    ...
\ No newline at end of file
+    # stays under the quota of 60 history candlestick requests per 30 seconds,
+    # shared by every futu connector of the process
+    rate_limit_per_second: Optional[float] = 1.5
+    rate_limit_burst: Optional[int] = 1
+    # requests all go through the one local OpenD gateway
+    max_concurrent_requests: Optional[int] = 4
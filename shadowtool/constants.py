@@ -1,4 +1,8 @@
+import os
+import tempfile
 from enum import Enum
 
 PROJECT_NAME = "shadowtool"
 
+TEMP_FOLDER_DIRECTORY = os.path.join(tempfile.gettempdir(), PROJECT_NAME)
+
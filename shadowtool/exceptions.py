@@ -43,3 +43,42 @@ class UnknownRegistraModelTypeError(Exception):
     def __init__(self, model_name: str, raw_type: str):
         self.message = f"Unknown {model_name} type `{raw_type}`. Please check or declare a new one."
         super().__init__(self.message)
+
+
+class S3SyncFailure(Exception):
+
+    """
+    raise when one or more files failed to transfer during a S3 sync
+    """
+
+    def __init__(self, report):
+        self.report = report
+        failed = ", ".join(sorted(report.failed)[:10])
+        self.message = f"{len(report.failed)} file(s) failed to sync. {report.summary()}. Failed: {failed}"
+        super().__init__(self.message)
+
+
+class S3DeleteFailure(Exception):
+
+    """
+    raise when one or more keys failed to be deleted during a S3 bulk delete
+    """
+
+    def __init__(self, report):
+        self.report = report
+        failed = ", ".join(f"{k} ({v})" for k, v in sorted(report.failed.items())[:10])
+        self.message = f"{len(report.failed)} key(s) failed to be deleted, {report.deleted} deleted. Failed: {failed}"
+        super().__init__(self.message)
+
+
+class ApiFetchFailure(Exception):
+
+    """
+    raise when one or more API requests still failed after their retries
+    """
+
+    def __init__(self, report):
+        self.report = report
+        failed = ", ".join(f"{k} ({v})" for k, v in sorted(report.failed.items())[:10])
+        self.message = f"{len(report.failed)} request(s) failed. {report.summary()}. Failed: {failed}"
+        super().__init__(self.message)
@@ -0,0 +1,262 @@
+"""
+Run the connectors of many tables of one source inside a single Spark driver.
+
+Starting a driver, syncing the registra and looking up the catalog costs more than
+replicating a small table. The batch runner pays those once: the connectors share the
+SparkSession, the loaded registra and the catalog metadata cache, and their
+extract / write steps run concurrently, each in its own Spark scheduler pool.
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Type
+
+from shadowtool.main.general.logging_utils import LoggingMixin
+from shadowtool.main.registra.manager import RegistraManager
+from shadowtool.main.registra.models import RegistraTask
+from shadowtool.main.vendors.lakehouse import catalog_cache
+
+if TYPE_CHECKING:
+    from shadowtool.interfaces.connector import BaseConnector
+
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+SKIPPED = "SKIPPED"
+
+
+@dataclass
+class BatchTableResult:
+
+    source_name: str
+    db_name: str
+    tbl_name: str
+    status: str
+    fq_tbl_name: Optional[str] = None
+    started_at: Optional[datetime] = None
+    elapsed_seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchRunReport:
+
+    source_name: str
+    results: List[BatchTableResult] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> List[BatchTableResult]:
+        return [r for r in self.results if r.status == SUCCEEDED]
+
+    @property
+    def failed(self) -> List[BatchTableResult]:
+        return [r for r in self.results if r.status == FAILED]
+
+    @property
+    def skipped(self) -> List[BatchTableResult]:
+        return [r for r in self.results if r.status == SKIPPED]
+
+    @property
+    def all_succeeded(self) -> bool:
+        return not self.failed and not self.skipped
+
+    def summary(self) -> str:
+        lines = [
+            f"Batch run of source {self.source_name}: {len(self.succeeded)} succeeded, "
+            f"{len(self.failed)} failed, {len(self.skipped)} skipped "
+            f"in {self.elapsed_seconds:.1f}s"
+        ]
+        for r in self.results:
+            line = f"  {r.status:<9} {r.db_name}.{r.tbl_name} ({r.elapsed_seconds:.1f}s)"
+            if r.error:
+                line += f": {r.error}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+@dataclass
+class BatchRunner(LoggingMixin):
+    """
+    run one connector per table of a source, in a single driver
+
+    :param connector_cls: the connector class of the source
+    :param source_name: the source of all the tables
+    :param tasks: the tables to run, e.g. `RegistraManager.get_all_available_registra_tasks`
+    :param spark_session: the session shared by every connector
+    :param connector_kwargs: arguments passed to every connector, e.g. the lakehouse hook
+    :param max_concurrency: number of tables running at the same time
+    :param scheduler_pool_prefix: concurrent tables run in the Spark FAIR scheduler pools
+            `<prefix>_0` .. `<prefix>_<max_concurrency - 1>`, which only share the
+            cluster fairly when `spark.scheduler.mode` is FAIR
+    :param fail_fast: skip the remaining tables after the first failure
+    """
+
+    connector_cls: Type["BaseConnector"]
+    source_name: str
+    tasks: Sequence[RegistraTask]
+    spark_session: Any
+    connector_kwargs: Dict[str, Any] = field(default_factory=dict)
+    max_concurrency: int = 4
+    scheduler_pool_prefix: str = "shadowtool"
+    fail_fast: bool = False
+    registra_manager: Type[RegistraManager] = RegistraManager
+    registra_search_path: Optional[str] = None
+
+    def __post_init__(self):
+        assert self.max_concurrency > 0, "max_concurrency needs to be a positive integer. "
+        self._failed = threading.Event()
+        self._pools = threading.local()
+        self._pool_slots = itertools.count()
+
+    @classmethod
+    def from_registra(
+        cls,
+        connector_cls: Type["BaseConnector"],
+        source_name: str,
+        spark_session: Any,
+        db_name: Optional[str] = None,
+        registra_manager: Type[RegistraManager] = RegistraManager,
+        **kwargs,
+    ) -> "BatchRunner":
+        """a runner of every table registered for the source (or one of its dbs)"""
+        tasks = registra_manager.get_all_available_registra_tasks(
+            source_name=source_name, db_name=db_name
+        )
+        return cls(
+            connector_cls=connector_cls,
+            source_name=source_name,
+            tasks=tasks,
+            spark_session=spark_session,
+            registra_manager=registra_manager,
+            **kwargs,
+        )
+
+    def run(self) -> BatchRunReport:
+        started = time.monotonic()
+        self._load_registra()
+
+        results: Dict[RegistraTask, BatchTableResult] = {}
+        connectors = {}
+        for task in self.tasks:
+            connector, result = self._build_connector(task)
+            results[task] = result
+            if connector is not None:
+                connectors[task] = connector
+
+        self._prefetch_catalog_metadata(list(connectors.values()))
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="batch-runner"
+        ) as executor:
+            for task, result in zip(
+                list(connectors),
+                executor.map(self._run_connector, connectors.keys(), connectors.values()),
+            ):
+                results[task] = result
+
+        report = BatchRunReport(
+            source_name=self.source_name,
+            results=[results[task] for task in self.tasks],
+            elapsed_seconds=time.monotonic() - started,
+        )
+        self.log.info(report.summary())
+        return report
+
+    def _load_registra(self) -> None:
+        # synced and parsed once, the connectors' own lookups then hit the loaded registra
+        if self.registra_search_path is not None:
+            self.registra_manager.set_registra_search_path(self.registra_search_path)
+        self.registra_manager.registra_index
+
+    def _build_connector(self, task: RegistraTask):
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        try:
+            connector = self.connector_cls(
+                source_name=task.source_name,
+                db_name=task.db_name,
+                tbl_name=task.tbl_name,
+                spark_session=self.spark_session,
+                # the connectors look their config up in the registra loaded by the runner
+                **{"registra_manager": self.registra_manager, **self.connector_kwargs},
+            )
+        except Exception as e:
+            self.log.exception(f"Unable to initialise the connector of {task}")
+            self._failed.set()
+            return None, self._result(task, FAILED, started_at, started, error=repr(e))
+
+        return connector, self._result(
+            task,
+            SKIPPED,
+            started_at,
+            started,
+            fq_tbl_name=connector._data_directory.fq_tbl_name,
+        )
+
+    def _prefetch_catalog_metadata(self, connectors: List["BaseConnector"]) -> None:
+        if not connectors:
+            return
+        try:
+            catalog_cache.prefetch(
+                [c._data_directory.fq_tbl_name for c in connectors],
+                connectors[0].lakehouse_hook,
+            )
+        except Exception as e:
+            # the connectors fall back to their own lookups
+            self.log.warning(f"Unable to prefetch the catalog metadata: {e}")
+
+    def _run_connector(self, task: RegistraTask, connector: "BaseConnector") -> BatchTableResult:
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        fq_tbl_name = connector._data_directory.fq_tbl_name
+
+        if self.fail_fast and self._failed.is_set():
+            return self._result(
+                task, SKIPPED, started_at, started, fq_tbl_name, error="skipped after a failure"
+            )
+
+        spark_context = self.spark_session.sparkContext
+        spark_context.setLocalProperty("spark.scheduler.pool", self._scheduler_pool())
+        spark_context.setJobGroup(fq_tbl_name, f"shadowtool batch run of {fq_tbl_name}")
+        try:
+            connector.run()
+        except Exception as e:
+            self.log.exception(f"Table {fq_tbl_name} failed")
+            self._failed.set()
+            return self._result(task, FAILED, started_at, started, fq_tbl_name, error=repr(e))
+        finally:
+            spark_context.setLocalProperty("spark.scheduler.pool", None)
+            spark_context.setLocalProperty("spark.jobGroup.id", None)
+
+        return self._result(task, SUCCEEDED, started_at, started, fq_tbl_name)
+
+    def _scheduler_pool(self) -> str:
+        """one pool per worker thread, assigned on its first table"""
+        pool = getattr(self._pools, "name", None)
+        if pool is None:
+            slot = next(self._pool_slots) % self.max_concurrency
+            pool = self._pools.name = f"{self.scheduler_pool_prefix}_{slot}"
+        return pool
+
+    @staticmethod
+    def _result(
+        task: RegistraTask,
+        status: str,
+        started_at: datetime,
+        started: float,
+        fq_tbl_name: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> BatchTableResult:
+        return BatchTableResult(
+            source_name=task.source_name,
+            db_name=task.db_name,
+            tbl_name=task.tbl_name,
+            status=status,
+            fq_tbl_name=fq_tbl_name,
+            started_at=started_at,
+            elapsed_seconds=time.monotonic() - started,
+            error=error,
+        )
@@ -1,6 +1,7 @@
 import os
 import logging
-from typing import Optional, List, Any, Tuple, Dict
+import threading
+from typing import Optional, List, Any, Tuple, Dict, Callable, Iterable
 from datetime import datetime
 from abc import abstractmethod
 import pyspark
@@ -10,7 +11,7 @@ from cached_property import cached_property
 from pyspark.sql import SparkSession
 import xenpy.hooks.lakehouse as lhm
 from xenpy.s3 import databricks_path, dbfs_path
-from xenpy.registra.manager import RegistraManager
+from shadowtool.main.registra.manager import RegistraManager
 import inspect
 import pprint
 
@@ -39,11 +40,30 @@ from xenpy.data_replication.strategy.reporter import (
 )
 from xenpy.models.base_manager import BaseDataLakehouseOperationManager
 from xenpy.data_quality_check import DataQualityCheck
-from xenpy.models.data_directory import StandardDataDirectory, ReplicationDataDirectory
+from shadowtool.interfaces.data_directory import StandardDataDirectory, ReplicationDataDirectory
+from shadowtool.main.vendors.lakehouse import catalog_cache
+from shadowtool.main.vendors.response_cache import ResponseCache
+from shadowtool.main.general.watermark_utils import Watermark, get_watermark_store
+from shadowtool.main.general.checkpoint_utils import (
+    Checkpoint,
+    get_checkpoint_store,
+    plan_fingerprint,
+)
+from shadowtool.main.general.instrumentation_utils import get_instrumentation
+import shadowtool.main.general.fetch_utils as fetch_utils
+import shadowtool.main.general.partition_utils as partition_utils
+import sqlalchemy
 import xenpy.new_utils.mixins as mixins
 
 logger = logging.getLogger(__name__)
 
+# the single chunk of a streaming run whose extraction is not split
+FULL_EXTRACT_CHUNK_ID = "full"
+
+# connectors run in threads share the spark session, whose arrow conf is toggled
+# around pandas conversions, see `ThirdPartyConnector._record_batches_to_df`
+_ARROW_CONF_LOCK = threading.Lock()
+
 
 @dataclass
 class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManager):
@@ -107,6 +127,24 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
     # airflow scheduling (this is not used in the ETL logic itself)
     scheduling: Optional[models.DatabricksJobsSchedulingConfig] = None
 
+    # where the table config is looked up, e.g. a subclass loading another registra path
+    registra_manager: Any = RegistraManager
+
+    # incremental state, the high-water mark of this key is committed after each successful run
+    watermark_key: Optional[str] = None
+    # see `get_watermark_store`, defaults to ST__WATERMARK_STORE_URL
+    watermark_store_url: Optional[str] = None
+
+    # micro-batch run, the extraction is written chunk by chunk with checkpoints, see `_run_streaming`
+    streaming: Optional[bool] = False
+    # see `get_checkpoint_store`, defaults to ST__CHECKPOINT_STORE_URL
+    checkpoint_store_url: Optional[str] = None
+
+    # see `get_instrumentation`, defaults to ST__INSTRUMENTATION_SINKS, disabled without any
+    instrumentation_sinks: Optional[List[str]] = None
+    # count the extracted rows, persisting the extracted dataframe to time the extraction apart
+    instrumentation_count_rows: Optional[bool] = False
+
     # private, to be excluded from Arguments check
     _source_type: SourceType = None
     _raw_data_directory: StandardDataDirectory = None  # used for extraction step
@@ -114,6 +152,10 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
     _writer_strategy: Any = None
     _reader_strategy: Any = None
     _dqc_strategy: Any = None
+    _watermark: Optional[Watermark] = None
+    _pending_watermark_value: Any = None
+    # set once a failed DQC reverted the last write
+    _rolled_back_last_write: bool = False
 
     _extractor_strategy_kwargs: Dict = field(default_factory=dict)
     _writer_strategy_kwargs: Dict = field(default_factory=dict)
@@ -126,7 +168,7 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
         assert self.db_name is not None
         assert self.tbl_name is not None
 
-        self._config_from_registra()  # TO BaseManager
+        self._config_from_registra(self.registra_manager)  # TO BaseManager
 
         # enum conversion
         self._etl_mode = models.ETLMode[self.etl_mode.upper()]
@@ -296,27 +338,23 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
             1. if etl_mode is in FULL_RELOAD, we will drop and recreate
             2. if the existing underlying table is in PARQUET and mode is in DELTA
             3. if the existing underlying table is in DELTA and mode is in PARQUET
+
+        The DDL is read from the process-wide catalog metadata cache.
         """
-        ddl = self.lakehouse_hook.get_ddl_from_system(fq_tbl_name)
+        metadata = catalog_cache.get_table_metadata(fq_tbl_name, self.lakehouse_hook)
 
-        if ddl is None:
+        if not metadata.exists:
             logger.warning(
                 f"Unable to locate table {fq_tbl_name} in Hive when retrieving DDL. "
             )
             return True
 
-        logger.debug(f"Fetched DDL for table {fq_tbl_name}: {ddl}")
+        logger.debug(f"Fetched DDL for table {fq_tbl_name}: {metadata.ddl}")
 
-        if (
-            "_symlink_format_manifest" in ddl
-            and self._data_format == models.DataFormat.PARQUET
-        ):
+        if metadata.is_delta and self._data_format == models.DataFormat.PARQUET:
             return True
 
-        if (
-            "_symlink_format_manifest" not in ddl
-            and self._data_format == models.DataFormat.DELTA
-        ):
+        if not metadata.is_delta and self._data_format == models.DataFormat.DELTA:
             return True
 
         if self._etl_mode == models.ETLMode.FULL_RELOAD:
@@ -335,18 +373,38 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
             4. Target table registration (for Secondary engine like presto)
 
         """
+        with self.instrumentation.run(streaming=bool(self.streaming)):
+            if self.streaming:
+                return self._run_streaming()
+            self._run_batch()
+
+    def _run_batch(self):
         logger.warning(
             "Step 1: Extracting data from source and persisting into RAW layer ..."
         )
-        df = self.extract()
+        with self.instrumentation.step("extract") as step:
+            self._load_watermark()
+            df = self.extract()
+            if step.enabled:
+                df = self._instrument_df(df, step)
+            df = self._compute_pending_watermark(df)
 
         logger.warning(
             f"Step 2: Read from the data passed from step 1, persisting into CLEAN layer ..."
         )
-        write_status = self._writer_strategy.write(
-            df=df, **self._writer_strategy_kwargs
-        )
+        try:
+            with self.instrumentation.step("write") as step:
+                write_status = self._writer_strategy.write(
+                    df=df, **self._writer_strategy_kwargs
+                )
+                step.set(written=bool(write_status))
+        finally:
+            self._release_df(df)
+
+        self._finish_run(write_status)
 
+    def _finish_run(self, write_status) -> None:
+        """steps run once the data is written: registration, DQC, watermark and reporting"""
         # this part can be handled by Airflow branching logic
         if write_status:
             logger.warning(f"Step 3: Create Presto table ...")
@@ -359,7 +417,8 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
         if write_status or not self._writer_strategy._reload:
             logger.warning(f"Step 4: Execute cross system DQC ...")
             if self.run_quality_check:
-                self.dqc()
+                with self.instrumentation.step("dqc"):
+                    self.dqc()
             else:
                 logger.warning(
                     f"Step 4: Skipping DQC since it's explicitly disabled in configs. "
@@ -369,14 +428,260 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
                 f"Step 4: Skipping DQC since a FULL_RELOAD on empty source occurred ... "
             )
 
+        # only reached when the DQC passed (or was not run), a failed DQC raises
+        if write_status:
+            self._commit_watermark()
+
         # pipeline reporting
         self._report_pipeline_run_meta()
         # TODO: potential steps in the future: in lakehouse DQC, with dbt
 
+    def _run_streaming(self):
+        """
+        micro-batch run: the extraction is planned as chunks (see `plan_extract_chunks`),
+        each chunk is extracted and appended on its own, and a checkpoint records the
+        written chunks, so a failed run resumes from the last one with the same plan.
+        The table is registered and checked once, after the last chunk.
+
+        Only INCREMENTAL runs can be streamed: their upserts make writing a chunk again
+        after a failure harmless. A checkpoint planned with other settings (see
+        `_plan_settings`) is planned again. A failed DQC keeps the checkpoint: the
+        written chunks stay in the table, and the next run writes again the chunk
+        reverted by a Delta rollback, if any, before checking the table again.
+        """
+        if self._etl_mode == models.ETLMode.FULL_RELOAD:
+            raise ValueError(
+                "Streaming runs append chunk by chunk and can't be used with FULL_RELOAD. "
+            )
+
+        fq_tbl_name = self._data_directory.fq_tbl_name
+        self._load_watermark()
+        plan_hash = plan_fingerprint(self._plan_settings())
+        checkpoint = self.checkpoint_store.get(fq_tbl_name)
+        written = False
+        if checkpoint is not None and checkpoint.plan_hash != plan_hash:
+            logger.warning(
+                f"The run started at {checkpoint.started_at} was planned with other settings, "
+                "planning the extraction again. "
+            )
+            # the chunks it wrote stay in the table
+            written = checkpoint.written
+            checkpoint = None
+
+        if checkpoint is None:
+            checkpoint = Checkpoint(
+                fq_tbl_name=fq_tbl_name,
+                plan=self.plan_extract_chunks(),
+                written=written,
+                plan_hash=plan_hash,
+            )
+            checkpoint.pending_watermark = self._pending_watermark_value
+            checkpoint.watermark_from_plan = self._pending_watermark_value is not None
+            self.checkpoint_store.put(checkpoint)
+        else:
+            # the watermark is only committed by a complete run, so the one loaded
+            # above is the one the checkpointed run started from
+            logger.warning(
+                f"Resuming the run started at {checkpoint.started_at}, "
+                f"{len(checkpoint.done)}/{len(checkpoint.plan)} chunks already written ..."
+            )
+            self._pending_watermark_value = checkpoint.pending_watermark
+
+        pending_chunks = checkpoint.pending_chunks()
+        for i, chunk_id in enumerate(pending_chunks, start=1):
+            logger.warning(
+                f"Step 1-2: Extracting and writing chunk {i}/{len(pending_chunks)} ({chunk_id}) ..."
+            )
+            with self.instrumentation.step("extract", chunk=chunk_id) as step:
+                df = self.extract_chunk(chunk_id)
+                if step.enabled:
+                    df = self._instrument_df(df, step)
+                if not checkpoint.watermark_from_plan:
+                    df = self._update_pending_watermark(df)
+            try:
+                with self.instrumentation.step("write", chunk=chunk_id) as step:
+                    write_status = self._writer_strategy.write(
+                        df=df, **self._writer_strategy_kwargs
+                    )
+                    step.set(written=bool(write_status))
+            finally:
+                self._release_df(df)
+            checkpoint.mark_done(
+                chunk_id, written=bool(write_status), pending_watermark=self._pending_watermark_value
+            )
+            self.checkpoint_store.put(checkpoint)
+
+        try:
+            self._finish_run(checkpoint.written)
+        except exc.DQCCheckFailureException:
+            if self._rolled_back_last_write:
+                chunk_id = checkpoint.undo_last_write()
+                logger.warning(f"Chunk {chunk_id} was rolled back, the next run writes it again. ")
+            self.checkpoint_store.put(checkpoint)
+            raise
+        self.checkpoint_store.delete(fq_tbl_name)
+
+    def _plan_settings(self) -> Dict[str, Any]:
+        """
+        the settings the chunks of a streaming run are planned from, a checkpoint
+        planned with other settings is not resumed
+        """
+        return {
+            "source_tbl_name": self.source_tbl_name,
+            "watermark_key": self.watermark_key,
+            "watermark": None if self._watermark is None else self._watermark.value,
+        }
+
+    def plan_extract_chunks(self) -> List[str]:
+        """
+        ids of the chunks of a streaming run, extracted one by one by `extract_chunk`.
+        Ids are stored in the checkpoint, so they should describe the chunk on their
+        own (e.g. a key range). Readers can plan chunks with `plan_chunks`, otherwise
+        the whole extraction is one chunk.
+        """
+        if not self.skip_extract and hasattr(self._reader_strategy, "plan_chunks"):
+            return list(self._reader_strategy.plan_chunks(**self._extractor_strategy_kwargs))
+        return [FULL_EXTRACT_CHUNK_ID]
+
+    def extract_chunk(self, chunk_id: str):
+        if chunk_id == FULL_EXTRACT_CHUNK_ID:
+            return self.extract()
+        return self._reader_strategy.extract_chunk(chunk_id, **self._extractor_strategy_kwargs)
+
+    @cached_property
+    def checkpoint_store(self):
+        return get_checkpoint_store(self.checkpoint_store_url)
+
+    @cached_property
+    def watermark_store(self):
+        return get_watermark_store(self.watermark_store_url)
+
+    def _load_watermark(self) -> None:
+        """
+        read the watermark of the previous successful run, and hand its value to
+        the reader as `watermark` so it only pulls the rows above it
+        """
+        if self.watermark_key is None:
+            return
+
+        self._pending_watermark_value = None
+        if self._etl_mode == models.ETLMode.FULL_RELOAD:
+            logger.warning("FULL_RELOAD ignores the stored watermark. ")
+            self._watermark = None
+            return
+
+        watermark = self.watermark_store.get(self._data_directory.fq_tbl_name)
+        if watermark is not None and watermark.key != self.watermark_key:
+            logger.warning(
+                f"Stored watermark is on `{watermark.key}` instead of `{self.watermark_key}`, ignoring it. "
+            )
+            watermark = None
+
+        self._watermark = watermark
+        if watermark is not None:
+            logger.warning(f"Extracting rows with {watermark.key} > {watermark.value}")
+            self._extractor_strategy_kwargs["watermark"] = watermark.value
+            self._extractor_strategy_kwargs["watermark_key"] = watermark.key
+
+    def _compute_pending_watermark(self, df):
+        """
+        the high-water mark of the extracted data, taken before writing so rows
+        arriving in the meantime are read again rather than skipped. Extractors that
+        know it already (e.g. from a min/max query) set it themselves.
+
+        Returns the dataframe to write: aggregating a lazy dataframe runs the
+        extraction, so it's persisted first and the write reads it from the cache
+        instead of querying the source again.
+        """
+        if self.watermark_key is None or self._pending_watermark_value is not None:
+            return df
+        df = self._persist_df(df)
+        self._pending_watermark_value = df.agg(
+            pyspark.sql.functions.max(self.watermark_key)
+        ).collect()[0][0]
+        return df
+
+    def _update_pending_watermark(self, df):
+        """
+        raise the pending watermark to the high-water mark of a chunk, returns the
+        persisted chunk to write (see `_compute_pending_watermark`)
+        """
+        if self.watermark_key is None:
+            return df
+        df = self._persist_df(df)
+        value = df.agg(pyspark.sql.functions.max(self.watermark_key)).collect()[0][0]
+        if value is not None and (
+            self._pending_watermark_value is None or value > self._pending_watermark_value
+        ):
+            self._pending_watermark_value = value
+        return df
+
+    @staticmethod
+    def _persist_df(df):
+        return df if df.is_cached else df.persist()
+
+    @staticmethod
+    def _release_df(df) -> None:
+        """drop the cached data of a dataframe persisted for the watermark or the instrumentation"""
+        if df is not None and df.is_cached:
+            df.unpersist()
+
+    def _commit_watermark(self) -> None:
+        if self.watermark_key is None or self._pending_watermark_value is None:
+            return
+        self.watermark_store.commit(
+            Watermark(
+                fq_tbl_name=self._data_directory.fq_tbl_name,
+                key=self.watermark_key,
+                value=self._pending_watermark_value,
+            ),
+            force=self._etl_mode == models.ETLMode.FULL_RELOAD,
+        )
+
     def create_lakehouse_table(self, drop_before_create: Optional[bool] = False):
-        self._register_lakehouse_table(drop_before_create)
-        self._grant_tbl_access()
-        self._repair_hive_table()
+        with self.instrumentation.step("create_lakehouse_table"):
+            try:
+                with self.instrumentation.step("register_lakehouse_table"):
+                    self._register_lakehouse_table(drop_before_create)
+                with self.instrumentation.step("grant_tbl_access"):
+                    self._grant_tbl_access()
+                with self.instrumentation.step("repair_hive_table"):
+                    self._repair_hive_table()
+            finally:
+                # the table was (re)created and repaired, even a failed attempt may have dropped it
+                catalog_cache.invalidate(self._data_directory.fq_tbl_name)
+
+    @cached_property
+    def instrumentation(self):
+        """
+        records the timings and resources of each step of the runs, disabled (and
+        close to free) unless sinks are set, see `get_instrumentation`
+        """
+        return get_instrumentation(
+            self.instrumentation_sinks,
+            tags={
+                "fq_tbl_name": self._data_directory.fq_tbl_name,
+                "source_name": self.source_name,
+                "etl_mode": self._etl_mode.name,
+                "data_format": self._data_format.name,
+            },
+        )
+
+    def _instrument_df(self, df, step):
+        """
+        set the size of an extracted dataframe on its step. Spark dataframes are lazy,
+        so the extraction mostly runs within the write, unless `instrumentation_count_rows`
+        persists and counts the dataframe to time the extraction on its own.
+        """
+        if self.instrumentation_count_rows:
+            df = df.persist()
+            step.set(rows=df.count())
+        try:
+            # the optimizer's estimate, computed without running any job
+            step.set(bytes=int(str(df._jdf.queryExecution().optimizedPlan().stats().sizeInBytes())))
+        except Exception:
+            logger.debug("Unable to estimate the size of the dataframe. ")
+        return df
 
     def dqc(self):
         """main entry point for executing DQC"""
@@ -404,6 +709,7 @@ class BaseConnector(mixins.TableNameAliasMixin, BaseDataLakehouseOperationManage
                     "One or more DQC checks failed. Restoring the previous data version in Delta Lake. "
                 )
                 self._writer_strategy.rollback()
+                self._rolled_back_last_write = True
 
             raise exc.DQCCheckFailureException()
 
@@ -479,6 +785,18 @@ class ThirdPartyConnector(BaseConnector, ABC):
     """
 
     is_cached: Optional[bool] = False
+    # seconds a cached API response is reused, None to keep it until evicted
+    cache_ttl: Optional[float] = 7 * 24 * 3600
+    # total size of the cached responses of the table, the oldest are evicted above it
+    cache_max_bytes: Optional[int] = 1024 ** 3
+
+    # concurrent extraction, see `extract_concurrently`
+    # requests per second allowed by the vendor, shared by its connectors, None for no limit
+    rate_limit_per_second: Optional[float] = None
+    rate_limit_burst: Optional[int] = None
+    max_concurrent_requests: Optional[int] = 8
+    max_request_retries: Optional[int] = 3
+    record_batch_size: Optional[int] = 10000
 
     def _init_data_directory(self) -> None:
         super()._init_data_directory()
@@ -491,6 +809,118 @@ class ThirdPartyConnector(BaseConnector, ABC):
             source_name=self.source_name if self.use_enriched_db_name else None,
         )
 
+    @cached_property
+    def response_cache(self) -> Optional[ResponseCache]:
+        """cache of the API responses under the CACHED layer of the table, None unless `is_cached`"""
+        if not self.is_cached:
+            return None
+        return ResponseCache.from_path(
+            self._cached_data_directory.s3_data_path,
+            ttl=self.cache_ttl,
+            max_bytes=self.cache_max_bytes,
+        )
+
+    def cached_request(
+        self,
+        endpoint: str,
+        fetch: Callable[[], List[Dict[str, Any]]],
+        params: Optional[Dict[str, Any]] = None,
+        window: Tuple[Optional[Any], Optional[Any]] = (None, None),
+    ) -> List[Dict[str, Any]]:
+        """
+        records of one API request, read from the response cache when it holds them.
+        Extractors should route every vendor call through here, so re-runs and
+        backfills don't spend the rate limit of the vendor again.
+
+        :param fetch: calls the API and returns the records of the response
+        :param window: start and end of the time window of the request
+        """
+        if self.response_cache is None:
+            return fetch()
+        return self.response_cache.get_or_fetch(endpoint, fetch, params=params, window=window)
+
+    def extract_concurrently(
+        self,
+        requests: Iterable[fetch_utils.ApiRequest],
+        fetch: Callable[[fetch_utils.ApiRequest], Any],
+        schema: Any = None,
+        retry_on: Tuple[type, ...] = fetch_utils.DEFAULT_RETRY_ON,
+    ):
+        """
+        fetch many API requests (e.g. one per symbol and day) concurrently, under the
+        rate limit of the vendor, and build a Spark dataframe of all their records
+
+        The records are streamed into Arrow record batches, and the dataframe is built
+        from them instead of a list of Python dicts. Responses go through the response
+        cache when `is_cached`.
+
+        :param fetch: returns the list of records of a request, a blocking function or
+                a coroutine function
+        :param schema: pyarrow schema of the records, inferred from all of them otherwise
+        """
+        rate_limiter = None
+        if self.rate_limit_per_second:
+            rate_limiter = fetch_utils.get_rate_limiter(
+                self.source_name, self.rate_limit_per_second, self.rate_limit_burst
+            )
+
+        engine = fetch_utils.AsyncFetchEngine(
+            fetch,
+            rate_limiter=rate_limiter,
+            max_concurrency=self.max_concurrent_requests,
+            max_retries=self.max_request_retries,
+            retry_on=retry_on,
+            cache=self.response_cache,
+        )
+        batches, report = fetch_utils.fetch_record_batches(
+            requests, engine, batch_size=self.record_batch_size, schema=schema
+        )
+        logger.warning(f"Concurrent extraction done, {report.summary()}")
+        return self._record_batches_to_df(batches, schema)
+
+    def _record_batches_to_df(self, batches: List[Any], schema: Any = None):
+        import pyarrow as pa
+
+        if batches:
+            table = pa.Table.from_batches(batches)
+            # the table holds the batches now, so the conversion below can free them
+            batches.clear()
+        elif schema is not None:
+            table = schema.empty_table()
+        else:
+            raise ValueError("No record was extracted and no schema was given to build the dataframe. ")
+
+        if int(self.spark_session.version.split(".")[0]) >= 4:
+            # Spark 4 builds the dataframe from the Arrow table itself
+            return self.spark_session.createDataFrame(table)
+
+        # older versions take a pandas frame, converted to Spark through Arrow column by
+        # column. The conf is set on the shared session, so it's restored afterwards, and
+        # the lock keeps concurrent connectors from restoring each other's value midway.
+        arrow_conf = "spark.sql.execution.arrow.pyspark.enabled"
+        with _ARROW_CONF_LOCK:
+            previous = self.spark_session.conf.get(arrow_conf, None)
+            self.spark_session.conf.set(arrow_conf, "true")
+            try:
+                # frees the Arrow buffers of each column once converted, so the records
+                # aren't held twice
+                return self.spark_session.createDataFrame(
+                    table.to_pandas(split_blocks=True, self_destruct=True)
+                )
+            finally:
+                if previous is None:
+                    self.spark_session.conf.unset(arrow_conf)
+                else:
+                    self.spark_session.conf.set(arrow_conf, previous)
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            if self.response_cache is not None:
+                self.response_cache.evict()
+                logger.info(f"Response cache stats: {self.response_cache.stats().to_dict()}")
+
 
 @dataclass
 class DatabaseConnector(BaseConnector, ABC):
@@ -500,6 +930,253 @@ class DatabaseConnector(BaseConnector, ABC):
     pagination_size: Optional[int] = 1000000
     fields_to_remove: Optional[List[str]] = field(default_factory=list)
 
+    # range partitioned extraction, reads ranges of the pagination key concurrently
+    parallel_extract: Optional[bool] = False
+    # `uniform` splits min..max evenly, `quantile` splits a sample of the keys for skewed keys,
+    # keys that can't be split evenly (e.g. strings) are always split on the quantiles
+    range_split_strategy: Optional[str] = partition_utils.UNIFORM
+    # defaults to the number of pages of `pagination_size` rows, capped by the connection cap
+    num_ranges: Optional[int] = None
+    # max connections opened on the source db, shared by the connectors of the process
+    max_source_connections: Optional[int] = 8
+    # `jdbc` reads through Spark's jdbc reader, `cursor` through a thread pool of db cursors
+    range_extract_engine: Optional[str] = "jdbc"
+    # the `cursor` engine holds every row in driver memory, it fails above this many rows
+    max_cursor_rows: Optional[int] = 1000000
+    quantile_sample_size: Optional[int] = 10000
+
     def __post_init__(self):
         super().__post_init__()
         self.source_db_url = get_db_url(self.source_name, self.db_name)
+
+    def extract(self):
+        """
+        with `parallel_extract`, ranges of the pagination key are read concurrently.
+        A reader strategy implementing `extract_ranges(predicates, **kwargs)` reads the
+        ranges itself. Otherwise they're read straight from the source table with
+        `range_extract_engine`, bypassing the reader strategy: only the range and
+        watermark predicates and `fields_to_remove` apply. Streaming chunks are read
+        the same way.
+        """
+        if self.parallel_extract and not self.skip_extract:
+            assert self.pagination_key is not None, (
+                "A pagination_key is required for the range partitioned extraction. "
+            )
+            return self._extract_range_partitioned()
+        return super().extract()
+
+    @cached_property
+    def _source_engine(self):
+        # the pool never grows past the connection cap
+        return sqlalchemy.create_engine(
+            self.source_db_url, pool_size=self.max_source_connections, max_overflow=0
+        )
+
+    @property
+    def _source_table(self) -> str:
+        return self.source_tbl_name or self.tbl_name
+
+    def plan_extract_chunks(self) -> List[str]:
+        """
+        with a pagination key, a streaming run reads one range of about
+        `pagination_size` rows per chunk, the chunk ids being the range predicates
+        """
+        if self.pagination_key is None or self.skip_extract:
+            return super().plan_extract_chunks()
+        predicates, _ = self._plan_range_predicates(cap_to_connections=False)
+        return predicates
+
+    def extract_chunk(self, chunk_id: str):
+        if chunk_id == FULL_EXTRACT_CHUNK_ID:
+            return super().extract_chunk(chunk_id)
+
+        df = self._read_ranges([chunk_id])
+        if self.fields_to_remove:
+            df = df.drop(*self.fields_to_remove)
+        return df
+
+    def _plan_settings(self) -> Dict[str, Any]:
+        return {
+            **super()._plan_settings(),
+            "pagination_key": self.pagination_key,
+            "pagination_size": self.pagination_size,
+            "range_split_strategy": self.range_split_strategy,
+            "num_ranges": self.num_ranges,
+        }
+
+    def _plan_range_predicates(self, cap_to_connections: bool = True) -> Tuple[List[str], List[Any]]:
+        lower, upper = self._get_key_range()
+        if lower is None:
+            logger.warning(f"Source table {self._source_table} is empty, reading it as a whole. ")
+            bounds = []
+        else:
+            num_ranges = self._get_num_ranges(lower, upper, cap_to_connections)
+            split_strategy = partition_utils.resolve_split_strategy(
+                self.range_split_strategy, lower, upper
+            )
+            if split_strategy == partition_utils.QUANTILE:
+                bounds = partition_utils.quantile_bounds(
+                    self._sample_keys(lower, upper), num_ranges
+                )
+            else:
+                bounds = partition_utils.uniform_bounds(lower, upper, num_ranges)
+
+        predicates = partition_utils.range_predicates(
+            self.pagination_key, bounds, where=self._watermark_predicate
+        )
+        return predicates, bounds
+
+    def _extract_range_partitioned(self):
+        predicates, bounds = self._plan_range_predicates()
+        logger.warning(
+            f"Extracting {self._source_table} in {len(predicates)} ranges of {self.pagination_key} "
+            f"({self.range_split_strategy}, {self.range_extract_engine}), at most "
+            f"{self.max_source_connections} concurrent connections ..."
+        )
+
+        df = self._read_ranges(predicates, bounds)
+        if self.fields_to_remove:
+            df = df.drop(*self.fields_to_remove)
+        return df
+
+    def _read_ranges(self, predicates: List[str], bounds: Optional[List[Any]] = None):
+        """
+        read the rows matching any of the range predicates, which already carry the
+        watermark predicate, see `extract` for the reader strategy
+        """
+        if hasattr(self._reader_strategy, "extract_ranges"):
+            return self._reader_strategy.extract_ranges(
+                predicates, **self._extractor_strategy_kwargs
+            )
+        if self.range_extract_engine == "cursor":
+            return self._extract_ranges_with_cursors(predicates)
+        return self._extract_ranges_with_jdbc(predicates, bounds or [])
+
+    @property
+    def _watermark_predicate(self) -> Optional[str]:
+        """
+        the rows above the stored watermark, on the watermark key whether or not the
+        ranges are split on it (e.g. paginated by id, incremental on updated_at)
+        """
+        if self._watermark is None:
+            return None
+        return partition_utils.watermark_predicate(self._watermark.key, self._watermark.value)
+
+    def _get_key_range(self) -> Tuple[Any, Any]:
+        where = f" WHERE {self._watermark_predicate}" if self._watermark_predicate else ""
+        with self._source_engine.connect() as conn:
+            lower, upper = conn.execute(
+                sqlalchemy.text(
+                    f"SELECT MIN({self.pagination_key}), MAX({self.pagination_key}) "
+                    f"FROM {self._source_table}{where}"
+                )
+            ).fetchone()
+
+        if self.watermark_key == self.pagination_key and upper is not None:
+            # rows above it, inserted during the extraction, are read again by the next run
+            self._pending_watermark_value = upper
+        return lower, upper
+
+    def _get_num_ranges(self, lower, upper, cap_to_connections: bool = True) -> int:
+        if self.num_ranges:
+            num_ranges = self.num_ranges
+        elif isinstance(lower, (int, float)) and isinstance(upper, (int, float)):
+            # assumes a dense key, e.g. an auto increment id
+            num_ranges = int((upper - lower) // self.pagination_size) + 1
+        else:
+            num_ranges = self.max_source_connections
+
+        if cap_to_connections and self.range_extract_engine != "cursor":
+            # every spark partition holds a connection while it reads, the
+            # partitions are the only way to bound them
+            num_ranges = min(num_ranges, self.max_source_connections)
+        return max(1, num_ranges)
+
+    def _sample_keys(self, lower, upper) -> List[Any]:
+        """
+        a random sample of the keys above the watermark, drawn by the database so
+        only the sample travels. The sampling rate assumes a dense key between lower
+        and upper.
+        """
+        dialect = self._source_engine.dialect.name
+        estimated_rows = (
+            upper - lower + 1 if isinstance(lower, int) and isinstance(upper, int) else None
+        )
+        fraction = (
+            1.0
+            if not estimated_rows
+            else min(1.0, self.quantile_sample_size / estimated_rows)
+        )
+
+        query = partition_utils.sample_keys_query(
+            dialect,
+            self._source_table,
+            self.pagination_key,
+            fraction,
+            where=self._watermark_predicate,
+        )
+        if query is None:
+            logger.warning(
+                f"Key sampling is not supported for {dialect}, splitting on the key range only. "
+            )
+            return [lower, upper]
+
+        with self._source_engine.connect() as conn:
+            return [row[0] for row in conn.execute(sqlalchemy.text(query))] + [lower, upper]
+
+    def _extract_ranges_with_jdbc(self, predicates: List[str], bounds: List[Any]):
+        jdbc_url, properties = partition_utils.sqlalchemy_url_to_jdbc(self.source_db_url)
+        properties["fetchsize"] = str(min(self.pagination_size, 100000))
+
+        # the watermark predicate is in every range predicate, the column partitioning would drop it
+        partitioning = partition_utils.jdbc_partitioning_options(
+            self.pagination_key,
+            bounds,
+            predicates,
+            split_strategy=self.range_split_strategy,
+            filtered=self._watermark_predicate is not None,
+        )
+        return self.spark_session.read.jdbc(
+            url=jdbc_url, table=self._source_table, properties=properties, **partitioning
+        )
+
+    def _extract_ranges_with_cursors(self, predicates: List[str]):
+        """
+        read the ranges through db cursors on the driver, then hand the rows to Spark.
+        Every row is held in driver memory, as python tuples and again while Spark
+        serializes them, so the read fails once it passes `max_cursor_rows` rows:
+        large tables should use the jdbc engine, which reads on the executors.
+        """
+        columns = self._reflect_source_columns()
+        convert = partition_utils.row_converter([type_name for _, type_name in columns])
+        budget = partition_utils.RowBudget(self.max_cursor_rows)
+
+        def fetch(predicate: str):
+            with self._source_engine.connect() as conn:
+                result = conn.execute(
+                    sqlalchemy.text(f"SELECT * FROM {self._source_table} WHERE {predicate}")
+                )
+                return partition_utils.fetch_rows(result, budget, convert)
+
+        partitions = partition_utils.fetch_partitions_concurrently(
+            fetch,
+            predicates,
+            max_connections=self.max_source_connections,
+            slots=partition_utils.get_connection_slots(
+                self.source_db_url, self.max_source_connections
+            ),
+        )
+        rows = [row for partition in partitions for row in partition]
+        # typed from the table rather than inferred from the rows, so empty ranges work
+        return self.spark_session.createDataFrame(
+            rows, schema=partition_utils.spark_schema_ddl(columns)
+        )
+
+    def _reflect_source_columns(self) -> List[Tuple[str, str]]:
+        """(name, Spark SQL type) of the columns of the source table, in table order"""
+        schema, _, table = self._source_table.rpartition(".")
+        reflected = sqlalchemy.inspect(self._source_engine).get_columns(table, schema=schema or None)
+        return [
+            (column["name"], partition_utils.spark_type_name(column["type"]))
+            for column in reflected
+        ]
@@ -1,174 +1,387 @@
-from dataclasses import dataclass
-from cached_property import cached_property
+import threading
+import weakref
+from dataclasses import dataclass, field
+from functools import lru_cache
 import xenpy.utils as utils
 from xenpy.s3 import dbfs_path, s3n_path
-import shadowtool.models as models
-from typing import Optional
+import xenpy.models as models
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DataDirectoryKey = Tuple[str, str, str, str, Optional[str], bool]
+
+
+@lru_cache(maxsize=None)
+def _s3_data_prefix(
+    functional_prefix: str, team: str, db_name: str, tbl_name: str, test_env: bool
+) -> str:
+    return utils.tbl_parts_to_s3_data_prefix(
+        db_name=db_name,
+        tbl_name=tbl_name,
+        functional_prefix=functional_prefix,
+        team=team,
+        test_env=test_env,
+    )
+
+
+@lru_cache(maxsize=None)
+def _tbl_name(functional_prefix: str, db_name: str, tbl_name: str, test_env: bool) -> str:
+    return utils.tbl_parts_to_tbl_name(
+        functional_prefix=functional_prefix,
+        db_name=db_name,
+        tbl_name=tbl_name,
+        test_env=test_env,
+    )
+
+
+@lru_cache(maxsize=None)
+def _normalise(name: str) -> str:
+    return utils.normalise_data_path_and_table(name)
+
+
+_dbfs_path = lru_cache(maxsize=None)(dbfs_path)
+_s3n_path = lru_cache(maxsize=None)(s3n_path)
+
+
+_interned = weakref.WeakValueDictionary()
+_interned_lock = threading.Lock()
+
+
+def clear_data_directory_cache() -> None:
+    """drop the interned directories and the shared path cache"""
+    with _interned_lock:
+        _interned.clear()
+    for cached_func in (_s3_data_prefix, _tbl_name, _normalise, _dbfs_path, _s3n_path):
+        cached_func.cache_clear()
 
 
-@dataclass
 class BaseDataDirectory:
     """
     a base model to provide direction for data
     paths and tbl identifiers and object location
+
+    Directories are immutable and interned, building a directory with the same
+    (functional prefix, team, db, tbl, source, test env) returns the same object.
+    Derived paths and names are computed once per process in a shared cache, so
+    the directories of the different layers of a table reuse each other's paths.
     """
 
+    _FIELDS = (
+        "functional_prefix",
+        "team",
+        "db_name",
+        "tbl_name",
+        "source_name",
+        "test_env",
+    )
+    __slots__ = _FIELDS + ("__weakref__",)
+
     # this tbl name should be the final tbl name, aliasing is done out side of
     # data directory entry
-    data_layer: models.Data
+    functional_prefix: str
     tbl_name: str
     db_name: str
     team: str
-    source_name: Optional[str] = None
+    source_name: Optional[str]
+    test_env: bool
 
-    @cached_property
-    def fq_tbl_name(self):
+    def __new__(
+        cls,
+        functional_prefix: str,
+        team: str,
+        db_name: str,
+        tbl_name: str,
+        source_name: Optional[str] = None,
+        test_env: bool = False,
+    ):
+        key = (cls, functional_prefix, team, db_name, tbl_name, source_name, test_env)
+        instance = _interned.get(key)
+        if instance is not None:
+            return instance
+
+        with _interned_lock:
+            instance = _interned.get(key)
+            if instance is None:
+                instance = super().__new__(cls)
+                for name, value in zip(cls._FIELDS, key[1:]):
+                    object.__setattr__(instance, name, value)
+                _interned[key] = instance
+        return instance
 
-        return utils.tbl_parts_to_tbl_name(
-            functional_prefix=self.functional_prefix,
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            test_env=self.test_env,
+    @property
+    def key(self) -> DataDirectoryKey:
+        return (
+            self.functional_prefix,
+            self.team,
+            self.db_name,
+            self.tbl_name,
+            self.source_name,
+            self.test_env,
         )
 
-    @cached_property
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash((type(self), self.key))
+
+    def __reduce__(self):
+        # unpickled directories are interned as well
+        return type(self), self.key
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={value!r}" for name, value in zip(self._FIELDS, self.key)
+        )
+        return f"{type(self).__name__}({fields})"
+
+    @property
+    def path_db_name(self) -> str:
+        """db name used in paths and tbl names, enriched when the source is known"""
+        return self.enriched_db_name if self.source_name is not None else self.db_name
+
+    @property
+    def fq_tbl_name(self):
+        return _tbl_name(
+            self.functional_prefix, self.path_db_name, self.tbl_name, self.test_env
+        )
+
+    @property
     def enriched_db_name(self):
         """
         to further enhance the uniqueness of the db name, source name will be used as well
         """
-        return utils.normalise_data_path_and_table(f"{self.source_name}_{self.db_name}")
+        return _normalise(f"{self.source_name}_{self.db_name}")
 
-    @cached_property
+    @property
     def normalised_db_name(self):
-        return utils.normalise_data_path_and_table(self.db_name)
+        return _normalise(self.db_name)
 
-    @cached_property
+    @property
     def normalised_fq_tbl_name(self):
-        return utils.normalise_data_path_and_table(self.fq_tbl_name).replace(".", "_")
+        return _normalise(self.fq_tbl_name).replace(".", "_")
 
-    @cached_property
+    @property
     def full_db_name(self):
         db_name, _ = utils.get_parts_from_tbl_name(self.fq_tbl_name)
         return db_name
 
+    def _s3_data_path_of(self, functional_prefix: str) -> str:
+        return _s3_data_prefix(
+            functional_prefix, self.team, self.path_db_name, self.tbl_name, self.test_env
+        )
+
 
-@dataclass
 class StandardDataDirectory(BaseDataDirectory):
     """directory for transform tables"""
 
-    @cached_property
+    __slots__ = ()
+
+    @property
     def s3_data_path(self):
-        return utils.tbl_parts_to_s3_data_prefix(
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            functional_prefix=self.functional_prefix,
-            team=self.team,
-            test_env=self.test_env,
-        )
+        return self._s3_data_path_of(self.functional_prefix)
 
-    @cached_property
+    @property
     def dbfs_s3_data_path(self):
-        return dbfs_path(self.s3_data_path)
+        return _dbfs_path(self.s3_data_path)
 
-    @cached_property
+    @property
     def s3n_s3_data_path(self):
-        return s3n_path(self.s3_data_path)
+        return _s3n_path(self.s3_data_path)
 
 
 class ReplicationDataDirectory(StandardDataDirectory):
     """directory for clean and raw tables"""
 
-    @cached_property
-    def s3_data_path(self):
-        return utils.tbl_parts_to_s3_data_prefix(
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            functional_prefix=self.functional_prefix,
-            team=self.team,
-            test_env=self.test_env,
-        )
+    __slots__ = ()
 
-    @cached_property
+    @property
     def clean_s3_data_path(self):
-        return utils.tbl_parts_to_s3_data_prefix(
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            functional_prefix=self.functional_prefix,
-            team=self.team,
-            test_env=self.test_env,
-        )
+        return self._s3_data_path_of(self.functional_prefix)
 
-    @cached_property
+    @property
     def raw_s3_data_path(self):
-        return utils.tbl_parts_to_s3_data_prefix(
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            functional_prefix=models.DataLayer.RAW.to_s3_path_value(),
-            team=self.team,
-            test_env=self.test_env,
-        )
+        return self._s3_data_path_of(models.DataLayer.RAW.to_s3_path_value())
 
-    @cached_property
+    @property
     def cached_s3_data_path(self):
-        return utils.tbl_parts_to_s3_data_prefix(
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            functional_prefix=models.DataLayer.CACHED.to_s3_path_value(),
-            team=self.team,
-            test_env=self.test_env,
-        )
+        return self._s3_data_path_of(models.DataLayer.CACHED.to_s3_path_value())
 
-    @cached_property
+    @property
     def dbfs_s3_data_path(self):
-        return dbfs_path(self.clean_s3_data_path)
+        return _dbfs_path(self.clean_s3_data_path)
 
-    @cached_property
+    @property
     def dbfs_clean_s3_data_path(self):
-        return dbfs_path(self.clean_s3_data_path)
+        return _dbfs_path(self.clean_s3_data_path)
 
-    @cached_property
+    @property
     def dbfs_raw_s3_data_path(self):
-        return dbfs_path(self.raw_s3_data_path)
+        return _dbfs_path(self.raw_s3_data_path)
 
-    @cached_property
+    @property
     def dbfs_cached_s3_data_path(self):
-        return dbfs_path(self.cached_s3_data_path)
+        return _dbfs_path(self.cached_s3_data_path)
 
-    @cached_property
+    @property
     def s3n_s3_data_path(self):
-        return s3n_path(self.clean_s3_data_path)
+        return _s3n_path(self.clean_s3_data_path)
 
-    @cached_property
+    @property
     def s3n_clean_s3_data_path(self):
-        return s3n_path(self.clean_s3_data_path)
+        return _s3n_path(self.clean_s3_data_path)
 
-    @cached_property
+    @property
     def s3n_raw_s3_data_path(self):
-        return s3n_path(self.raw_s3_data_path)
+        return _s3n_path(self.raw_s3_data_path)
 
-    @cached_property
+    @property
     def s3n_cached_s3_data_path(self):
-        return s3n_path(self.cached_s3_data_path)
+        return _s3n_path(self.cached_s3_data_path)
 
-    @cached_property
+    @property
     def raw_fq_tbl_name(self):
-        return utils.tbl_parts_to_tbl_name(
-            functional_prefix=models.DataLayer.RAW.to_s3_path_value(),
-            db_name=self.enriched_db_name
-            if self.source_name is not None
-            else self.db_name,
-            tbl_name=self.tbl_name,
-            test_env=self.test_env,
+        return _tbl_name(
+            models.DataLayer.RAW.to_s3_path_value(),
+            self.path_db_name,
+            self.tbl_name,
+            self.test_env,
+        )
+
+
+DEFAULT_PLAN_LAYERS = ("CLEAN", "RAW", "CACHED")
+
+
+@dataclass
+class DataDirectoryPlan:
+    """
+    resolved paths and tbl names of many tables, stored column by column
+
+    Each column is a list with one value per table, in the order of the planned tasks.
+    Per layer columns are prefixed with the lower case layer name, e.g.
+    `raw_s3_data_path` or `clean_fq_tbl_name`.
+    """
+
+    columns: Dict[str, List[Any]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.columns.get("source_name", []))
+
+    def __getitem__(self, column: str) -> List[Any]:
+        return self.columns[column]
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        names = self.column_names
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+    def to_pandas(self):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError(
+                "pandas is required to convert the plan, install shadowtool[pandas]"
+            ) from e
+        return pd.DataFrame(self.columns)
+
+    def to_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError(
+                "pyarrow is required to convert the plan, install shadowtool[parquet]"
+            ) from e
+        return pa.table(self.columns)
+
+
+def plan_data_directories(
+    tasks: Iterable[Any],
+    registra_manager: Any = None,
+    team: str = "default",
+    use_enriched_db_name: bool = False,
+    test_env: bool = False,
+    layers: Sequence[str] = DEFAULT_PLAN_LAYERS,
+    output: str = "columns",
+):
+    """
+    resolve the paths and tbl names of every layer for many tables at once, e.g. all
+    the tasks returned by `RegistraManager.get_all_available_registra_tasks`
+
+    The team and tbl name alias of each table come from its registra, like the
+    connectors do. No directory object is built, the values are computed in a
+    single pass through the shared path cache, so tables sharing inputs share work.
+
+    :param output: `columns` for a `DataDirectoryPlan`, `pandas` for a DataFrame or
+            `arrow` for a pyarrow Table
+    """
+    if output not in ("columns", "pandas", "arrow"):
+        raise ValueError(f"Unknown output `{output}`, expected columns, pandas or arrow")
+
+    if registra_manager is None:
+        from shadowtool.main.registra.manager import RegistraManager
+
+        registra_manager = RegistraManager
+
+    layer_prefixes = [
+        (layer.lower(), models.DataLayer[layer.upper()].to_s3_path_value())
+        for layer in layers
+    ]
+
+    columns: Dict[str, List[Any]] = {
+        name: []
+        for name in ("source_name", "db_name", "tbl_name", "final_tbl_name", "team", "path_db_name")
+    }
+    for layer, _ in layer_prefixes:
+        for suffix in ("fq_tbl_name", "s3_data_path", "dbfs_s3_data_path", "s3n_s3_data_path"):
+            columns[f"{layer}_{suffix}"] = []
+
+    registra_index = registra_manager.registra_index
+    for task in tasks:
+        tbl_registra = registra_index.get_table(task.source_name, task.db_name, task.tbl_name)
+        tbl_team = (tbl_registra.team if tbl_registra is not None else None) or team
+        final_tbl_name = (
+            tbl_registra.tbl_name_alias if tbl_registra is not None else None
+        ) or task.tbl_name
+        path_db_name = (
+            _normalise(f"{task.source_name}_{task.db_name}")
+            if use_enriched_db_name
+            else task.db_name
         )
+
+        columns["source_name"].append(task.source_name)
+        columns["db_name"].append(task.db_name)
+        columns["tbl_name"].append(task.tbl_name)
+        columns["final_tbl_name"].append(final_tbl_name)
+        columns["team"].append(tbl_team)
+        columns["path_db_name"].append(path_db_name)
+
+        for layer, functional_prefix in layer_prefixes:
+            s3_data_path = _s3_data_prefix(
+                functional_prefix, tbl_team, path_db_name, final_tbl_name, test_env
+            )
+            columns[f"{layer}_fq_tbl_name"].append(
+                _tbl_name(functional_prefix, path_db_name, final_tbl_name, test_env)
+            )
+            columns[f"{layer}_s3_data_path"].append(s3_data_path)
+            columns[f"{layer}_dbfs_s3_data_path"].append(_dbfs_path(s3_data_path))
+            columns[f"{layer}_s3n_s3_data_path"].append(_s3n_path(s3_data_path))
+
+    plan = DataDirectoryPlan(columns=columns)
+    if output == "pandas":
+        return plan.to_pandas()
+    if output == "arrow":
+        return plan.to_arrow()
+    return plan
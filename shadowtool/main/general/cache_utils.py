@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# returned by `get` on a miss, so `None` can be cached as a value
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class TTLCache:
+    """
+    thread-safe in-memory cache, entries expire after `ttl` seconds and the least
+    recently used entry is evicted once `max_size` is reached
+
+    :param ttl: seconds an entry is kept, `None` to keep entries until evicted
+    :param max_size: max number of entries
+    :param timer: monotonic clock, can be replaced in tests
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = 300,
+        max_size: int = 128,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        assert max_size > 0, "Cache max_size needs to be a positive integer. "
+        self.ttl = ttl
+        self.max_size = max_size
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = CacheStats()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._timer():
+                del self._data[key]
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = MISSING) -> None:
+        """store the value, `ttl` overrides the cache level ttl for this entry"""
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires_at = None if ttl is None else self._timer() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            self._stats.size = len(self._data)
+            return CacheStats(**asdict(self._stats))
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > self._timer())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class EncryptedFileCache:
+    """
+    a small key value cache persisted as one encrypted JSON file, meant to share
+    values between short-lived processes on the same machine
+
+    Requires the `cryptography` package, installed with the `secure-cache` extra.
+    The encryption key is derived from the given passphrase. Values need to be
+    JSON serialisable.
+    """
+
+    def __init__(self, path: str, passphrase: str, ttl: float = 300):
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise ImportError(
+                "The on-disk encrypted cache requires `cryptography`. "
+                "Install it with `pip install shadowtool[secure-cache]`. "
+            )
+        assert passphrase, "A passphrase is required for the encrypted file cache. "
+
+        key = base64.urlsafe_b64encode(hashlib.sha256(passphrase.encode()).digest())
+        self._fernet = Fernet(key)
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._read().get(key)
+            if entry is None or entry["expires_at"] <= time.time():
+                self._stats.misses += 1
+                return default
+            self._stats.hits += 1
+            return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            now = time.time()
+            data = {k: v for k, v in self._read().items() if v["expires_at"] > now}
+            data[key] = {"value": value, "expires_at": now + self.ttl}
+            self._write(data)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            self._stats.size = len(self._read())
+            return CacheStats(**asdict(self._stats))
+
+    def _read(self) -> Dict[str, Any]:
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(self._fernet.decrypt(f.read()))
+        except (FileNotFoundError, InvalidToken, ValueError):
+            # a missing, corrupted or foreign file is treated as an empty cache
+            return {}
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # write then rename, so a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            os.chmod(tmp_path, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._fernet.encrypt(json.dumps(data).encode()))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
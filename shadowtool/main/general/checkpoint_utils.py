@@ -0,0 +1,219 @@
+"""
+Checkpoints of chunked (micro-batch) runs.
+
+A streaming run plans its extraction as a list of chunk ids (e.g. key ranges), then
+extracts and writes the chunks one at a time. The checkpoint keeps the plan and the
+chunks already written, so a failed run resumes from the last written chunk with the
+same plan, as long as the settings the plan was made from are unchanged (see
+`plan_fingerprint`). Checkpoints are kept per table, in a local folder or on s3, and
+dropped once the run completes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import shadowtool.config as config
+import shadowtool.constants as constants
+from shadowtool.main.general.logging_utils import LoggingMixin
+from shadowtool.main.general.watermark_utils import (
+    decode_watermark_value,
+    encode_watermark_value,
+)
+
+
+@dataclass
+class Checkpoint:
+
+    fq_tbl_name: str
+    plan: List[str]
+    done: List[str] = field(default_factory=list)
+    # whether any written chunk persisted data, i.e. the table needs registering
+    written: bool = False
+    # the done chunks which persisted data, in write order
+    written_chunks: List[str] = field(default_factory=list)
+    # `plan_fingerprint` of the settings the plan was made from
+    plan_hash: Optional[str] = None
+    # high-water mark of the chunks extracted so far
+    pending_watermark: Any = None
+    # whether the pending watermark came from the plan (e.g. a min/max query), so the
+    # chunks don't need to be aggregated for it
+    watermark_from_plan: bool = False
+    started_at: datetime = field(default_factory=lambda: datetime.utcnow().replace(microsecond=0))
+
+    def pending_chunks(self) -> List[str]:
+        done = set(self.done)
+        return [chunk_id for chunk_id in self.plan if chunk_id not in done]
+
+    def mark_done(self, chunk_id: str, written: bool, pending_watermark: Any = None) -> None:
+        self.done.append(chunk_id)
+        if written:
+            self.written = True
+            self.written_chunks.append(chunk_id)
+        if pending_watermark is not None:
+            self.pending_watermark = pending_watermark
+
+    def undo_last_write(self) -> Optional[str]:
+        """
+        mark the last chunk which persisted data as pending again, e.g. once its write
+        was rolled back
+
+        :return: the chunk id, None when no chunk persisted data
+        """
+        if not self.written_chunks:
+            return None
+        chunk_id = self.written_chunks.pop()
+        self.done.remove(chunk_id)
+        return chunk_id
+
+    @property
+    def is_complete(self) -> bool:
+        return not self.pending_chunks()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fq_tbl_name": self.fq_tbl_name,
+            "plan": self.plan,
+            "done": self.done,
+            "written": self.written,
+            "written_chunks": self.written_chunks,
+            "plan_hash": self.plan_hash,
+            "pending_watermark": None
+            if self.pending_watermark is None
+            else encode_watermark_value(self.pending_watermark),
+            "watermark_from_plan": self.watermark_from_plan,
+            "started_at": self.started_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "Checkpoint":
+        return cls(
+            fq_tbl_name=raw["fq_tbl_name"],
+            plan=raw["plan"],
+            done=raw["done"],
+            written=raw["written"],
+            written_chunks=raw.get("written_chunks", []),
+            plan_hash=raw.get("plan_hash"),
+            pending_watermark=None
+            if raw["pending_watermark"] is None
+            else decode_watermark_value(raw["pending_watermark"]),
+            watermark_from_plan=raw.get("watermark_from_plan", False),
+            started_at=datetime.fromisoformat(raw["started_at"]),
+        )
+
+
+def plan_fingerprint(settings: Dict[str, Any]) -> str:
+    """
+    sha256 of the settings a chunk plan is made from (e.g. key, chunk size, starting
+    watermark), a checkpoint whose fingerprint differs is planned again
+    """
+    canonical = json.dumps(settings, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class BaseCheckpointStore(LoggingMixin, ABC):
+    """keeps the checkpoint of the ongoing run of each table"""
+
+    def get(self, fq_tbl_name: str) -> Optional[Checkpoint]:
+        data = self._read(self._key(fq_tbl_name))
+        return None if data is None else Checkpoint.from_dict(json.loads(data))
+
+    def put(self, checkpoint: Checkpoint) -> None:
+        self._write(
+            self._key(checkpoint.fq_tbl_name),
+            json.dumps(checkpoint.to_dict(), indent=2, sort_keys=True).encode("utf-8"),
+        )
+
+    def delete(self, fq_tbl_name: str) -> None:
+        self._delete(self._key(fq_tbl_name))
+
+    @staticmethod
+    def _key(fq_tbl_name: str) -> str:
+        return f"{fq_tbl_name}.json"
+
+    @abstractmethod
+    def _read(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def _write(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _delete(self, key: str) -> None:
+        ...
+
+
+class LocalCheckpointStore(BaseCheckpointStore):
+    """one JSON file per table in a local folder, for single machine deployments and tests"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.root, key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.root, key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _delete(self, key: str) -> None:
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3CheckpointStore(BaseCheckpointStore):
+    """one JSON object per table under a s3 prefix, shared by every cluster running the pipelines"""
+
+    def __init__(self, s3_hook: Any, prefix: str):
+        self.s3_hook = s3_hook
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _read(self, key: str) -> Optional[bytes]:
+        return self.s3_hook.read_file(self.prefix + key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        self.s3_hook.create_file(self.prefix + key, data)
+
+    def _delete(self, key: str) -> None:
+        self.s3_hook.delete_file(target_key=self.prefix + key)
+
+
+def get_checkpoint_store(url: Optional[str] = None) -> BaseCheckpointStore:
+    """
+    the store configured by `url`, defaulting to the ST__CHECKPOINT_STORE_URL env var:
+    `s3://bucket/prefix` for s3, a folder path or `file://` url for a local folder.
+    Without any, checkpoints are kept in the shadowtool temp folder.
+    """
+    url = url or os.getenv(config.ST__CHECKPOINT_STORE_URL)
+    if not url:
+        return LocalCheckpointStore(os.path.join(constants.TEMP_FOLDER_DIRECTORY, "checkpoints"))
+
+    parsed = urlparse(url)
+    if parsed.scheme in ("s3", "s3a", "s3n"):
+        from shadowtool.main.vendors.aws import S3Hook
+
+        return S3CheckpointStore(S3Hook(bucket_name=parsed.netloc), parsed.path)
+    if parsed.scheme == "file":
+        return LocalCheckpointStore(parsed.path)
+    if parsed.scheme == "":
+        return LocalCheckpointStore(url)
+    raise ValueError(f"Unsupported checkpoint store url scheme `{parsed.scheme}`")
@@ -0,0 +1,408 @@
+"""
+Concurrent, rate limited fetching of API requests.
+
+Requests are fetched by an asyncio engine with bounded concurrency, under a token bucket
+shared by every connector of the same vendor, and retried with jittered exponential
+backoff. The records are streamed into Arrow record batches of a fixed size, so the
+responses are never held as one big list of Python dicts.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+import shadowtool.exceptions as exc
+from shadowtool.main.general.logging_utils import LoggingMixin
+from shadowtool.main.general.retry_utils import exponential_backoff
+
+DEFAULT_RETRY_ON: Tuple[Type[BaseException], ...] = (OSError, asyncio.TimeoutError)
+
+
+class TokenBucket:
+    """
+    thread-safe token bucket, refilled at `rate` tokens per second up to `capacity`,
+    usable from threads and event loops alike
+
+    :param rate: tokens added per second
+    :param capacity: max tokens kept, i.e. the allowed burst, defaults to `rate`
+    :param clock: monotonic clock, can be replaced in tests
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert rate > 0, "rate needs to be positive. "
+        self.rate = rate
+        self.capacity = max(1.0, capacity if capacity is not None else rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        take the tokens if available
+
+        :return: 0 when taken, otherwise the seconds to wait before trying again
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+_rate_limiters: Dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(vendor: str, rate: float, capacity: Optional[float] = None) -> TokenBucket:
+    """
+    the token bucket shared by every connector of a vendor in the process, created
+    with the given rate on first use, so concurrent connectors stay under one quota
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(vendor)
+        if limiter is None:
+            limiter = _rate_limiters[vendor] = TokenBucket(rate, capacity)
+        return limiter
+
+
+@dataclass
+class ApiRequest:
+    """a single call of an API, the unit fetched, retried and cached"""
+
+    endpoint: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    # start and end of the time window of the request
+    window: Tuple[Optional[Any], Optional[Any]] = (None, None)
+
+    def __str__(self) -> str:
+        return f"{self.endpoint} {self.params} {self.window}"
+
+
+@dataclass
+class FetchReport:
+
+    requests: int = 0
+    cache_hits: int = 0
+    fetched: int = 0
+    retries: int = 0
+    records: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests: {self.fetched} fetched, {self.cache_hits} from cache, "
+            f"{len(self.failed)} failed, {self.retries} retries, {self.records} records"
+        )
+
+
+class _WorkerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class AsyncFetchEngine(LoggingMixin):
+    """
+    fetch many API requests concurrently
+
+    `fetch` takes an `ApiRequest` and returns the list of records of its response. It
+    can be a coroutine function, or a blocking function (e.g. a vendor SDK call) run
+    in a thread pool of `max_concurrency` threads.
+
+    :param rate_limiter: token bucket taken once per fetch attempt, see `get_rate_limiter`
+    :param max_concurrency: max requests in flight
+    :param max_retries: retries of a request failing with one of `retry_on`, before
+            it's reported as failed
+    :param retry_on: errors worth retrying, anything else is raised straight away
+    :param cache: a response cache with `get(endpoint, params, window)` and
+            `put(endpoint, records, params, window)`, e.g. a `ResponseCache`. Cache hits
+            don't take any token.
+
+    `report` holds the counters of the latest `iter_responses` call, each call
+    starting a new one.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[ApiRequest], Any],
+        rate_limiter: Optional[TokenBucket] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        retry_on: Tuple[Type[BaseException], ...] = DEFAULT_RETRY_ON,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        cache: Any = None,
+    ):
+        assert max_concurrency > 0, "max_concurrency needs to be a positive integer. "
+        self.fetch = fetch
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_on = retry_on
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cache = cache
+        self.report = FetchReport()
+
+    async def iter_responses(
+        self, requests: Iterable[ApiRequest]
+    ) -> AsyncIterator[Tuple[ApiRequest, List[Dict[str, Any]]]]:
+        """
+        yield the (request, records) of every successful request, in completion order.
+        Requests are pulled lazily and at most a few responses wait to be consumed, so
+        memory stays bounded whatever the number of requests.
+        """
+        report = self.report = FetchReport()
+        request_iterator = iter(requests)
+        responses: asyncio.Queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+        worker_done = object()
+        loop = asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="api-fetch"
+        ) as executor:
+
+            async def worker() -> None:
+                try:
+                    for request in request_iterator:
+                        report.requests += 1
+                        records = await self._fetch_with_retry(request, loop, executor, report)
+                        if records is not None:
+                            await responses.put((request, records))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await responses.put(_WorkerError(e))
+                await responses.put(worker_done)
+
+            workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+            running = len(workers)
+            try:
+                while running:
+                    item = await responses.get()
+                    if item is worker_done:
+                        running -= 1
+                    elif isinstance(item, _WorkerError):
+                        raise item.error
+                    else:
+                        report.records += len(item[1])
+                        yield item
+            finally:
+                for w in workers:
+                    w.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _fetch_with_retry(
+        self,
+        request: ApiRequest,
+        loop: asyncio.AbstractEventLoop,
+        executor: ThreadPoolExecutor,
+        report: FetchReport,
+    ) -> Optional[List[Dict[str, Any]]]:
+        if self.cache is not None:
+            cached = await loop.run_in_executor(
+                executor, self.cache.get, request.endpoint, request.params, request.window
+            )
+            if cached is not None:
+                report.cache_hits += 1
+                return cached
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            try:
+                if asyncio.iscoroutinefunction(self.fetch):
+                    records = await self.fetch(request)
+                else:
+                    records = await loop.run_in_executor(executor, self.fetch, request)
+                break
+            except self.retry_on as e:
+                if attempt >= self.max_retries:
+                    self.log.error(f"Giving up on {request} after {attempt + 1} attempts: {e!r}")
+                    report.failed[str(request)] = repr(e)
+                    return None
+                report.retries += 1
+                await asyncio.sleep(exponential_backoff(attempt, self.base_delay, self.max_delay))
+                attempt += 1
+
+        report.fetched += 1
+        if self.cache is not None:
+            await loop.run_in_executor(
+                executor,
+                lambda: self.cache.put(request.endpoint, records, request.params, request.window),
+            )
+        return records
+
+
+class RecordBatchBuilder(LoggingMixin):
+    """
+    accumulate records (dicts) into Arrow record batches of `batch_size` rows
+
+    Without a schema, each batch is inferred from its records and the schemas are
+    unified as they come: keys first seen in a later batch are appended as new
+    columns, null in the earlier batches, and columns whose type was unknown (only
+    nulls) or integer take the later type, e.g. double. With a schema, keys missing
+    from it are dropped with a warning. Missing keys become nulls.
+
+    :param schema: pyarrow schema of the batches
+    """
+
+    def __init__(self, batch_size: int = 10000, schema: Any = None):
+        assert batch_size > 0, "batch_size needs to be a positive integer. "
+        self.batch_size = batch_size
+        self.schema = schema
+        self.batches: List[Any] = []
+        self._pending: List[Dict[str, Any]] = []
+        self._infer_schema = schema is None
+        self._dropped_keys: set = set()
+
+    def add(self, records: Iterable[Dict[str, Any]]) -> None:
+        self._pending.extend(records)
+        while len(self._pending) >= self.batch_size:
+            chunk = self._pending[: self.batch_size]
+            self._pending = self._pending[self.batch_size:]
+            self.batches.append(self._to_batch(chunk))
+
+    def flush(self) -> List[Any]:
+        """:return: all the batches built, of the same schema"""
+        if self._pending:
+            self.batches.append(self._to_batch(self._pending))
+            self._pending = []
+        if self._infer_schema:
+            self.batches = [self._conform(batch) for batch in self.batches]
+        return self.batches
+
+    def _to_batch(self, records: List[Dict[str, Any]]):
+        pa = _import_pyarrow()
+        if self._infer_schema:
+            names = list(dict.fromkeys(key for record in records for key in record))
+            arrays = [pa.array([record.get(name) for record in records]) for name in names]
+            batch = pa.RecordBatch.from_arrays(arrays, names=names)
+            self.schema = batch.schema if self.schema is None else self._unify(batch.schema)
+            return batch
+
+        unknown_keys = {key for record in records for key in record}
+        unknown_keys.difference_update(self.schema.names, self._dropped_keys)
+        if unknown_keys:
+            self.log.warning(f"Dropping the keys missing from the schema: {sorted(unknown_keys)}")
+            self._dropped_keys.update(unknown_keys)
+
+        arrays = [
+            pa.array([record.get(f.name) for record in records], type=f.type)
+            for f in self.schema
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def _unify(self, schema: Any):
+        """the schema so far, widened with the columns and types of a new batch"""
+        pa = _import_pyarrow()
+        fields = {f.name: f for f in self.schema}
+        for f in schema:
+            current = fields.get(f.name)
+            if current is None:
+                fields[f.name] = f
+            elif current.type != f.type and (
+                pa.types.is_null(current.type)
+                or (pa.types.is_integer(current.type) and pa.types.is_floating(f.type))
+            ):
+                fields[f.name] = f
+        return pa.schema(list(fields.values()))
+
+    def _conform(self, batch: Any):
+        """a batch with every column of the unified schema, cast to its type"""
+        pa = _import_pyarrow()
+        arrays = []
+        for f in self.schema:
+            index = batch.schema.get_field_index(f.name)
+            if index < 0:
+                arrays.append(pa.nulls(batch.num_rows, type=f.type))
+            else:
+                column = batch.column(index)
+                arrays.append(column if column.type == f.type else column.cast(f.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required to build record batches, install shadowtool[parquet]"
+        ) from e
+    return pa
+
+
+def run_coroutine(coroutine) -> Any:
+    """
+    run a coroutine to completion from blocking code, in a thread of its own when
+    an event loop is already running (e.g. in a notebook)
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def fetch_record_batches(
+    requests: Iterable[ApiRequest],
+    engine: AsyncFetchEngine,
+    batch_size: int = 10000,
+    schema: Any = None,
+    raise_on_failure: bool = True,
+) -> Tuple[List[Any], FetchReport]:
+    """
+    fetch every request with the engine, streaming the records into Arrow record batches
+
+    :param raise_on_failure: raise `ApiFetchFailure` when any request failed for good,
+            once all the others are fetched
+    :return: the record batches and the report of the fetch
+    """
+    builder = RecordBatchBuilder(batch_size=batch_size, schema=schema)
+
+    async def consume() -> None:
+        async for _, records in engine.iter_responses(requests):
+            builder.add(records)
+
+    run_coroutine(consume())
+    batches = builder.flush()
+    engine.log.info(f"Fetch done, {engine.report.summary()}")
+    if raise_on_failure and engine.report.failed:
+        raise exc.ApiFetchFailure(engine.report)
+    return batches, engine.report
@@ -7,3 +7,7 @@ def is_file_image(file_path: str) -> bool:
         return True
     except IOError:
         return False
+
+
+def is_yaml_file(file_path: str) -> bool:
+    return file_path.endswith((".yaml", ".yml"))
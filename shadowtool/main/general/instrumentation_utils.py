@@ -0,0 +1,373 @@
+"""
+Per-step timing and resource records of pipeline runs.
+
+Each step of a run (and its sub-steps) records its wall time, the CPU time of the
+process, the rows and bytes it handled when known, and the memory high-water mark of
+the process. Once the run is over, its steps are emitted as one run record to every
+sink: a JSON lines file, the logs or a StatsD (DogStatsD) agent over UDP.
+
+Without any sink, `get_instrumentation` returns a disabled instrumentation whose steps
+are a shared no-op, so instrumented code pays a method call per step.
+"""
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import shadowtool.config as config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_memory_bytes() -> Optional[int]:
+    """memory high-water mark (max resident set size) of the process, None when unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class StepRecord:
+
+    name: str
+    # dotted names of the enclosing steps, e.g. `create_lakehouse_table`
+    parent: Optional[str] = None
+    status: str = "success"
+    error: Optional[str] = None
+    started_at: Optional[str] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rows: Optional[int] = None
+    bytes: Optional[int] = None
+    peak_memory_bytes: Optional[int] = None
+    tags: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def path(self) -> str:
+        return f"{self.parent}.{self.name}" if self.parent else self.name
+
+
+@dataclass
+class RunRecord:
+
+    run_id: str
+    started_at: str
+    tags: Dict[str, Any] = field(default_factory=dict)
+    status: str = "success"
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_memory_bytes: Optional[int] = None
+    steps: List[StepRecord] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class Step:
+    """an ongoing step, whose rows, bytes and tags can be set while it runs"""
+
+    enabled = True
+
+    def __init__(self, record: StepRecord):
+        self.record = record
+
+    def set(self, rows: Optional[int] = None, bytes: Optional[int] = None, **tags) -> None:
+        if rows is not None:
+            self.record.rows = rows
+        if bytes is not None:
+            self.record.bytes = bytes
+        self.record.tags.update(tags)
+
+
+class _NullStep:
+
+    enabled = False
+
+    def set(self, rows: Optional[int] = None, bytes: Optional[int] = None, **tags) -> None:
+        pass
+
+    def __enter__(self) -> "_NullStep":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_STEP = _NullStep()
+
+
+class BaseSink(ABC):
+    @abstractmethod
+    def emit(self, record: RunRecord) -> None:
+        ...
+
+
+class Instrumentation:
+    """
+    records the steps of a run, then emits them to the sinks
+
+    :param sinks: where run records are emitted, the instrumentation is disabled without any
+    :param tags: added to every run record, e.g. the fq tbl name
+    """
+
+    def __init__(self, sinks: Sequence[BaseSink] = (), tags: Optional[Dict[str, Any]] = None):
+        self.sinks = list(sinks)
+        self.tags = tags or {}
+        self.enabled = bool(self.sinks)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._record: Optional[RunRecord] = None
+
+    @contextmanager
+    def run(self, **tags) -> Iterator[Optional[RunRecord]]:
+        """
+        record a run, emitted when it's over, failed or not. Steps outside of a run
+        are emitted as a run of their own.
+        """
+        if not self.enabled or self._record is not None:
+            yield self._record
+            return
+
+        record = RunRecord(
+            run_id=uuid.uuid4().hex,
+            started_at=datetime.utcnow().isoformat(),
+            tags={**self.tags, **tags},
+        )
+        self._record = record
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        except BaseException:
+            record.status = "failed"
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_memory_bytes = peak_memory_bytes()
+            self._record = None
+            self._emit(record)
+
+    def step(self, name: str, **tags):
+        """
+        context manager recording a step, nested steps are recorded as its sub-steps
+
+        Yields a `Step` to set the rows and bytes of the step, a no-op when disabled.
+        """
+        if not self.enabled:
+            return _NULL_STEP
+        return self._step(name, tags)
+
+    @contextmanager
+    def _step(self, name: str, tags: Dict[str, Any]) -> Iterator[Step]:
+        stack = self._stack()
+        record = StepRecord(
+            name=name,
+            parent=stack[-1].path if stack else None,
+            started_at=datetime.utcnow().isoformat(),
+            tags=tags,
+        )
+        stack.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield Step(record)
+        except BaseException as e:
+            record.status = "failed"
+            record.error = repr(e)
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_memory_bytes = peak_memory_bytes()
+            stack.pop()
+            self._add(record)
+
+    def _stack(self) -> List[StepRecord]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add(self, step: StepRecord) -> None:
+        if self._record is not None:
+            with self._lock:
+                self._record.steps.append(step)
+            return
+
+        # outside of a run, the outermost step and its sub-steps make a run record
+        steps = getattr(self._local, "steps", None)
+        if steps is None:
+            steps = self._local.steps = []
+        steps.append(step)
+        if step.parent is not None:
+            return
+
+        self._local.steps = None
+        self._emit(
+            RunRecord(
+                run_id=uuid.uuid4().hex,
+                started_at=step.started_at,
+                tags=dict(self.tags),
+                status=step.status,
+                wall_seconds=step.wall_seconds,
+                cpu_seconds=step.cpu_seconds,
+                peak_memory_bytes=step.peak_memory_bytes,
+                steps=steps,
+            )
+        )
+
+    def _emit(self, record: RunRecord) -> None:
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                # instrumentation never fails a run
+                logger.warning(f"Failed to emit the run record to {type(sink).__name__}: {e!r}")
+
+
+class JsonFileSink(BaseSink):
+    """appends every run record as one JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record: RunRecord) -> None:
+        line = json.dumps(record.to_dict(), default=str, sort_keys=True)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class LoggingSink(BaseSink):
+    """logs a line per step and the run record as JSON"""
+
+    def __init__(self, log: logging.Logger = logger, level: int = logging.INFO):
+        self.log = log
+        self.level = level
+
+    def emit(self, record: RunRecord) -> None:
+        for step in record.steps:
+            self.log.log(
+                self.level,
+                f"{step.path}: {step.status} in {step.wall_seconds:.3f}s "
+                f"(cpu {step.cpu_seconds:.3f}s, rows {step.rows}, bytes {step.bytes})",
+            )
+        self.log.log(self.level, json.dumps(record.to_dict(), default=str, sort_keys=True))
+
+
+class StatsdSink(BaseSink):
+    """
+    sends the step metrics to a StatsD agent over UDP, as timers and gauges named
+    `<prefix>.<step path>.<metric>`, with DogStatsD tags unless `use_tags` is off
+
+    :param max_packet_size: metrics are packed in datagrams of at most this size
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8125,
+        prefix: str = "shadowtool.connector",
+        use_tags: bool = True,
+        max_packet_size: int = 1432,
+    ):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.use_tags = use_tags
+        self.max_packet_size = max_packet_size
+
+    def metric_lines(self, record: RunRecord) -> List[str]:
+        tags = ""
+        if self.use_tags:
+            pairs = {**record.tags, "status": record.status}
+            tags = "|#" + ",".join(f"{k}:{v}" for k, v in sorted(pairs.items()))
+
+        lines = [f"{self.prefix}.run.wall_ms:{record.wall_seconds * 1000:.0f}|ms{tags}"]
+        for step in record.steps:
+            name = f"{self.prefix}.{step.path}"
+            lines.append(f"{name}.wall_ms:{step.wall_seconds * 1000:.0f}|ms{tags}")
+            lines.append(f"{name}.cpu_ms:{step.cpu_seconds * 1000:.0f}|ms{tags}")
+            if step.rows is not None:
+                lines.append(f"{name}.rows:{step.rows}|g{tags}")
+            if step.bytes is not None:
+                lines.append(f"{name}.bytes:{step.bytes}|g{tags}")
+        if record.peak_memory_bytes is not None:
+            lines.append(f"{self.prefix}.run.peak_memory_bytes:{record.peak_memory_bytes}|g{tags}")
+        return lines
+
+    def emit(self, record: RunRecord) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for packet in self._packets(self.metric_lines(record)):
+                sock.sendto(packet.encode("utf-8"), self.address)
+        finally:
+            sock.close()
+
+    def _packets(self, lines: List[str]) -> Iterator[str]:
+        packet = ""
+        for line in lines:
+            if packet and len(packet) + len(line) + 1 > self.max_packet_size:
+                yield packet
+                packet = ""
+            packet = f"{packet}\n{line}" if packet else line
+        if packet:
+            yield packet
+
+
+def get_sink(url: str) -> BaseSink:
+    """
+    the sink described by `url`: `log` for the logs, `statsd://host:port/prefix` for
+    a StatsD agent, a file path or `file://` url for a JSON lines file
+    """
+    parsed = urlparse(url)
+    if url in ("log", "logging"):
+        return LoggingSink()
+    if parsed.scheme == "statsd":
+        prefix = parsed.path.strip("/").replace("/", ".")
+        return StatsdSink(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 8125,
+            **({"prefix": prefix} if prefix else {}),
+        )
+    if parsed.scheme == "file":
+        return JsonFileSink(parsed.path)
+    if parsed.scheme == "":
+        return JsonFileSink(url)
+    raise ValueError(f"Unsupported instrumentation sink url scheme `{parsed.scheme}`")
+
+
+def get_instrumentation(
+    sink_urls: Optional[Sequence[str]] = None, tags: Optional[Dict[str, Any]] = None
+) -> Instrumentation:
+    """
+    an instrumentation emitting to the sinks of `sink_urls` (see `get_sink`), defaulting
+    to the comma separated urls of the ST__INSTRUMENTATION_SINKS env var. Disabled
+    without any.
+    """
+    if sink_urls is None:
+        sink_urls = [
+            url.strip()
+            for url in os.getenv(config.ST__INSTRUMENTATION_SINKS, "").split(",")
+            if url.strip()
+        ]
+    return Instrumentation(sinks=[get_sink(url) for url in sink_urls], tags=tags)
+
@@ -0,0 +1,18 @@
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    split an iterable into lists of at most `size` elements,
+    without materialising the whole iterable
+    """
+    assert size > 0, "Chunk size needs to be a positive integer. "
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,5 +1,6 @@
 import logging
 import os
+import traceback
 
 
 class LoggingMixin:
@@ -35,3 +36,8 @@ class LoggingMixin:
     @classmethod
     def set_level(cls):
         cls._log.setLevel(os.getenv("HP__LOG_LEVEL", "INFO"))
+
+
+def log_full_traceback(logger: logging.Logger) -> None:
+    """log the traceback of the exception currently being handled"""
+    logger.error(traceback.format_exc())
@@ -0,0 +1,354 @@
+"""
+Split a table on the range of a key column, so its ranges can be read concurrently.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+import sqlalchemy.types as sql_types
+from sqlalchemy.engine.url import make_url
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+UNIFORM = "uniform"
+QUANTILE = "quantile"
+
+# sqlalchemy dialect -> jdbc sub-protocol
+_JDBC_PROTOCOLS = {
+    "mysql": "mysql",
+    "postgresql": "postgresql",
+    "mssql": "sqlserver",
+    "oracle": "oracle:thin",
+}
+
+
+def supports_uniform_split(lower: Any, upper: Any) -> bool:
+    """whether the key range can be split evenly: numbers, dates and datetimes"""
+    if isinstance(lower, bool) or isinstance(upper, bool):
+        return False
+    if isinstance(lower, (int, float, Decimal)) and isinstance(upper, (int, float, Decimal)):
+        # float and Decimal don't mix in arithmetic
+        return {type(lower), type(upper)} != {float, Decimal}
+    # datetime is a subclass of date, a date and a datetime can't be subtracted
+    return isinstance(lower, date) and type(lower) is type(upper)
+
+
+def resolve_split_strategy(split_strategy: str, lower: Any, upper: Any) -> str:
+    """
+    the strategy to split the key range with, `quantile` when a uniform split is
+    asked for a key that can't be split evenly, e.g. a string key
+    """
+    if split_strategy != QUANTILE and not supports_uniform_split(lower, upper):
+        logger.warning(
+            f"Keys of type {type(lower).__name__} can't be split uniformly, "
+            "splitting on the quantiles of a sample instead. "
+        )
+        return QUANTILE
+    return split_strategy
+
+
+def uniform_bounds(lower: Any, upper: Any, num_partitions: int) -> List[Any]:
+    """
+    `num_partitions + 1` evenly spaced boundaries from lower to upper, fewer when
+    an integer or date range is narrower than the number of partitions
+    """
+    assert num_partitions > 0, "num_partitions needs to be a positive integer. "
+    if not supports_uniform_split(lower, upper):
+        raise ValueError(
+            f"Can't split the key range {lower!r}..{upper!r} uniformly, only numbers, dates "
+            "and datetimes can be. Use the quantile split strategy instead. "
+        )
+    if lower == upper:
+        return [lower, upper]
+
+    step = (upper - lower) / num_partitions
+    bounds = [lower + step * i for i in range(num_partitions)] + [upper]
+    if isinstance(lower, int):
+        bounds = sorted(set(int(b) for b in bounds))
+    elif isinstance(lower, date):
+        # adding a part of a day to a date is truncated to the day
+        bounds = sorted(set(bounds))
+    return bounds
+
+
+def quantile_bounds(sample: Sequence[Any], num_partitions: int) -> List[Any]:
+    """
+    boundaries splitting the sampled key values into partitions of about the same
+    number of rows, for skewed keys. Repeated values are merged, so a very frequent
+    key gives fewer partitions rather than empty ones.
+    """
+    assert num_partitions > 0, "num_partitions needs to be a positive integer. "
+    values = sorted(v for v in sample if v is not None)
+    if not values:
+        return []
+
+    bounds = [values[0]]
+    for i in range(1, num_partitions):
+        candidate = values[min(len(values) - 1, (i * len(values)) // num_partitions)]
+        if candidate > bounds[-1]:
+            bounds.append(candidate)
+    if values[-1] > bounds[-1] or len(bounds) == 1:
+        bounds.append(values[-1])
+    return bounds
+
+
+def range_predicates(
+    column: str, bounds: Sequence[Any], where: Optional[str] = None
+) -> List[str]:
+    """
+    SQL predicates of the ranges between consecutive boundaries, covering every row:
+    the first range is open below and holds the NULL keys, the last is open above
+
+    :param where: a filter added to every range, e.g. a `watermark_predicate`
+    """
+    inner = list(bounds[1:-1])
+    if not inner:
+        predicates = ["1 = 1"]
+    else:
+        predicates = [f"{column} < {sql_literal(inner[0])} OR {column} IS NULL"]
+        for low, high in zip(inner, inner[1:]):
+            predicates.append(
+                f"{column} >= {sql_literal(low)} AND {column} < {sql_literal(high)}"
+            )
+        predicates.append(f"{column} >= {sql_literal(inner[-1])}")
+
+    if where:
+        predicates = [f"({predicate}) AND {where}" for predicate in predicates]
+    return predicates
+
+
+def watermark_predicate(watermark_key: str, watermark_value: Any) -> str:
+    """the rows above the watermark, whichever column the ranges are split on"""
+    return f"{watermark_key} > {sql_literal(watermark_value)}"
+
+
+def jdbc_partitioning_options(
+    column: str,
+    bounds: Sequence[Any],
+    predicates: Sequence[str],
+    split_strategy: str = UNIFORM,
+    filtered: bool = False,
+) -> Dict[str, Any]:
+    """
+    partitioning arguments of Spark's jdbc reader: its own column/bounds partitioning
+    for uniform integer splits, explicit `predicates` otherwise
+
+    :param filtered: the predicates carry a filter on top of the ranges (e.g. a
+            watermark), which the column partitioning can't express
+    """
+    if (
+        not filtered
+        and split_strategy != QUANTILE
+        and len(bounds) > 2
+        and all(isinstance(b, int) for b in bounds)
+    ):
+        return {
+            "column": column,
+            "lowerBound": bounds[0],
+            "upperBound": bounds[-1],
+            "numPartitions": len(bounds) - 1,
+        }
+    return {"predicates": list(predicates)}
+
+
+def sample_keys_query(
+    dialect: str, table: str, column: str, fraction: float, where: Optional[str] = None
+) -> Optional[str]:
+    """
+    query of a random sample of the keys, drawn by the database so only the sample
+    travels, None when the dialect has no sampling support
+
+    :param where: a filter of the sampled rows, e.g. a `watermark_predicate`
+    """
+    if dialect == "postgresql":
+        query = f"SELECT {column} FROM {table} TABLESAMPLE BERNOULLI ({fraction * 100})"
+        return f"{query} WHERE {where}" if where else query
+    if dialect == "mysql":
+        query = f"SELECT {column} FROM {table} WHERE RAND() < {fraction}"
+        return f"{query} AND {where}" if where else query
+    return None
+
+
+def sql_literal(value: Any) -> str:
+    """inline SQL literal of a key value, numbers as is and anything else quoted"""
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def spark_type_name(sql_type: Any) -> str:
+    """
+    Spark SQL type of a reflected sqlalchemy column type, `string` for anything
+    without a closer match
+    """
+    if isinstance(sql_type, sql_types.Boolean):
+        return "boolean"
+    if isinstance(sql_type, sql_types.Integer):
+        return "bigint"
+    if isinstance(sql_type, sql_types.Float):
+        return "double"
+    if isinstance(sql_type, sql_types.Numeric):
+        if sql_type.precision is None:
+            # the mapping of Spark's jdbc reader for unbounded numerics
+            return "decimal(38,18)"
+        precision = min(sql_type.precision, 38)
+        return f"decimal({precision},{min(sql_type.scale or 0, precision)})"
+    if isinstance(sql_type, sql_types.DateTime):
+        return "timestamp"
+    if isinstance(sql_type, sql_types.Date):
+        return "date"
+    if isinstance(sql_type, (sql_types.LargeBinary, sql_types.BINARY, sql_types.VARBINARY)):
+        return "binary"
+    return "string"
+
+
+def spark_schema_ddl(columns: Sequence[Tuple[str, str]]) -> str:
+    """DDL schema string of (column name, Spark SQL type) pairs"""
+    return ", ".join(f"`{name.replace('`', '``')}` {type_name}" for name, type_name in columns)
+
+
+def _to_decimal(value: Any) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+_SPARK_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "boolean": bool,
+    "bigint": int,
+    "double": float,
+    "binary": bytes,
+    "string": str,
+}
+
+
+def row_converter(type_names: Sequence[str]) -> Callable[[Sequence[Any]], tuple]:
+    """
+    convert the values of a db row to the python types Spark expects for the given
+    Spark SQL types, e.g. `Decimal` for decimals or `str` for unmapped types
+    """
+    converters = [
+        _to_decimal if type_name.startswith("decimal") else _SPARK_CONVERTERS.get(type_name)
+        for type_name in type_names
+    ]
+
+    def convert(row: Sequence[Any]) -> tuple:
+        return tuple(
+            value if value is None or converter is None else converter(value)
+            for converter, value in zip(converters, row)
+        )
+
+    return convert
+
+
+class RowBudget:
+    """
+    caps the rows held in memory by the concurrent cursors of one extraction
+
+    :param max_rows: None for no cap
+    """
+
+    def __init__(self, max_rows: Optional[int]):
+        self.max_rows = max_rows
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def consume(self, num_rows: int) -> None:
+        with self._lock:
+            self.rows += num_rows
+            if self.max_rows is not None and self.rows > self.max_rows:
+                raise ValueError(
+                    f"The extraction fetched more than {self.max_rows} rows into memory, "
+                    f"read it with the jdbc engine or raise the cap. "
+                )
+
+
+def fetch_rows(
+    result: Any,
+    budget: RowBudget,
+    convert: Callable[[Sequence[Any]], tuple] = tuple,
+    batch_size: int = 10000,
+) -> List[tuple]:
+    """fetch every row of a cursor result in batches, converted, within the budget"""
+    rows = []
+    while True:
+        batch = result.fetchmany(batch_size)
+        if not batch:
+            return rows
+        budget.consume(len(batch))
+        rows.extend(convert(row) for row in batch)
+
+
+def sqlalchemy_url_to_jdbc(url: str) -> Tuple[str, Dict[str, str]]:
+    """
+    convert a sqlalchemy database url into a jdbc url and the connection
+    properties (user, password) expected by Spark's jdbc reader
+    """
+    parsed = make_url(url)
+    dialect = parsed.drivername.split("+")[0]
+    protocol = _JDBC_PROTOCOLS.get(dialect)
+    if protocol is None:
+        raise ValueError(f"No jdbc protocol known for the database dialect `{dialect}`")
+
+    host = parsed.host or "localhost"
+    port = f":{parsed.port}" if parsed.port else ""
+    database = parsed.database or ""
+    if dialect == "mssql":
+        jdbc_url = f"jdbc:{protocol}://{host}{port};databaseName={database}"
+    elif dialect == "oracle":
+        jdbc_url = f"jdbc:{protocol}:@{host}{port}/{database}"
+    else:
+        jdbc_url = f"jdbc:{protocol}://{host}{port}/{database}"
+
+    properties = {}
+    if parsed.username is not None:
+        properties["user"] = parsed.username
+    if parsed.password is not None:
+        properties["password"] = str(parsed.password)
+    return jdbc_url, properties
+
+
+_connection_slots: Dict[str, threading.BoundedSemaphore] = {}
+_connection_slots_lock = threading.Lock()
+
+
+def get_connection_slots(key: str, max_connections: int) -> threading.BoundedSemaphore:
+    """
+    the semaphore shared by every reader of a source (e.g. keyed by database url),
+    so concurrent connectors of the same source stay under one connection cap
+    """
+    with _connection_slots_lock:
+        slots = _connection_slots.get(key)
+        if slots is None:
+            slots = _connection_slots[key] = threading.BoundedSemaphore(max_connections)
+        return slots
+
+
+def fetch_partitions_concurrently(
+    fetch: Callable[[str], T],
+    predicates: Sequence[str],
+    max_connections: int,
+    slots: Optional[threading.BoundedSemaphore] = None,
+) -> List[T]:
+    """
+    call `fetch` for every predicate, with at most `max_connections` calls running
+    at the same time, and return the results in the order of the predicates
+
+    :param slots: a semaphore shared with other readers of the same source, see
+            `get_connection_slots`
+    """
+    assert max_connections > 0, "max_connections needs to be a positive integer. "
+    slots = slots or threading.BoundedSemaphore(max_connections)
+
+    def bounded_fetch(predicate: str) -> T:
+        with slots:
+            return fetch(predicate)
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_connections, max(1, len(predicates))),
+        thread_name_prefix="range-extract",
+    ) as executor:
+        return list(executor.map(bounded_fetch, predicates))
@@ -0,0 +1,9 @@
+import random
+
+
+def exponential_backoff(attempt: int, base_delay: float = 0.5, max_delay: float = 20.0) -> float:
+    """
+    seconds to sleep before the given retry attempt (starting from 0),
+    exponential with full jitter so concurrent callers don't retry in lockstep
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
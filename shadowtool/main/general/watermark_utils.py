@@ -0,0 +1,299 @@
+"""
+Persistent high-water marks of incremental extractions.
+
+A watermark records, per table (keyed by its fully qualified tbl name), the highest
+value of a key column that was loaded by a successful run, so the next run only
+pulls the rows above it. Watermarks are kept in a local JSON file or a Postgres table.
+"""
+import json
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import shadowtool.config as config
+import shadowtool.constants as constants
+from shadowtool.main.general.logging_utils import LoggingMixin
+
+DEFAULT_WATERMARK_TABLE = "shadowtool_watermarks"
+
+
+def encode_watermark_value(value: Any) -> Dict[str, Any]:
+    """JSON friendly form of a key value, keeping its type"""
+    if isinstance(value, bool):
+        raise TypeError("Boolean columns can't be used as watermark keys. ")
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"type": "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"type": "decimal", "value": str(value)}
+    if isinstance(value, (int, float, str)):
+        return {"type": type(value).__name__, "value": value}
+    raise TypeError(f"Unsupported watermark value type {type(value).__name__}")
+
+
+def decode_watermark_value(encoded: Dict[str, Any]) -> Any:
+    value_type, value = encoded["type"], encoded["value"]
+    if value_type == "datetime":
+        return datetime.fromisoformat(value)
+    if value_type == "date":
+        return date.fromisoformat(value)
+    if value_type == "decimal":
+        return Decimal(value)
+    return {"int": int, "float": float, "str": str}[value_type](value)
+
+
+@dataclass
+class Watermark:
+
+    fq_tbl_name: str
+    key: str
+    value: Any
+    updated_at: datetime = field(default_factory=lambda: datetime.utcnow().replace(microsecond=0))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fq_tbl_name": self.fq_tbl_name,
+            "key": self.key,
+            "value": encode_watermark_value(self.value),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "Watermark":
+        return cls(
+            fq_tbl_name=raw["fq_tbl_name"],
+            key=raw["key"],
+            value=decode_watermark_value(raw["value"]),
+            updated_at=datetime.fromisoformat(raw["updated_at"]),
+        )
+
+
+class BaseWatermarkStore(LoggingMixin, ABC):
+    """
+    keeps the latest watermark of each table
+
+    Watermarks only move forward: committing a value lower than the stored one
+    (e.g. from a late retry) is ignored, unless forced. A watermark of another key
+    replaces the stored one, since it can't be compared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, fq_tbl_name: str) -> Optional[Watermark]:
+        ...
+
+    @abstractmethod
+    def _put(self, watermark: Watermark) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, fq_tbl_name: str) -> None:
+        ...
+
+    def commit(self, watermark: Watermark, force: bool = False) -> bool:
+        """
+        :return: whether the stored watermark was updated
+        """
+        with self._lock:
+            current = self.get(watermark.fq_tbl_name)
+            if (
+                not force
+                and current is not None
+                and current.key == watermark.key
+                and current.value is not None
+                and watermark.value <= current.value
+            ):
+                self.log.info(
+                    f"Watermark of {watermark.fq_tbl_name} stays at {current.value}, "
+                    f"not moving back to {watermark.value}"
+                )
+                return False
+
+            self._put(watermark)
+            self.log.info(
+                f"Watermark of {watermark.fq_tbl_name} committed: {watermark.key} = {watermark.value}"
+            )
+            return True
+
+
+class LocalFileWatermarkStore(BaseWatermarkStore):
+    """watermarks of all tables in one JSON file, for single machine deployments and tests"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    def get(self, fq_tbl_name: str) -> Optional[Watermark]:
+        raw = self._read().get(fq_tbl_name)
+        return None if raw is None else Watermark.from_dict(raw)
+
+    def _put(self, watermark: Watermark) -> None:
+        data = self._read()
+        data[watermark.fq_tbl_name] = watermark.to_dict()
+        self._write(data)
+
+    def delete(self, fq_tbl_name: str) -> None:
+        with self._lock:
+            data = self._read()
+            if data.pop(fq_tbl_name, None) is not None:
+                self._write(data)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+class PostgresWatermarkStore(BaseWatermarkStore):
+    """
+    watermarks in a Postgres table, created on first use, shared by every
+    machine running the pipelines
+    """
+
+    def __init__(self, dsn: str, table_name: str = DEFAULT_WATERMARK_TABLE):
+        super().__init__()
+        self.dsn = dsn
+        self.table_name = table_name
+        self._table_created = False
+
+    def get(self, fq_tbl_name: str) -> Optional[Watermark]:
+        with closing(self._connect()) as conn, conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT fq_tbl_name, key, value, updated_at FROM {self.table_name} "
+                f"WHERE fq_tbl_name = %s",
+                (fq_tbl_name,),
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return Watermark(
+            fq_tbl_name=row[0],
+            key=row[1],
+            value=decode_watermark_value(json.loads(row[2])),
+            updated_at=row[3],
+        )
+
+    # the stored watermark is replaced when it's of another key or type, or lower. Values
+    # are compared in their type, strings byte-wise like python does.
+    _MOVES_FORWARD = (
+        "current.key <> EXCLUDED.key "
+        "OR (current.value::json ->> 'type') <> (EXCLUDED.value::json ->> 'type') "
+        "OR CASE EXCLUDED.value::json ->> 'type' "
+        "WHEN 'datetime' THEN (EXCLUDED.value::json ->> 'value')::timestamptz "
+        "> (current.value::json ->> 'value')::timestamptz "
+        "WHEN 'date' THEN (EXCLUDED.value::json ->> 'value')::date "
+        "> (current.value::json ->> 'value')::date "
+        "WHEN 'str' THEN (EXCLUDED.value::json ->> 'value') COLLATE \"C\" "
+        "> (current.value::json ->> 'value') COLLATE \"C\" "
+        "ELSE (EXCLUDED.value::json ->> 'value')::numeric "
+        "> (current.value::json ->> 'value')::numeric END"
+    )
+
+    def commit(self, watermark: Watermark, force: bool = False) -> bool:
+        """
+        a single upsert, which only moves the watermark forward unless forced, so
+        concurrent commits from several machines can't move it back
+
+        :return: whether the stored watermark was updated
+        """
+        with closing(self._connect()) as conn, conn, conn.cursor() as cur:
+            cur.execute(self._upsert_statement(force), self._row(watermark))
+            updated = cur.fetchone() is not None
+
+        if updated:
+            self.log.info(
+                f"Watermark of {watermark.fq_tbl_name} committed: {watermark.key} = {watermark.value}"
+            )
+        else:
+            self.log.info(
+                f"Watermark of {watermark.fq_tbl_name} not moving back to {watermark.value}"
+            )
+        return updated
+
+    def _put(self, watermark: Watermark) -> None:
+        with closing(self._connect()) as conn, conn, conn.cursor() as cur:
+            cur.execute(self._upsert_statement(force=True), self._row(watermark))
+
+    def _upsert_statement(self, force: bool) -> str:
+        return (
+            f"INSERT INTO {self.table_name} AS current (fq_tbl_name, key, value, updated_at) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (fq_tbl_name) DO UPDATE SET "
+            f"key = EXCLUDED.key, value = EXCLUDED.value, updated_at = EXCLUDED.updated_at"
+            + ("" if force else f" WHERE {self._MOVES_FORWARD}")
+            + " RETURNING fq_tbl_name"
+        )
+
+    @staticmethod
+    def _row(watermark: Watermark) -> tuple:
+        return (
+            watermark.fq_tbl_name,
+            watermark.key,
+            json.dumps(encode_watermark_value(watermark.value)),
+            watermark.updated_at,
+        )
+
+    def delete(self, fq_tbl_name: str) -> None:
+        with closing(self._connect()) as conn, conn, conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {self.table_name} WHERE fq_tbl_name = %s", (fq_tbl_name,))
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        if not self._table_created:
+            # committed by the `with conn` block
+            with conn, conn.cursor() as cur:
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table_name} ("
+                    f"fq_tbl_name TEXT PRIMARY KEY, key TEXT NOT NULL, "
+                    f"value TEXT NOT NULL, updated_at TIMESTAMP NOT NULL)"
+                )
+            self._table_created = True
+        return conn
+
+
+def get_watermark_store(url: Optional[str] = None) -> BaseWatermarkStore:
+    """
+    the store configured by `url`, defaulting to the ST__WATERMARK_STORE_URL env var:
+    `postgresql://...` for Postgres, a file path or `file://` url for a local file.
+    Without any, watermarks are kept in a file of the shadowtool temp folder.
+    """
+    url = url or os.getenv(config.ST__WATERMARK_STORE_URL)
+    if not url:
+        return LocalFileWatermarkStore(
+            os.path.join(constants.TEMP_FOLDER_DIRECTORY, "watermarks.json")
+        )
+
+    scheme = urlparse(url).scheme
+    if scheme in ("postgres", "postgresql"):
+        return PostgresWatermarkStore(dsn=url)
+    if scheme == "file":
+        return LocalFileWatermarkStore(urlparse(url).path)
+    if scheme == "":
+        return LocalFileWatermarkStore(url)
+    raise ValueError(f"Unsupported watermark store url scheme `{scheme}`")
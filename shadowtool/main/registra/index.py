@@ -0,0 +1,130 @@
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import shadowtool.main.registra.models as models
+
+TableKey = Tuple[str, str, str]
+TaskFilter = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+class RegistraIndex:
+    """
+    flat lookup tables over a loaded registra
+
+    The registra is a nested source -> db -> table structure. The index flattens it
+    into `(source, db, tbl)` keys, plus per source and per db secondary indexes, so
+    lookups are a single dict access. Task enumerations are precomputed as tuples
+    of `RegistraTask`, which are immutable and safe to share between callers.
+
+    Sources are indexed the first time they are looked up, so a lazily loaded
+    registra only gets the requested sources parsed.
+
+    The index is a read-only view, it needs to be rebuilt when the registra changes.
+    """
+
+    def __init__(self, registra: Dict[str, Any]):
+        self.registra = registra
+        self.source_names: Tuple[str, ...] = tuple(registra)
+
+        self.tables: Dict[TableKey, models.BaseTableRegistraTemplate] = {}
+        self.dbs: Dict[Tuple[str, str], models.DBRegistra] = {}
+        self.db_names_by_source: Dict[str, Tuple[str, ...]] = {}
+        self.tbl_names_by_db: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        self._tasks: Dict[TaskFilter, Tuple[models.RegistraTask, ...]] = {}
+        self._lock = threading.RLock()
+
+    def get_table(
+        self, source_name: str, db_name: str, tbl_name: str
+    ) -> Optional[models.BaseTableRegistraTemplate]:
+        self._index_source(source_name)
+        return self.tables.get((source_name, db_name, tbl_name))
+
+    def get_db(self, source_name: str, db_name: str) -> Optional[models.DBRegistra]:
+        self._index_source(source_name)
+        return self.dbs.get((source_name, db_name))
+
+    def get_db_names(self, source_name: str) -> Tuple[str, ...]:
+        self._index_source(source_name)
+        return self.db_names_by_source[source_name]
+
+    def get_tbl_names(self, source_name: str, db_name: str) -> Tuple[str, ...]:
+        self._index_source(source_name)
+        return self.tbl_names_by_db[(source_name, db_name)]
+
+    def get_tasks(
+        self,
+        source_name: Optional[str] = None,
+        db_name: Optional[str] = None,
+        tbl_name: Optional[str] = None,
+    ) -> Tuple[models.RegistraTask, ...]:
+        """
+        tasks matching the filter, see `RegistraManager.get_all_available_registra_tasks`.
+        Uncommon filters are computed on first use and memoised.
+        """
+        key = (source_name, db_name, tbl_name)
+        tasks = self._tasks.get(key)
+        if tasks is not None:
+            return tasks
+
+        if source_name is None:
+            self._index_all_sources()
+        else:
+            self._index_source(source_name)
+
+        with self._lock:
+            tasks = self._tasks.get(key)
+            if tasks is None:
+                tasks = self._tasks[key] = tuple(self._enumerate_tasks(*key))
+        return tasks
+
+    def _index_all_sources(self) -> None:
+        if (None, None, None) in self._tasks:
+            return
+
+        with self._lock:
+            for source_name in self.source_names:
+                self._index_source(source_name)
+            self._tasks[(None, None, None)] = tuple(
+                task for s in self.source_names for task in self._tasks[(s, None, None)]
+            )
+
+    def _index_source(self, source_name: str) -> None:
+        if source_name in self.db_names_by_source or source_name not in self.registra:
+            return
+
+        with self._lock:
+            if source_name in self.db_names_by_source:
+                return
+
+            source_tasks = []
+            data_config = self.registra[source_name].data_config
+            for db_name, db_registra in data_config.items():
+                db_tasks = []
+                for tbl_name, tbl_registra in db_registra.tables.items():
+                    self.tables[(source_name, db_name, tbl_name)] = tbl_registra
+                    db_tasks.append(
+                        models.RegistraTask(
+                            source_name=source_name, db_name=db_name, tbl_name=tbl_name
+                        )
+                    )
+                self.dbs[(source_name, db_name)] = db_registra
+                self.tbl_names_by_db[(source_name, db_name)] = tuple(db_registra.tables)
+                self._tasks[(source_name, db_name, None)] = tuple(db_tasks)
+                source_tasks.extend(db_tasks)
+
+            self._tasks[(source_name, None, None)] = tuple(source_tasks)
+            # written last, marks the source as indexed
+            self.db_names_by_source[source_name] = tuple(data_config)
+
+    def _enumerate_tasks(
+        self, source_name: Optional[str], db_name: Optional[str], tbl_name: Optional[str]
+    ) -> Iterator[models.RegistraTask]:
+        target_source_names = self.source_names if source_name is None else (source_name,)
+        for s in target_source_names:
+            target_db_names = self.get_db_names(s) if db_name is None else (db_name,)
+            for d in target_db_names:
+                target_tbl_names = (
+                    self.get_tbl_names(s, d) if tbl_name is None else (tbl_name,)
+                )
+                for t in target_tbl_names:
+                    yield models.RegistraTask(source_name=s, db_name=d, tbl_name=t)
@@ -0,0 +1,160 @@
+"""
+Lazy per-source registra loading.
+
+A manifest mapping each source name to its yaml file is built with a cheap header
+scan, the files themselves are only parsed and validated when their source is
+looked up. A job reading a single source therefore pays for a single file.
+"""
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, MutableMapping, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SOURCE_NAME_PATTERN = re.compile(
+    r"""^source_name:[ \t]*["']?([^"'#\r\n]+?)["']?[ \t]*(?:#.*)?$""", re.MULTILINE
+)
+_IS_ACTIVE_PATTERN = re.compile(r"^is_active:[ \t]*(\S+)", re.MULTILINE)
+_FALSE_VALUES = {"false", "False", "FALSE", "no", "No", "NO", "off", "Off", "OFF"}
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+
+    file_path: str
+    is_active: bool
+
+
+def scan_registra_header(
+    file_path: str, fallback: Callable[[str], Any]
+) -> Tuple[str, ManifestEntry]:
+    """
+    read the source name and active flag from the top level keys of the file,
+    without parsing it. Files that can't be scanned (e.g. flow style yaml) are
+    parsed with `fallback` instead.
+
+    :return: the lower case source name and the manifest entry of the file
+    """
+    with open(file_path, "r") as f:
+        text = f.read()
+
+    source_match = _SOURCE_NAME_PATTERN.search(text)
+    if source_match is None:
+        parsed = fallback(file_path)
+        return parsed.source_name.lower(), ManifestEntry(file_path, parsed.is_active)
+
+    active_match = _IS_ACTIVE_PATTERN.search(text)
+    is_active = active_match is None or active_match.group(1) not in _FALSE_VALUES
+    return source_match.group(1).strip().lower(), ManifestEntry(file_path, is_active)
+
+
+def build_manifest(
+    registra_files: List[str], fallback: Callable[[str], Any]
+) -> "OrderedDict[str, ManifestEntry]":
+    """source name -> manifest entry, for every file, active or not"""
+    manifest = OrderedDict()
+    for file_path in registra_files:
+        source_name, entry = scan_registra_header(file_path, fallback)
+        assert source_name not in manifest, (
+            f"Detected duplicated source name `{source_name}` "
+            f"in yaml file `{os.path.basename(file_path)}`, the same cluster name has been registered by another yaml file. "
+            f"Please check. "
+        )
+        manifest[source_name] = entry
+    return manifest
+
+
+class LazyRegistra(MutableMapping):
+    """
+    a registra mapping (lower case source name -> source registra) that parses
+    the yaml file of a source on first access
+
+    Listing the sources only reads the manifest, while `values` / `items` parse
+    every remaining file.
+    """
+
+    def __init__(
+        self,
+        manifest: "OrderedDict[str, ManifestEntry]",
+        parse_file: Callable[[str], Any],
+    ):
+        self._parse_file = parse_file
+        self._lock = threading.RLock()
+        # sources in manifest order, either parsed or pending
+        self._pending: Dict[str, str] = OrderedDict(
+            (name, entry.file_path) for name, entry in manifest.items() if entry.is_active
+        )
+        self._parsed: Dict[str, Any] = {}
+        self._order: List[str] = list(self._pending)
+
+    @property
+    def parsed_source_names(self) -> List[str]:
+        return list(self._parsed)
+
+    @property
+    def is_fully_parsed(self) -> bool:
+        return not self._pending
+
+    def __getitem__(self, source_name: str) -> Any:
+        if source_name in self._parsed:
+            return self._parsed[source_name]
+
+        with self._lock:
+            if source_name not in self._parsed:
+                file_path = self._pending[source_name]
+                parsed = self._parse_file(file_path)
+                assert parsed.source_name.lower() == source_name, (
+                    f"Registra file `{os.path.basename(file_path)}` declares the source "
+                    f"`{parsed.source_name}` but its header was scanned as `{source_name}`. "
+                )
+                logger.debug(f"Lazily parsed registra of source {source_name} from {file_path}")
+                del self._pending[source_name]
+                if not parsed.is_active:
+                    self._order.remove(source_name)
+                    raise KeyError(source_name)
+                self._parsed[source_name] = parsed
+
+        return self._parsed[source_name]
+
+    def __setitem__(self, source_name: str, value: Any) -> None:
+        with self._lock:
+            if source_name not in self._parsed and source_name not in self._pending:
+                self._order.append(source_name)
+            self._pending.pop(source_name, None)
+            self._parsed[source_name] = value
+
+    def __delitem__(self, source_name: str) -> None:
+        if source_name not in self:
+            raise KeyError(source_name)
+        self.discard(source_name)
+
+    def discard(self, source_name: str) -> None:
+        """
+        drop a source, parsed or pending, without parsing its file: unlike `pop`,
+        it works once the file was deleted or renamed its source
+        """
+        with self._lock:
+            if source_name not in self._parsed and source_name not in self._pending:
+                return
+            self._parsed.pop(source_name, None)
+            self._pending.pop(source_name, None)
+            self._order.remove(source_name)
+
+    def __contains__(self, source_name: object) -> bool:
+        return source_name in self._parsed or source_name in self._pending
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __repr__(self) -> str:
+        return (
+            f"LazyRegistra({len(self._parsed)} parsed, {len(self._pending)} pending: "
+            f"{list(self._order)})"
+        )
@@ -1,13 +1,121 @@
-from typing import Dict, Optional, List, Union
+from typing import Dict, Optional, List, Union, Tuple, Iterable
+import hashlib
+import logging
 import yaml
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
 import os
+import time
 from typing import Any
 
-from shadowtool.main.general.logging_utils import LoggingMixin
+import shadowtool.config as config
+import shadowtool.constants as constants
+
+from shadowtool.main.general.file_utils import is_yaml_file
+from shadowtool.main.general.logging_utils import LoggingMixin, log_full_traceback
 import shadowtool.main.registra.models as models
 import shadowtool.main.registra.parsers as parsers
+import shadowtool.main.registra.snapshot as snapshot
+from shadowtool.main.registra.index import RegistraIndex
+from shadowtool.main.registra.parse_cache import ParseResultCache
+from shadowtool.main.registra.lazy import LazyRegistra, build_manifest
+from shadowtool.main.vendors.aws import S3Hook
+
+logger = logging.getLogger(__name__)
+
+# the C LibYAML loader is several times faster, when PyYAML was built with it
+YamlSafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_yaml_resource(file_path: str, raw_yaml_text: Optional[str] = None):
+    try:
+        if raw_yaml_text is None:
+            with open(file_path, "r") as f:
+                raw_yaml_text = f.read()
+        return yaml.load(raw_yaml_text, Loader=YamlSafeLoader)
+    except (yaml.parser.ParserError, yaml.scanner.ScannerError):
+        logger.error(
+            f"The yaml file seems to be malformed. Please verify."
+            f"Location: {file_path} "
+        )
+        log_full_traceback(logger)
+        sys.exit(1)
+
+
+def parse_registra_file(
+    file_path: str,
+    registra_parsers: Dict[models.BaseRegistraType, parsers.BaseRegistraParser],
+    parse_cache: Optional[ParseResultCache] = None,
+):
+    """
+    load and parse a single registra yaml file, kept at module level so it
+    can be shipped to the workers of a process pool
+
+    With a `parse_cache`, a file whose content was already parsed by the same
+    parser version is not parsed again.
+    """
+    item = os.path.basename(file_path)
+    with open(file_path, "rb") as f:
+        raw_content = f.read()
+
+    content_hash = None
+    if parse_cache is not None:
+        content_hash = hashlib.sha256(raw_content).hexdigest()
+        cached_result = parse_cache.get(content_hash, registra_parsers)
+        if cached_result is not None:
+            return cached_result
+
+    yaml_raw_text = load_yaml_resource(
+        file_path=file_path, raw_yaml_text=raw_content.decode("utf-8")
+    )
+
+    try:
+        registra_type = yaml_raw_text["registra_type"]
+    except KeyError:
+        logger.error(
+            f"Unable to find registra_type in the file {item}, please check "
+            f"that each yaml file contains the field registra_type so the parser know"
+            f"which template to use. "
+        )
+        sys.exit(1)
+
+    current_parser = registra_parsers.get(registra_type)
+
+    assert current_parser is not None, (
+        f"Unable to determine the Registra parser with the given "
+        f"Registra Type: {registra_type}"
+    )
+
+    result = current_parser(file_name=item, raw_yaml_dict=yaml_raw_text).parse()
+    if parse_cache is not None:
+        parse_cache.set(content_hash, registra_type, current_parser, result)
+    return result
+
+
+@dataclass
+class RegistraFileState:
+
+    # (size, mtime) of the file, or its s3 ETag when synced from s3
+    fingerprint: Tuple
+    # lower case source names declared in the file
+    sources: List[str]
+
+
+@dataclass
+class RegistraReloadReport:
+
+    added_files: List[str] = field(default_factory=list)
+    changed_files: List[str] = field(default_factory=list)
+    removed_files: List[str] = field(default_factory=list)
+    updated_sources: List[str] = field(default_factory=list)
+    removed_sources: List[str] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added_files or self.changed_files or self.removed_files)
 
 
 class RegistraManagerMeta(type, LoggingMixin):
@@ -19,6 +127,7 @@ class RegistraManagerMeta(type, LoggingMixin):
     """
 
     _registra: Dict[str, Any] = None
+    _registra_index: Optional[RegistraIndex] = None
 
     @property
     def registra(cls):
@@ -28,6 +137,15 @@ class RegistraManagerMeta(type, LoggingMixin):
 
         return cls._registra
 
+    @property
+    def registra_index(cls) -> RegistraIndex:
+        """flat lookup index of the registra, rebuilt whenever the registra is (re)loaded"""
+        registra = cls.registra
+        if cls._registra_index is None or cls._registra_index.registra is not registra:
+            cls._registra_index = RegistraIndex(registra)
+
+        return cls._registra_index
+
 
 class RegistraManager(metaclass=RegistraManagerMeta):
 
@@ -37,78 +155,382 @@ class RegistraManager(metaclass=RegistraManagerMeta):
     """
 
     local_registra_path: str
-    registra_search_path: Optional[str]
+    registra_search_path: Optional[str] = None
     registra_module_path: List[str] = []
-    registra_parsers: Dict[models.BaseRegistraType, parsers.BaseRegistraParser]
+    registra_parsers: Dict[models.BaseRegistraType, parsers.BaseRegistraParser] = {}
+
+    # reuse the compiled registra snapshot while the yaml files are unchanged
+    use_snapshot: bool = True
+    # defaults to a file next to the local registra path, see `get_snapshot_path`
+    registra_snapshot_path: Optional[str] = None
+    # parse the yaml files on a process pool of this size, None to parse serially
+    parallel_load_workers: Optional[int] = None
+    # below this number of files, the process pool costs more than it saves
+    parallel_load_min_files: int = 32
+    # seconds during which a registra synced from s3 is not synced again
+    registra_sync_ttl: float = 300
+    # without a matching snapshot, only parse the yaml file of a source when it's looked up
+    lazy_load: bool = False
+    # cache the parsed result of each yaml file by content hash and parser version
+    use_parse_cache: bool = True
+    # defaults to a folder next to the local registra path, see `get_parse_cache_path`
+    registra_parse_cache_path: Optional[str] = None
+
+    # state of the loaded files, used by `reload_registra`
+    _registra_file_states: Dict[str, RegistraFileState] = {}
+    # local file path -> s3 ETag, for registra synced from s3
+    _synced_etags: Dict[str, str] = {}
+    # prefix -> monotonic time of its last sync
+    _last_synced_at: Dict[str, float] = {}
 
-    def set_registra_parsers(self, parsers_mapping: Dict[models.BaseRegistraType, ]):
+    @classmethod
+    def set_registra_parsers(
+        cls,
+        parsers_mapping: Dict[models.BaseRegistraType, parsers.BaseRegistraParser],
+    ) -> None:
+        cls.registra_parsers = parsers_mapping
 
+    @classmethod
+    def get_registra_parsers(
+        cls,
+    ) -> Dict[models.BaseRegistraType, parsers.BaseRegistraParser]:
+        """
+        the parsers of the global registry (including entry points), overridden
+        by the ones set on the manager
+        """
+        return {**parsers.registry.as_mapping(), **cls.registra_parsers}
+
+    @classmethod
+    def get_parse_cache(cls) -> Optional[ParseResultCache]:
+        if not cls.use_parse_cache:
+            return None
+        return ParseResultCache(cache_dir=cls.get_parse_cache_path())
+
+    @classmethod
+    def get_parse_cache_path(cls) -> str:
+        if cls.registra_parse_cache_path:
+            return cls.registra_parse_cache_path
+        return os.path.normpath(cls.local_registra_path) + ".parse_cache"
 
     @classmethod
     def load_registra(cls):
+        """
+        load the registra from the compiled snapshot when the yaml files did not
+        change since it was built, otherwise parse every file and rebuild it
+
+        With `lazy_load`, a missing or outdated snapshot is not rebuilt, the files are
+        only scanned for their source name and parsed when their source is looked up.
+        """
+        registra_files = cls._discover_registra_files()
+        if not cls.use_snapshot:
+            if cls.lazy_load:
+                return cls._load_lazy_registra(registra_files)
+            registra_result, sources_by_file = cls._parse_registra_files(registra_files)
+            cls._record_file_states(registra_files, sources_by_file)
+            return registra_result
+
+        file_hashes = snapshot.compute_file_hashes(cls.local_registra_path, registra_files)
+        content_hash = cls._compute_content_hash(file_hashes)
+        snapshot_path = cls.get_snapshot_path()
+
+        compiled = snapshot.load_snapshot(snapshot_path)
+        if compiled is not None and compiled.content_hash == content_hash:
+            logger.debug(f"Registra loaded from snapshot {snapshot_path}")
+        elif cls.lazy_load:
+            return cls._load_lazy_registra(registra_files)
+        else:
+            compiled = cls._build_snapshot(registra_files, file_hashes, content_hash)
+            cls._save_snapshot(compiled)
+
+        cls._record_file_states(
+            registra_files,
+            {
+                os.path.join(cls.local_registra_path, rel_path): names
+                for rel_path, names in compiled.sources_by_file.items()
+            },
+        )
+        return compiled.registra
+
+    @classmethod
+    def _load_lazy_registra(cls, registra_files: List[str]) -> LazyRegistra:
+        manifest = build_manifest(registra_files, fallback=cls._parse_registra_file)
+        cls._record_file_states(
+            registra_files,
+            {entry.file_path: [source_name] for source_name, entry in manifest.items()},
+        )
+        logger.debug(f"Registra manifest of {len(manifest)} sources built, parsing lazily")
+        return LazyRegistra(manifest, parse_file=cls._parse_registra_file)
+
+    @classmethod
+    def set_lazy_load(cls, lazy_load: bool = True) -> None:
+        """
+        only parse the yaml file of a source when the source is first looked up,
+        for jobs working on a handful of sources out of a large registra
+        """
+        cls.lazy_load = lazy_load
+
+    @classmethod
+    def reload_registra(cls, sync: bool = False) -> RegistraReloadReport:
+        """
+        bring the loaded registra up to date with the yaml files, only the files
+        added or changed since the last (re)load are parsed again, and only the
+        sources declared in them are replaced
+
+        Files are compared by size and mtime, or by S3 ETag for files synced from s3.
+
+        :param sync: sync the registra from s3 first, regardless of `registra_sync_ttl`
+        """
+        if sync and cls.registra_search_path is not None:
+            cls.set_registra_search_path(cls.registra_search_path, force_sync=True)
+
+        if cls._registra is None:
+            cls._registra = cls.load_registra()
+            return RegistraReloadReport(
+                added_files=sorted(cls._registra_file_states),
+                updated_sources=sorted(cls._registra),
+            )
+
+        registra_files = cls._discover_registra_files()
+        previous = cls._registra_file_states
+        fingerprints = {path: cls._file_fingerprint(path) for path in registra_files}
+
+        report = RegistraReloadReport(
+            added_files=[path for path in registra_files if path not in previous],
+            changed_files=[
+                path
+                for path in registra_files
+                if path in previous and previous[path].fingerprint != fingerprints[path]
+            ],
+            removed_files=sorted(set(previous) - set(fingerprints)),
+        )
+        if not report.has_changes:
+            logger.debug("Registra is up to date, nothing to reload. ")
+            return report
+
+        stale_files = set(report.changed_files) | set(report.removed_files)
+        dropped_sources = set()
+        for path in stale_files:
+            for source_name in previous[path].sources:
+                if isinstance(cls._registra, LazyRegistra):
+                    # popping a pending source parses its file, which may be gone
+                    cls._registra.discard(source_name)
+                else:
+                    cls._registra.pop(source_name, None)
+                dropped_sources.add(source_name)
+
+        states = {path: state for path, state in previous.items() if path not in stale_files}
+        source_files = {name: path for path, state in states.items() for name in state.sources}
+
+        files_to_parse = report.added_files + report.changed_files
+        for path, current_parsed_result in zip(
+            files_to_parse, cls._parse_registra_files_results(files_to_parse)
+        ):
+            source_name = current_parsed_result.source_name.lower()
+            assert source_name not in source_files, (
+                f"Detected duplicated source name `{current_parsed_result.source_name}` "
+                f"in yaml file `{os.path.basename(path)}`, the same cluster name has been "
+                f"registered by another yaml file. Please check. "
+            )
+            source_files[source_name] = path
+            states[path] = RegistraFileState(fingerprint=fingerprints[path], sources=[source_name])
+
+            if current_parsed_result.is_active:
+                cls._registra[source_name] = current_parsed_result
+                report.updated_sources.append(source_name)
+
+        cls._registra_file_states = states
+        cls._registra_index = None
+        report.removed_sources = sorted(dropped_sources - set(report.updated_sources))
+        report.updated_sources.sort()
+
+        # a lazy registra is not fully parsed, snapshotting it would parse every file
+        if cls.use_snapshot and not isinstance(cls._registra, LazyRegistra):
+            file_hashes = snapshot.compute_file_hashes(cls.local_registra_path, registra_files)
+            cls._save_snapshot(
+                snapshot.RegistraSnapshot(
+                    content_hash=cls._compute_content_hash(file_hashes),
+                    registra=dict(cls._registra),
+                    file_hashes=file_hashes,
+                    sources_by_file={
+                        os.path.relpath(path, cls.local_registra_path).replace(os.sep, "/"): state.sources
+                        for path, state in states.items()
+                    },
+                )
+            )
+
+        logger.info(
+            f"Registra reloaded, {len(report.added_files)} files added, {len(report.changed_files)} changed, "
+            f"{len(report.removed_files)} removed. Updated sources: {report.updated_sources}, "
+            f"removed sources: {report.removed_sources}"
+        )
+        return report
+
+    @classmethod
+    def _record_file_states(
+        cls, registra_files: List[str], sources_by_file: Dict[str, List[str]]
+    ) -> None:
+        cls._registra_file_states = {
+            path: RegistraFileState(
+                fingerprint=cls._file_fingerprint(path),
+                sources=sources_by_file.get(path, []),
+            )
+            for path in registra_files
+        }
+
+    @classmethod
+    def _file_fingerprint(cls, file_path: str) -> Tuple:
+        etag = cls._synced_etags.get(file_path)
+        if etag is not None:
+            return ("etag", etag)
+        stat = os.stat(file_path)
+        return ("stat", stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def _save_snapshot(cls, compiled: snapshot.RegistraSnapshot) -> None:
+        snapshot_path = cls.get_snapshot_path()
+        try:
+            snapshot.save_snapshot(compiled, snapshot_path)
+        except OSError as e:
+            logger.warning(f"Unable to save the registra snapshot in {snapshot_path}: {e}")
+
+    @classmethod
+    def compile_registra(cls, snapshot_path: Optional[str] = None) -> snapshot.RegistraSnapshot:
+        """parse the whole registra and write the snapshot, regardless of an existing one"""
+        registra_files = cls._discover_registra_files()
+        file_hashes = snapshot.compute_file_hashes(cls.local_registra_path, registra_files)
+        compiled = cls._build_snapshot(
+            registra_files, file_hashes, cls._compute_content_hash(file_hashes)
+        )
+        snapshot.save_snapshot(compiled, snapshot_path or cls.get_snapshot_path())
+        return compiled
+
+    @classmethod
+    def get_snapshot_path(cls) -> str:
+        """
+        the snapshot sits next to the registra folder rather than inside it,
+        so syncing the folder from s3 (with delete) leaves it untouched
+        """
+        if cls.registra_snapshot_path:
+            return cls.registra_snapshot_path
+        return os.path.normpath(cls.local_registra_path) + ".snapshot.pkl"
 
+    @classmethod
+    def _compute_content_hash(cls, file_hashes: Dict[str, str]) -> str:
+        """content hash of the snapshot, covering the files and the parsers they are parsed with"""
+        return snapshot.compute_content_hash(file_hashes, cls.get_registra_parsers())
+
+    @classmethod
+    def _build_snapshot(
+        cls, registra_files: List[str], file_hashes: Dict[str, str], content_hash: str
+    ) -> snapshot.RegistraSnapshot:
+        registra_result, sources_by_file = cls._parse_registra_files(registra_files)
+        return snapshot.RegistraSnapshot(
+            content_hash=content_hash,
+            registra=registra_result,
+            file_hashes=file_hashes,
+            sources_by_file={
+                os.path.relpath(path, cls.local_registra_path).replace(os.sep, "/"): names
+                for path, names in sources_by_file.items()
+            },
+        )
+
+    @classmethod
+    def _discover_registra_files(cls) -> List[str]:
+        """paths of all registra yaml files, in a stable order"""
         cls.registra_module_path = cls._discover_registra_module_path(
             cls.local_registra_path
         )
 
-        registra_result = defaultdict(str)
-
-        for subfolder in cls.registra_module_path:
+        result = []
+        for subfolder in sorted(cls.registra_module_path):
             module_path = os.path.join(cls.local_registra_path, subfolder)
             logger.debug(f"Currently reading registra files from: {module_path}")
 
-            raw_yamls = os.listdir(module_path)
-            for item in raw_yamls:
-                if utils.is_yaml_file(item):
-                    yaml_raw_text = cls._load_yaml_resource(
-                        file_path=os.path.join(module_path, item)
-                    )
-
-                    try:
-                        registra_type = yaml_raw_text["registra_type"]
-                    except KeyError:
-                        logger.error(
-                            f"Unable to find registra_type in the file {item}, please check "
-                            f"that each yaml file contains the field registra_type so the parser know"
-                            f"which template to use. "
-                        )
-                        sys.exit(1)
-
-                    current_parser = cls.registra_parsers.get(registra_type)
-
-                    assert current_parser is not None, (
-                        f"Unable to determine the Registra parser with the given "
-                        f"Registra Type: {registra_type}"
-                    )
-
-                    current_parsed_result = current_parser(
-                        file_name=item, raw_yaml_dict=yaml_raw_text
-                    ).parse()
-
-                    try:
-                        assert (
-                            registra_result.get(current_parsed_result.source_name)
-                            is None
-                        ), (
-                            f"Detected duplicated source name `{current_parsed_result.source_name}` "
-                            f"in yaml file `{item}`, the same cluster name has been registered by another yaml file. "
-                            f"Please check. "
-                        )
+            for item in sorted(os.listdir(module_path)):
+                if is_yaml_file(item):
+                    result.append(os.path.join(module_path, item))
 
-                        # if the source registra is marked as inactive, we will skip the loading
-                        if current_parsed_result.is_active:
-                            # we use lower throughout in the registra keys so its easier to search
-                            registra_result[
-                                current_parsed_result.source_name.lower()
-                            ] = current_parsed_result
-                    except KeyError:
-                        logger.error(
-                            f"`{item}` yaml file seems to be malformed. Please verify. "
-                        )
-                        utils.log_full_traceback(logger)
-                        sys.exit(1)
+        return result
+
+    @classmethod
+    def _parse_registra_files(
+        cls, registra_files: List[str]
+    ) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+        """
+        :return: the registra, keyed by lower case source name, and the
+                source names found in each file
+        """
+        registra_result = defaultdict(str)
+        sources_by_file = {}
+
+        # results are merged in file order, so duplicated sources are reported
+        # against the same file whether the parsing ran in parallel or not
+        for file_path, current_parsed_result in zip(
+            registra_files, cls._parse_registra_files_results(registra_files)
+        ):
+            item = os.path.basename(file_path)
+
+            try:
+                assert (
+                    registra_result.get(current_parsed_result.source_name.lower())
+                    is None
+                ), (
+                    f"Detected duplicated source name `{current_parsed_result.source_name}` "
+                    f"in yaml file `{item}`, the same cluster name has been registered by another yaml file. "
+                    f"Please check. "
+                )
+
+                sources_by_file[file_path] = [current_parsed_result.source_name.lower()]
+
+                # if the source registra is marked as inactive, we will skip the loading
+                if current_parsed_result.is_active:
+                    # we use lower throughout in the registra keys so its easier to search
+                    registra_result[
+                        current_parsed_result.source_name.lower()
+                    ] = current_parsed_result
+            except KeyError:
+                logger.error(
+                    f"`{item}` yaml file seems to be malformed. Please verify. "
+                )
+                log_full_traceback(logger)
+                sys.exit(1)
 
-        return registra_result
+        return registra_result, sources_by_file
+
+    @classmethod
+    def _parse_registra_files_results(cls, registra_files: List[str]) -> Iterable[Any]:
+        """parsed result of each file, in the same order as the files"""
+        workers = cls.parallel_load_workers
+        if not workers or workers < 2 or len(registra_files) < cls.parallel_load_min_files:
+            return map(cls._parse_registra_file, registra_files)
+
+        logger.debug(f"Parsing {len(registra_files)} registra files with {workers} processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    partial(
+                        parse_registra_file,
+                        registra_parsers=cls.get_registra_parsers(),
+                        parse_cache=cls.get_parse_cache(),
+                    ),
+                    registra_files,
+                    chunksize=max(1, len(registra_files) // (workers * 4)),
+                )
+            )
+
+    @classmethod
+    def set_parallel_load(cls, workers: Optional[int] = None) -> None:
+        """
+        enable parsing on a process pool, `workers` defaults to the number of cores.
+        Parsers need to be importable by the worker processes.
+        """
+        cls.parallel_load_workers = workers or os.cpu_count()
+
+    @classmethod
+    def _parse_registra_file(cls, file_path: str):
+        return parse_registra_file(
+            file_path, cls.get_registra_parsers(), parse_cache=cls.get_parse_cache()
+        )
 
     @staticmethod
     def _discover_registra_module_path(local_registra_path: str) -> List[str]:
@@ -135,33 +557,51 @@ class RegistraManager(metaclass=RegistraManagerMeta):
         return result
 
     @classmethod
-    def set_registra_search_path(cls, prefix: str):
-        """set the registra path searched by xenpy.
+    def set_registra_search_path(cls, prefix: str, force_sync: bool = False):
+        """set the registra path searched by shadowtool.
         If not provided, it will sync and look for the registra files
+
+        A prefix synced less than `registra_sync_ttl` seconds ago is not synced again,
+        unless `force_sync` is set. Only new or changed files are downloaded.
         """
-        if settings.REGISTRA_PATH is None:
-            logger.info(
-                "REGISTRA PATH is not explicitly configured. Using default and actively synced for "
-                "every execution. "
-            )
+        registra_path = os.getenv(config.ST__REGISTRA_PATH)
+        if registra_path is None:
             local_registra_path = os.path.join(
                 constants.TEMP_FOLDER_DIRECTORY,
                 "registra",
                 prefix,
             )
-            registra_bucket = S3Hook(constants.REGISTRA_S3_BUCKET_NAME)
+            last_synced_at = cls._last_synced_at.get(prefix)
+            if (
+                force_sync
+                or last_synced_at is None
+                or time.monotonic() - last_synced_at > cls.registra_sync_ttl
+            ):
+                logger.info(
+                    "REGISTRA PATH is not explicitly configured. Using default and actively synced for "
+                    "every execution. "
+                )
+                registra_bucket = S3Hook(
+                    bucket_name=os.getenv(config.ST__REGISTRA_S3_BUCKET_NAME)
+                )
 
-            registra_bucket.bulk_download_files(
-                s3_prefix=prefix,
-                local_path=local_registra_path,
-            )
-            logger.info(f"Registra synced from s3 bucket into {local_registra_path}")
+                sync_report = registra_bucket.bulk_download_files(
+                    s3_prefix=prefix,
+                    local_path=local_registra_path,
+                )
+                cls._synced_etags = {
+                    os.path.join(local_registra_path, *rel_path.split("/")): etag
+                    for rel_path, etag in sync_report.source_etags.items()
+                }
+                cls._last_synced_at = {**cls._last_synced_at, prefix: time.monotonic()}
+                logger.info(f"Registra synced from s3 bucket into {local_registra_path}")
         else:
-            local_registra_path = os.path.join(settings.REGISTRA_PATH, prefix)
+            local_registra_path = os.path.join(registra_path, prefix)
             logger.info(
                 f"REGISTRA PATH is explicitly configured. Locating REGISTRA files in path {local_registra_path}"
             )
 
+        cls.registra_search_path = prefix
         cls.local_registra_path = local_registra_path
 
     @classmethod
@@ -177,17 +617,7 @@ class RegistraManager(metaclass=RegistraManagerMeta):
 
     @staticmethod
     def _load_yaml_resource(file_path: str):
-        try:
-            with open(file_path, "r") as f:
-                raw_yaml_text = f.read()
-            return yaml.safe_load(raw_yaml_text)
-        except (yaml.parser.ParserError, yaml.scanner.ScannerError):
-            logger.error(
-                f"The yaml file seems to be malformed. Please verify."
-                f"Location: {file_path} "
-            )
-            utils.log_full_traceback(logger)
-            sys.exit(1)
+        return load_yaml_resource(file_path)
 
     @classmethod
     def has_table(cls, source_name: str, db_name: str, table_name: str) -> bool:
@@ -195,20 +625,18 @@ class RegistraManager(metaclass=RegistraManagerMeta):
             f"Cluster name `{source_name}` and DB name `{db_name}` "
             f"not found when checking table_name"
         )
-        return (
-            table_name in cls.registra[source_name].data_config[db_name].tables.keys()
-        )
+        return cls.registra_index.get_table(source_name, db_name, table_name) is not None
 
     @classmethod
     def has_db(cls, source_name: str, db_name: str) -> bool:
         assert cls.has_source(
             source_name
         ), f"Cluster name `{source_name}` not found when checking for {db_name}"
-        return db_name in cls._get_all_db_names_by_source_name(source_name)
+        return cls.registra_index.get_db(source_name, db_name) is not None
 
     @classmethod
     def has_source(cls, source_name: str) -> bool:
-        return source_name in cls.registra.keys()
+        return source_name in cls.registra
 
     @classmethod
     def check_source_type(cls, source_name: str, source_type: models.SourceType):
@@ -223,12 +651,15 @@ class RegistraManager(metaclass=RegistraManagerMeta):
     def get_tbl_registra(
         cls, source_name: str, db_name: str, table_name: str
     ) -> Optional[models.BaseTableRegistraTemplate]:
+        tbl_registra = cls.registra_index.get_table(source_name, db_name, table_name)
+        if tbl_registra is not None:
+            return tbl_registra
+
+        # not found, go through the checks to report which level is missing
         try:
-            if cls.has_table(
+            if not cls.has_table(
                 source_name=source_name, db_name=db_name, table_name=table_name
             ):
-                return cls.registra[source_name].data_config[db_name].tables[table_name]
-            else:
                 logger.warning(
                     f"No table registra can be found for `{source_name}.{db_name}.{table_name}`. "
                     f"Please register it or check the registra file. "
@@ -251,7 +682,7 @@ class RegistraManager(metaclass=RegistraManagerMeta):
         cls, source_name: str, db_name: str
     ) -> Optional[models.DBRegistra]:
         if cls.has_db(source_name=source_name, db_name=db_name):
-            return cls.registra[source_name].data_config[db_name]
+            return cls.registra_index.get_db(source_name, db_name)
 
     @classmethod
     def get_all_available_registra_tasks(
@@ -259,9 +690,9 @@ class RegistraManager(metaclass=RegistraManagerMeta):
         source_name: Optional[str] = None,
         db_name: Optional[str] = None,
         tbl_name: Optional[str] = None,
-    ) -> List[models.RegistraTask]:
+    ) -> Tuple[models.RegistraTask, ...]:
         """
-        get a list of registra tasks that fits the filtering logic,
+        get a tuple of registra tasks that fits the filtering logic,
         templated notebooks / airflow operators could be generated based on these
 
         It is simply a dataclass that contains the three identifiers,
@@ -274,49 +705,30 @@ class RegistraManager(metaclass=RegistraManagerMeta):
                 a list that belongs to the same db, same source
             when only source name is provided, the tbl registra should return everything under it
             when none is provided, it returns all loaded registra
-        """
-        if source_name is None:
-            target_source_names = cls._get_all_source_names()
-        else:
-            target_source_names = [source_name]
-
-        result = []
-        for s in target_source_names:
-
-            target_db_names = [db_name]
-
-            if db_name is None:
-                target_db_names = cls._get_all_db_names_by_source_name(s)
 
-            for d in target_db_names:
-
-                target_tbl_names = [tbl_name]
-
-                if tbl_name is None:
-
-                    target_tbl_names = cls._get_all_tbl_names_by_db_name(
-                        source_name=s, db_name=d
-                    )
-
-                for t in target_tbl_names:
-
-                    result.append(
-                        models.RegistraTask(source_name=s, db_name=d, tbl_name=t)
-                    )
+        Results are precomputed by the registra index and shared between calls,
+        hence returned as immutable tuples.
+        """
+        if source_name is not None and db_name is None:
+            assert cls.has_source(
+                source_name
+            ), f"Unable to find {source_name} when searching for db names"
 
-        return result
+        return cls.registra_index.get_tasks(
+            source_name=source_name, db_name=db_name, tbl_name=tbl_name
+        )
 
     @classmethod
     def _get_all_tbl_names_by_db_name(cls, source_name, db_name):
-        return cls.registra[source_name].data_config[db_name].tables.keys()
+        return cls.registra_index.get_tbl_names(source_name, db_name)
 
     @classmethod
     def _get_all_db_names_by_source_name(cls, source_name):
         assert cls.has_source(
             source_name
         ), f"Unable to find {source_name} when searching for db names"
-        return cls.registra[source_name].data_config.keys()
+        return cls.registra_index.get_db_names(source_name)
 
     @classmethod
     def _get_all_source_names(cls):
-        return cls.registra.keys()
+        return cls.registra_index.source_names
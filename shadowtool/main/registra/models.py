@@ -1,6 +1,16 @@
-from typing import Dict, Optional, List, Union, Any
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional, List, Union, Any
 from pydantic import BaseModel, root_validator
-from shadowtool.interfaces.base_model import BaseType
+from shadowtool.interfaces.models import BaseType
+
+
+@lru_cache(maxsize=None)
+def get_field_aliases(model_cls) -> FrozenSet[str]:
+    """aliases of the declared fields of the model, except `extra`, computed once per class"""
+    return frozenset(
+        field.alias for field in model_cls.__fields__.values() if field.alias != "extra"
+    )
 
 
 class PydanticBaseModelWithExtra(BaseModel):
@@ -12,17 +22,14 @@ class PydanticBaseModelWithExtra(BaseModel):
         accept the additional arguments passed into the model as a dictionary,
         accessible with the name `extra`
         """
-        all_required_field_names = {
-            field.alias for field in cls.__fields__.values() if field.alias != "extra"
-        }
+        return cls._split_extra(values)
 
-        extra: Dict[str, Any] = {}
-        for field_name in list(values):
-            if field_name not in all_required_field_names:
-                extra[field_name] = values.pop(field_name)
-
-        values["extra"] = extra
-        return values
+    @classmethod
+    def _split_extra(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        field_aliases = get_field_aliases(cls)
+        result = {k: v for k, v in values.items() if k in field_aliases}
+        result["extra"] = {k: v for k, v in values.items() if k not in field_aliases}
+        return result
 
 
 class BaseRegistraType(BaseType):
@@ -33,3 +40,54 @@ class BaseRegistraType(BaseType):
     One should use this as the base class to include other Registra Types
     """
     ...
+
+
+class SourceType(BaseType):
+
+    """type of the system a source is extracted from, matches the connector family"""
+
+    DATABASE = "DATABASE"
+    THIRD_PARTY = "THIRD_PARTY"
+    FILE = "FILE"
+
+
+class BaseTableRegistraTemplate(PydanticBaseModelWithExtra):
+
+    """
+    table level registra, the fields override the arguments of the connector
+
+    Unknown fields are kept in `extra`
+    """
+
+    etl_mode: Optional[str] = None
+    data_format: Optional[str] = None
+    team: Optional[str] = None
+    tbl_name_alias: Optional[str] = None
+    upsert_key: Optional[List[str]] = None
+    run_quality_check: Optional[bool] = None
+    dqc_key: Optional[str] = None
+
+
+class DBRegistra(BaseModel):
+
+    tables: Dict[str, BaseTableRegistraTemplate] = {}
+
+
+class ReplicationSourceRegistra(BaseModel):
+
+    """source level registra, the parsed result of one registra yaml file"""
+
+    source_name: str
+    source_type: SourceType
+    is_active: bool = True
+    data_config: Dict[str, DBRegistra] = {}
+
+
+@dataclass(frozen=True)
+class RegistraTask:
+
+    """identifies a single table registered in the registra"""
+
+    source_name: str
+    db_name: str
+    tbl_name: str
@@ -0,0 +1,104 @@
+"""
+On-disk cache of parsed registra files.
+
+Each entry is keyed by the content hash of a yaml file and records the parser that
+produced it along with the parser version. An entry is only used while the parser
+registered for its registra type has the same identity and version, so bumping the
+version of a parser invalidates the entries of that parser and no other.
+"""
+import logging
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Type
+
+from shadowtool.main.registra.parsers import BaseRegistraParser, registra_type_key
+
+logger = logging.getLogger(__name__)
+
+# bump when the layout of the entries changes
+PARSE_CACHE_FORMAT_VERSION = 1
+
+
+@dataclass
+class ParseCacheEntry:
+
+    registra_type: str
+    parser: str
+    parser_version: str
+    result: Any
+    format_version: int = PARSE_CACHE_FORMAT_VERSION
+
+
+@dataclass
+class ParseResultCache:
+
+    cache_dir: str
+
+    def get(
+        self, content_hash: str, registra_parsers: Dict[str, Type[BaseRegistraParser]]
+    ) -> Optional[Any]:
+        """the cached result of the content, None when missing or produced by another parser version"""
+        try:
+            with open(self._entry_path(content_hash), "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable parse cache entry {content_hash}: {e}")
+            return None
+
+        if (
+            not isinstance(entry, ParseCacheEntry)
+            or entry.format_version != PARSE_CACHE_FORMAT_VERSION
+        ):
+            return None
+
+        parser_cls = registra_parsers.get(entry.registra_type)
+        if (
+            parser_cls is None
+            or parser_cls.identity() != entry.parser
+            or parser_cls.version != entry.parser_version
+        ):
+            return None
+
+        return entry.result
+
+    def set(
+        self,
+        content_hash: str,
+        registra_type: str,
+        parser_cls: Type[BaseRegistraParser],
+        result: Any,
+    ) -> None:
+        entry = ParseCacheEntry(
+            registra_type=registra_type_key(registra_type),
+            parser=parser_cls.identity(),
+            parser_version=parser_cls.version,
+            result=result,
+        )
+        path = self._entry_path(content_hash)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # write then rename, processes of a pool may write the same entry
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"Unable to write the parse cache entry {path}: {e}")
+
+    def clear(self) -> None:
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".pkl"):
+                    os.remove(os.path.join(root, file))
+
+    def _entry_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.pkl")
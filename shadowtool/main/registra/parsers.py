@@ -1,15 +1,140 @@
+import logging
+import threading
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Dict, Optional, List, Union, Any
+from typing import Callable, ClassVar, Dict, Optional, List, Type, Union, Any
+
+import shadowtool.main.registra.models as models
+
+logger = logging.getLogger(__name__)
+
+# entry point group under which packages expose their registra parsers, e.g.
+#   [tool.poetry.plugins."shadowtool.registra_parsers"]
+#   REPLICATION = "my_package.parsers:ReplicationParser"
+PARSER_ENTRY_POINT_GROUP = "shadowtool.registra_parsers"
 
 
 @dataclass
 class BaseRegistraParser(ABC):
 
+    """
+    parse the yaml content of one registra file
+
+    Parsed results are cached by file content and `version`, bump the version
+    whenever a change of the parser changes its output for the same file.
+    """
+
+    version: ClassVar[str] = "1"
+
     file_name: str
     raw_yaml_dict: Dict[str, Any]
 
     @abstractmethod
-    def parse(self) -> models.BaseTableRegistraTemplate:
-        """return the parsed object of table level registra"""
+    def parse(self) -> models.ReplicationSourceRegistra:
+        """return the parsed object of source level registra"""
         ...
+
+    @classmethod
+    def identity(cls) -> str:
+        return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def registra_type_key(registra_type: Union[models.BaseRegistraType, str]) -> str:
+    """registra types are matched by value, so plain strings read from yaml work as keys"""
+    return getattr(registra_type, "value", registra_type)
+
+
+class RegistraParserRegistry:
+
+    """
+    registra type -> parser class
+
+    Parsers are registered explicitly with `register`, or discovered from the
+    `shadowtool.registra_parsers` entry points the first time the registry is read.
+    Explicit registrations take precedence over entry points.
+    """
+
+    def __init__(self, entry_point_group: str = PARSER_ENTRY_POINT_GROUP):
+        self.entry_point_group = entry_point_group
+        self._parsers: Dict[str, Type[BaseRegistraParser]] = {}
+        self._entry_points_loaded = False
+        self._lock = threading.RLock()
+
+    def register(
+        self,
+        registra_type: Union[models.BaseRegistraType, str],
+        parser_cls: Optional[Type[BaseRegistraParser]] = None,
+    ) -> Union[Type[BaseRegistraParser], Callable]:
+        """register a parser, usable as a class decorator when `parser_cls` is omitted"""
+        if parser_cls is None:
+            return lambda cls: self.register(registra_type, cls)
+
+        key = registra_type_key(registra_type)
+        with self._lock:
+            existing = self._parsers.get(key)
+            if existing is not None and existing is not parser_cls:
+                logger.warning(
+                    f"Registra parser of type {key} {existing.identity()} "
+                    f"is replaced by {parser_cls.identity()}"
+                )
+            self._parsers[key] = parser_cls
+        return parser_cls
+
+    def unregister(self, registra_type: Union[models.BaseRegistraType, str]) -> None:
+        with self._lock:
+            self._parsers.pop(registra_type_key(registra_type), None)
+
+    def get(
+        self, registra_type: Union[models.BaseRegistraType, str]
+    ) -> Optional[Type[BaseRegistraParser]]:
+        self.load_entry_points()
+        return self._parsers.get(registra_type_key(registra_type))
+
+    def as_mapping(self) -> Dict[str, Type[BaseRegistraParser]]:
+        self.load_entry_points()
+        with self._lock:
+            return dict(self._parsers)
+
+    def load_entry_points(self, force: bool = False) -> None:
+        if self._entry_points_loaded and not force:
+            return
+
+        with self._lock:
+            if self._entry_points_loaded and not force:
+                return
+            for entry_point in _iter_entry_points(self.entry_point_group):
+                try:
+                    parser_cls = entry_point.load()
+                except Exception as e:
+                    logger.warning(
+                        f"Unable to load the registra parser entry point {entry_point.name}: {e}"
+                    )
+                    continue
+                # explicit registrations win over entry points
+                self._parsers.setdefault(entry_point.name, parser_cls)
+                logger.debug(f"Registra parser {entry_point.name} loaded from entry points")
+            self._entry_points_loaded = True
+
+
+def _iter_entry_points(group: str) -> List[Any]:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # python < 3.8
+        import pkg_resources
+
+        return list(pkg_resources.iter_entry_points(group))
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+registry = RegistraParserRegistry()
+
+
+def register_parser(
+    registra_type: Union[models.BaseRegistraType, str],
+    parser_cls: Optional[Type[BaseRegistraParser]] = None,
+):
+    return registry.register(registra_type, parser_cls)
@@ -0,0 +1,110 @@
+"""
+Compiled registra snapshot.
+
+Parsing and validating every registra yaml file on each process start is slow, so the
+parsed registra is pickled into a single snapshot file, keyed by a content hash of all
+the yaml files. The snapshot is reused as long as the hash matches, and rebuilt otherwise.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Type
+
+from shadowtool.__version__ import VERSION
+from shadowtool.main.registra.parsers import BaseRegistraParser, registra_type_key
+
+logger = logging.getLogger(__name__)
+
+# bump when the layout of the snapshot changes
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+@dataclass
+class RegistraSnapshot:
+
+    content_hash: str
+    registra: Dict[str, Any]
+    # relative file path -> sha256 of the file content
+    file_hashes: Dict[str, str] = field(default_factory=dict)
+    # relative file path -> source names declared in the file
+    sources_by_file: Dict[str, List[str]] = field(default_factory=dict)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    format_version: int = SNAPSHOT_FORMAT_VERSION
+    shadowtool_version: str = VERSION
+
+
+def file_sha256(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compute_file_hashes(root_path: str, file_paths: List[str]) -> Dict[str, str]:
+    """relative path -> content hash, for every given file"""
+    return {
+        os.path.relpath(path, root_path).replace(os.sep, "/"): file_sha256(path)
+        for path in file_paths
+    }
+
+
+def compute_content_hash(
+    file_hashes: Dict[str, str],
+    registra_parsers: Optional[Dict[Any, Type[BaseRegistraParser]]] = None,
+) -> str:
+    """
+    a single hash over all the registra files, a renamed, added or removed file
+    changes the hash as well as an edited one
+
+    :param registra_parsers: registra type -> parser, the identity and version of each
+        parser is part of the hash, so swapping or bumping a parser rebuilds the snapshot
+    """
+    digest = hashlib.sha256(f"{SNAPSHOT_FORMAT_VERSION}:{VERSION}".encode())
+    parser_versions = {
+        registra_type_key(registra_type): f"{parser.identity()}:{parser.version}"
+        for registra_type, parser in (registra_parsers or {}).items()
+    }
+    for registra_type in sorted(parser_versions):
+        digest.update(f"\0{registra_type}\0{parser_versions[registra_type]}".encode())
+    for rel_path in sorted(file_hashes):
+        digest.update(f"\0{rel_path}\0{file_hashes[rel_path]}".encode())
+    return digest.hexdigest()
+
+
+def save_snapshot(snapshot: RegistraSnapshot, snapshot_path: str) -> None:
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    os.makedirs(directory, exist_ok=True)
+    # write then rename, so concurrent processes never read a partial snapshot
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    logger.debug(f"Registra snapshot {snapshot.content_hash} saved in {snapshot_path}")
+
+
+def load_snapshot(snapshot_path: str) -> Optional[RegistraSnapshot]:
+    """load the snapshot, None if it's missing, unreadable or of another format"""
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # e.g. a model class changed or was removed since the snapshot was written
+        logger.warning(f"Ignoring unreadable registra snapshot {snapshot_path}: {e}")
+        return None
+
+    if (
+        not isinstance(snapshot, RegistraSnapshot)
+        or snapshot.format_version != SNAPSHOT_FORMAT_VERSION
+    ):
+        logger.warning(f"Ignoring registra snapshot {snapshot_path} of an unknown format")
+        return None
+
+    return snapshot
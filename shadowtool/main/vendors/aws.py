@@ -1,42 +1,218 @@
-from typing import Optional, Any
+from typing import Optional, Any, ClassVar, Dict, Iterable, Iterator, List, Tuple
 
 import boto3
 import base64
+import copy
+import hashlib
 import json
-
-from dataclasses import dataclass
-from botocore.exceptions import ClientError
-
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from botocore.exceptions import ClientError, WaiterError
+
+import shadowtool.config as config
+import shadowtool.exceptions as exc
+import shadowtool.main.vendors.aws_clients as aws_clients
 from shadowtool.interfaces.hook import BaseHook
+from shadowtool.main.general.cache_utils import MISSING, EncryptedFileCache, TTLCache
+from shadowtool.main.general.iter_utils import chunked
 from shadowtool.main.general.logging_utils import LoggingMixin
-from shadowtool.main.general.shell_utils import run_commands
+from shadowtool.main.general.retry_utils import exponential_backoff
+from shadowtool.main.vendors.s3_sync import S3SyncEngine, SyncReport, normalise_prefix
 
 
 @dataclass
 class BaseAWSHook(LoggingMixin, BaseHook):
+    """
+    Base class for AWS hooks.
+
+    Clients come from the process-wide registry in `aws_clients`, unless an explicit
+    `session` is given, in which case the hook builds its own clients from it.
+    """
 
     client: Any = None
-    session: boto3.session.Session = boto3.session.Session()
+    session: Optional[boto3.session.Session] = None
+    profile_name: Optional[str] = None
+
+    def _get_client(self, service_name: str, region_name: Optional[str] = None) -> Any:
+        if self.session is not None:
+            return self.session.client(service_name=service_name, region_name=region_name)
+        return aws_clients.get_client(service_name, region_name, self.profile_name)
+
+    def _get_resource(self, service_name: str, region_name: Optional[str] = None) -> Any:
+        if self.session is not None:
+            return self.session.resource(service_name=service_name, region_name=region_name)
+        return aws_clients.get_resource(service_name, region_name, self.profile_name)
 
 
 @dataclass
 class SecretManagerHook(BaseAWSHook):
+    """
+    retrieve secrets from AWS secret manager
+
+    Retrieved secrets are kept in a process-wide cache shared by all hook instances
+    of the same credentials (profile, or access key of an explicit session) and region,
+    for `SECRET_CACHE_TTL` seconds. Short-lived worker processes can additionally share
+    an encrypted on-disk cache by setting `disk_cache_path` (or `ST__SECRET_CACHE_PATH`)
+    and the `ST__SECRET_CACHE_KEY` passphrase.
+    """
 
     region_name: Optional[str] = 'ap-southeast-1'
+    use_cache: bool = True
+    disk_cache_path: Optional[str] = None
+    max_workers: int = 10
+
+    SECRET_CACHE_TTL: ClassVar[int] = 300
+    SECRET_CACHE_MAX_SIZE: ClassVar[int] = 256
+    # max number of ids accepted by a single BatchGetSecretValue call
+    BATCH_GET_SIZE: ClassVar[int] = 20
+
+    _secret_cache: ClassVar[TTLCache] = TTLCache(
+        ttl=SECRET_CACHE_TTL, max_size=SECRET_CACHE_MAX_SIZE
+    )
 
     def __post_init__(self):
-        self.client = self.session.client(service_name="secretsmanager", region_name=self.region_name)
+        self.client = self._get_client("secretsmanager", region_name=self.region_name)
+        self._credentials_scope = self._get_credentials_scope()
+        # BatchGetSecretValue needs its own IAM permission, without it secrets are
+        # fetched one by one
+        self._batch_get_allowed = hasattr(self.client, "batch_get_secret_value")
+
+        self.disk_cache_path = self.disk_cache_path or os.getenv(config.ST__SECRET_CACHE_PATH)
+        self._disk_cache = None
+        if self.use_cache and self.disk_cache_path:
+            passphrase = os.getenv(config.ST__SECRET_CACHE_KEY)
+            if not passphrase:
+                raise ValueError(
+                    f"The on-disk secret cache {self.disk_cache_path} needs the "
+                    f"{config.ST__SECRET_CACHE_KEY} env var to encrypt the secrets. "
+                )
+            self._disk_cache = EncryptedFileCache(
+                path=self.disk_cache_path, passphrase=passphrase, ttl=self.SECRET_CACHE_TTL
+            )
 
-    def get_secret(self, secret_name: str) -> str:
+    def get_secret(self, secret_name: str) -> Any:
         """
         this function will attempt to get secrets from AWS secret manager based on
-        secret name
+        secret name, JSON secrets are returned as a dictionary
 
         It inherits the credential finding strategy as the boto3 library
         """
+        secret = self._get_cached_secret(secret_name)
+        if secret is MISSING:
+            secret = self._parse_secret(self._fetch_secret(secret_name))
+            self._cache_secret(secret_name, secret)
+        return copy.deepcopy(secret)
+
+    def get_secrets(self, secret_names: List[str]) -> Dict[str, Any]:
+        """
+        get multiple secrets at once, cached secrets are served from the cache
+        and the rest are fetched with `BatchGetSecretValue`, or concurrently with
+        `GetSecretValue` when the batch API is not available
+
+        :return: secret name -> secret
+        """
+        result, missing = {}, []
+        for secret_name in dict.fromkeys(secret_names):
+            secret = self._get_cached_secret(secret_name)
+            if secret is MISSING:
+                missing.append(secret_name)
+            else:
+                result[secret_name] = secret
+
+        if missing:
+            fetched = None
+            if self._batch_get_allowed:
+                try:
+                    fetched = self._batch_fetch_secrets(missing)
+                except ClientError as e:
+                    if e.response["Error"]["Code"] != "AccessDeniedException":
+                        raise
+                    self.log.warning(
+                        "Not allowed to call BatchGetSecretValue, fetching the secrets one by one. "
+                    )
+                    self._batch_get_allowed = False
+            if fetched is None:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    fetched = dict(zip(missing, executor.map(self._fetch_secret, missing)))
+
+            for secret_name, response in fetched.items():
+                secret = self._parse_secret(response)
+                self._cache_secret(secret_name, secret)
+                result[secret_name] = secret
+
+        return {secret_name: copy.deepcopy(result[secret_name]) for secret_name in secret_names}
+
+    def invalidate_secret(self, secret_name: str) -> None:
+        """drop the secret from the caches, e.g. after a credential rotation"""
+        self._secret_cache.invalidate(self._cache_key(secret_name))
+        if self._disk_cache is not None:
+            self._disk_cache.invalidate(self._disk_cache_key(secret_name))
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, int]:
+        """hit / miss counters of the process-wide secret cache"""
+        return cls._secret_cache.stats().to_dict()
+
+    @classmethod
+    def configure_cache(cls, ttl: Optional[float] = None, max_size: Optional[int] = None) -> None:
+        """tune the process-wide secret cache, applies to entries stored afterwards"""
+        if ttl is not None:
+            cls._secret_cache.ttl = ttl
+        if max_size is not None:
+            cls._secret_cache.max_size = max_size
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        cls._secret_cache.clear()
+
+    def _get_cached_secret(self, secret_name: str) -> Any:
+        if not self.use_cache:
+            return MISSING
+
+        secret = self._secret_cache.get(self._cache_key(secret_name))
+        if secret is MISSING and self._disk_cache is not None:
+            secret = self._disk_cache.get(self._disk_cache_key(secret_name))
+            if secret is not MISSING:
+                self._secret_cache.set(self._cache_key(secret_name), secret)
+        return secret
+
+    def _cache_secret(self, secret_name: str, secret: Any) -> None:
+        if not self.use_cache:
+            return
+
+        self._secret_cache.set(self._cache_key(secret_name), secret)
+        # binary secrets can't be stored in the JSON based disk cache
+        if self._disk_cache is not None and not isinstance(secret, bytes):
+            self._disk_cache.set(self._disk_cache_key(secret_name), secret)
+
+    def _get_credentials_scope(self) -> str:
+        """
+        identifies the credentials of the hook, so hooks of different accounts never
+        share cached secrets. Access keys are hashed, the disk cache keys are not secret.
+        """
+        if self.session is None:
+            identity = f"profile:{self.profile_name or ''}"
+        else:
+            credentials = self.session.get_credentials()
+            access_key = credentials.access_key if credentials is not None else ""
+            identity = f"session:{self.session.profile_name}:{access_key}"
+        return hashlib.sha256(identity.encode()).hexdigest()[:16]
 
+    def _cache_key(self, secret_name: str) -> Tuple[str, Optional[str], str]:
+        return self._credentials_scope, self.region_name, secret_name
+
+    def _disk_cache_key(self, secret_name: str) -> str:
+        return f"{self._credentials_scope}/{self.region_name}/{secret_name}"
+
+    def _fetch_secret(self, secret_name: str) -> dict:
         try:
-            get_secret_value_response = self.client.get_secret_value(SecretId=secret_name)
+            response = self.client.get_secret_value(SecretId=secret_name)
         except ClientError as e:
             if e.response["Error"]["Code"] == "DecryptionFailureException":
                 # Secrets Manager can't decrypt the protected secret text using the provided KMS key.
@@ -61,12 +237,36 @@ class SecretManagerHook(BaseAWSHook):
             else:
                 raise e
 
+        return response
+
+    def _batch_fetch_secrets(self, secret_names: List[str]) -> Dict[str, dict]:
+        result = {}
+        for batch in chunked(secret_names, self.BATCH_GET_SIZE):
+            response = self.client.batch_get_secret_value(SecretIdList=batch)
+
+            # secret ids could be given as names or ARNs
+            by_id = {}
+            for el in response.get("SecretValues", []):
+                by_id[el["Name"]] = el
+                by_id[el["ARN"]] = el
+
+            for secret_name in batch:
+                if secret_name in by_id:
+                    result[secret_name] = by_id[secret_name]
+                else:
+                    # raise the same error as a single retrieval would
+                    result[secret_name] = self._fetch_secret(secret_name)
+
+        return result
+
+    @staticmethod
+    def _parse_secret(response: dict) -> Any:
         # Decrypts secret using the associated KMS CMK.
         # Depending on whether the secret is a string or binary, one of these fields will be populated.
-        if "SecretString" in get_secret_value_response:
-            secret = get_secret_value_response["SecretString"]
+        if "SecretString" in response:
+            secret = response["SecretString"]
         else:
-            secret = base64.b64decode(get_secret_value_response["SecretBinary"])
+            secret = base64.b64decode(response["SecretBinary"])
 
         try:
             secret_kv = json.loads(secret)
@@ -76,6 +276,35 @@ class SecretManagerHook(BaseAWSHook):
             return secret
 
 
+@dataclass(frozen=True)
+class S3ObjectSummary:
+    """a single entry of a S3 listing"""
+
+    key: str
+    size: int
+    etag: str
+    last_modified: datetime
+
+
+@dataclass
+class S3DeleteReport:
+    """result of a S3 bulk delete"""
+
+    deleted: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.failed
+
+
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
+# marks a fan-out listing worker as finished
+_LISTING_DONE = object()
+
+
 @dataclass
 class S3Hook(BaseAWSHook):
     """
@@ -83,6 +312,13 @@ class S3Hook(BaseAWSHook):
     """
     bucket_name: str = None
 
+    # DeleteObjects errors worth retrying, S3 slows down bursts of deletes on a prefix
+    DELETE_RETRYABLE_ERROR_CODES: ClassVar[frozenset] = frozenset(
+        {"SlowDown", "InternalError", "ServiceUnavailable", "RequestTimeout"}
+    )
+    # attempts per batch of keys before the failed keys are reported
+    DELETE_MAX_ATTEMPTS: ClassVar[int] = 3
+
     def __post_init__(self):
         assert self.bucket_name, "You will need to specify the bucket name to instantiate the S3 Hook. "
         self.log.debug(
@@ -90,11 +326,151 @@ class S3Hook(BaseAWSHook):
             f"check you have valid AWS credentials access in the "
             f"`~/.aws/credentials` file."
         )
-        self.client = boto3.resource("s3")
+        self.client = self._get_resource("s3")
+        self.s3_client = self._get_client("s3")
         self.bucket_obj = self.client.Bucket(self.bucket_name)
 
-    def list_files_in_bucket(self, prefix: str = "") -> list:
-        return [el.key for el in self.bucket_obj.objects.filter(Prefix=prefix)]
+    def list_files_in_bucket(
+        self,
+        prefix: str = "",
+        fan_out_delimiter: Optional[str] = None,
+        max_workers: int = 10,
+    ) -> list:
+        """
+        list all keys under the prefix, see `iter_objects` for the arguments.
+        Prefer `iter_objects` for large prefixes, this holds every key in memory.
+        """
+        return [
+            el.key
+            for el in self.iter_objects(
+                prefix=prefix,
+                fan_out_delimiter=fan_out_delimiter,
+                max_workers=max_workers,
+            )
+        ]
+
+    def iter_objects(
+        self,
+        prefix: str = "",
+        fan_out_delimiter: Optional[str] = None,
+        max_workers: int = 10,
+        page_size: int = 1000,
+    ) -> Iterator[S3ObjectSummary]:
+        """
+        stream the objects under the prefix, one listing page in memory at a time
+
+        :param fan_out_delimiter: when given, the prefix is first split into its sub-prefixes
+                by this delimiter (e.g. one per `dt=` partition), and the sub-prefixes are
+                listed concurrently. Objects are then yielded in no particular order.
+        :param max_workers: number of sub-prefixes listed at the same time in fan-out mode
+        :param page_size: number of keys requested per listing call, at most 1000
+        """
+        if fan_out_delimiter is None:
+            for page in self.iter_object_pages(prefix=prefix, page_size=page_size):
+                yield from page
+            return
+
+        top_level_objects, sub_prefixes = self.list_sub_prefixes(
+            prefix=prefix, delimiter=fan_out_delimiter
+        )
+        self.log.debug(
+            f"Listing {len(sub_prefixes)} sub-prefixes of s3://{self.bucket_name}/{prefix} "
+            f"with {max_workers} workers"
+        )
+        yield from top_level_objects
+        for page in self._iter_object_pages_concurrently(
+            sub_prefixes, max_workers=max_workers, page_size=page_size
+        ):
+            yield from page
+
+    def iter_object_pages(
+        self, prefix: str = "", page_size: int = 1000
+    ) -> Iterator[List[S3ObjectSummary]]:
+        """stream the listing of the prefix page by page"""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket_name,
+            Prefix=prefix,
+            PaginationConfig={"PageSize": page_size},
+        ):
+            yield [self._to_object_summary(obj) for obj in page.get("Contents", [])]
+
+    def list_sub_prefixes(
+        self, prefix: str = "", delimiter: str = "/"
+    ) -> Tuple[List[S3ObjectSummary], List[str]]:
+        """
+        list one level below the prefix
+
+        :return: the objects directly under the prefix, and the sub-prefixes
+        """
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        objects, sub_prefixes = [], []
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix, Delimiter=delimiter
+        ):
+            objects.extend(self._to_object_summary(obj) for obj in page.get("Contents", []))
+            sub_prefixes.extend(el["Prefix"] for el in page.get("CommonPrefixes", []))
+        return objects, sub_prefixes
+
+    def _iter_object_pages_concurrently(
+        self, prefixes: List[str], max_workers: int, page_size: int
+    ) -> Iterator[List[S3ObjectSummary]]:
+        """
+        list the prefixes on a thread pool, pages are handed over through a bounded
+        queue so a slow consumer holds back the workers instead of buffering everything
+        """
+        if not prefixes:
+            return
+
+        pages = queue.Queue(maxsize=max_workers * 2)
+        stopped = threading.Event()
+
+        def put(item) -> bool:
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def list_prefix(sub_prefix: str) -> None:
+            if stopped.is_set():
+                return
+            try:
+                for page in self.iter_object_pages(prefix=sub_prefix, page_size=page_size):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+            put(_LISTING_DONE)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for sub_prefix in prefixes:
+                executor.submit(list_prefix, sub_prefix)
+
+            remaining = len(prefixes)
+            while remaining:
+                item = pages.get()
+                if item is _LISTING_DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopped.set()
+            executor.shutdown(wait=True)
+
+    @staticmethod
+    def _to_object_summary(obj: dict) -> S3ObjectSummary:
+        return S3ObjectSummary(
+            key=obj["Key"],
+            size=obj["Size"],
+            etag=obj.get("ETag", ""),
+            last_modified=obj["LastModified"],
+        )
 
     def download_file(self, target_key: str, target_file_path: str) -> None:
         """
@@ -112,20 +488,30 @@ class S3Hook(BaseAWSHook):
                 raise Exception(f"There is no data stored in s3")
 
     def bulk_download_files(
-        self, s3_prefix: str, local_path: str, quiet: bool = True, delete: bool = True
-    ):
-
-        option_str = ""
-
-        if quiet:
-            option_str += " --quiet "
-
-        if delete:
-            option_str += " --delete "
-
-        run_commands(
-            f"aws s3 sync s3://{self.bucket_name}/{s3_prefix} {local_path} {option_str}"
+        self,
+        s3_prefix: str,
+        local_path: str,
+        quiet: bool = True,
+        delete: bool = True,
+        max_workers: int = 10,
+        compare_etag: bool = False,
+    ) -> SyncReport:
+        """
+        sync all objects under the prefix into the local path, only new or changed
+        objects are transferred
+
+        :param delete: remove local files that no longer exist under the prefix
+        :param max_workers: number of concurrent transfers
+        :param compare_etag: skip newer objects of the same size whose ETag matches
+                the md5 of the local file, at the cost of hashing it
+        :return: a report of the files and bytes moved
+        """
+        report = self._sync_engine(quiet, max_workers, compare_etag).download(
+            s3_prefix=s3_prefix, local_path=local_path, delete=delete
         )
+        if not report.succeeded:
+            raise exc.S3SyncFailure(report)
+        return report
 
     def upload_file(
             self, target_key: str, target_file_path: str = None, target_binary: bytes = None
@@ -148,36 +534,143 @@ class S3Hook(BaseAWSHook):
         if target_file_path:
             data.close()
 
-    def bulk_upload_files(self, s3_prefix: str, local_path: str, quiet: bool = True):
-        option_str = ""
-
-        if quiet:
-            option_str += " --quiet "
+    def bulk_upload_files(
+        self,
+        s3_prefix: str,
+        local_path: str,
+        quiet: bool = True,
+        max_workers: int = 10,
+        compare_etag: bool = False,
+    ) -> SyncReport:
+        """
+        sync all files in the local path into the prefix, only new or changed
+        files are transferred
 
-        run_commands(
-            f"aws s3 sync {local_path} s3://{self.bucket_name}/{s3_prefix} {option_str}"
+        :param compare_etag: skip newer files of the same size whose md5 matches
+                the ETag of the object, at the cost of hashing them
+        """
+        report = self._sync_engine(quiet, max_workers, compare_etag).upload(
+            local_path=local_path, s3_prefix=s3_prefix
+        )
+        if not report.succeeded:
+            raise exc.S3SyncFailure(report)
+        return report
+
+    def _sync_engine(
+        self, quiet: bool, max_workers: int, compare_etag: bool = False
+    ) -> S3SyncEngine:
+        return S3SyncEngine(
+            client=self.s3_client,
+            bucket_name=self.bucket_name,
+            max_workers=max_workers,
+            compare_etag=compare_etag,
+            quiet=quiet,
         )
 
-    def delete_folder(self, s3_prefix: str):
-        run_commands(f"aws s3 rm s3://{self.bucket_name}/{s3_prefix} --recursive")
+    def delete_folder(self, s3_prefix: str, max_workers: int = 10) -> S3DeleteReport:
+        """
+        delete every object in the folder, the prefix is always treated as a folder
+        so `clean/db/tbl` won't touch the sibling `clean/db/tbl_v2`
+        """
+        return self.delete_file(prefix=normalise_prefix(s3_prefix), max_workers=max_workers)
+
+    def delete_file(
+        self, target_key: str = None, prefix: str = None, max_workers: int = 10
+    ) -> S3DeleteReport:
+        """
+        delete file by exact s3 key or s3 prefix
 
-    def delete_file(self, target_key: str = None, prefix: str = None) -> None:
-        """ delete file by exact s3 key or s3 prefix """
+        :raise S3DeleteFailure: when any key could not be deleted
+        """
         if target_key and not prefix:
-            self.client.Object(self.bucket_name, target_key).delete()
+            report = self.bulk_delete([target_key], max_workers=1)
         elif prefix and not target_key:
-            s3_files = self.list_files_in_bucket(prefix=prefix)
-
+            report = self.bulk_delete(
+                (el.key for el in self.iter_objects(prefix=prefix)),
+                max_workers=max_workers,
+            )
             self.log.warning(
-                f"{len(s3_files)} files located in s3, waiting to be deleted. "
+                f"{report.deleted} files deleted from s3://{self.bucket_name}/{prefix}. "
             )
-            for file in s3_files:
-                self.client.Object(self.bucket_name, file).delete()
         else:
             raise Exception(
                 f"You need to provide with either `target_key` or `prefix`, but not both. "
             )
 
+        if not report.succeeded:
+            raise exc.S3DeleteFailure(report)
+        return report
+
+    def bulk_delete(self, keys: Iterable[str], max_workers: int = 10) -> S3DeleteReport:
+        """
+        delete the keys with `DeleteObjects`, 1000 keys per request
+
+        The keys are consumed lazily, so a streamed listing can be passed in directly.
+        Batches are sent concurrently, and per-key failures are collected in the report
+        instead of raising. Throttled batches and keys failing with a retryable error
+        are retried, up to `DELETE_MAX_ATTEMPTS` attempts.
+        """
+        report = S3DeleteReport()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for batch in chunked(keys, DELETE_OBJECTS_BATCH_SIZE):
+                # bound the number of batches held in memory
+                if len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._merge_delete_result(report, *future.result())
+                pending.add(executor.submit(self._delete_batch, batch))
+
+            for future in pending:
+                self._merge_delete_result(report, *future.result())
+
+        return report
+
+    def _delete_batch(self, keys: List[str]) -> Tuple[int, Dict[str, str]]:
+        deleted, failed, retryable = 0, {}, {}
+        for attempt in range(self.DELETE_MAX_ATTEMPTS):
+            if attempt:
+                delay = exponential_backoff(attempt - 1)
+                self.log.debug(f"Retrying the delete of {len(keys)} keys in {delay:.2f}s")
+                time.sleep(delay)
+
+            retryable = {}
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+                )
+            except ClientError as e:
+                errors = {key: str(e) for key in keys}
+                if e.response["Error"]["Code"] in self.DELETE_RETRYABLE_ERROR_CODES:
+                    retryable = errors
+                else:
+                    failed.update(errors)
+            else:
+                errors = response.get("Errors", [])
+                deleted += len(keys) - len(errors)
+                for el in errors:
+                    message = f"{el.get('Code')}: {el.get('Message')}"
+                    if el.get("Code") in self.DELETE_RETRYABLE_ERROR_CODES:
+                        retryable[el["Key"]] = message
+                    else:
+                        failed[el["Key"]] = message
+
+            keys = list(retryable)
+            if not keys:
+                break
+
+        # still failing after the last attempt
+        failed.update(retryable)
+        return deleted, failed
+
+    @staticmethod
+    def _merge_delete_result(
+        report: S3DeleteReport, deleted: int, failed: Dict[str, str]
+    ) -> None:
+        report.deleted += deleted
+        report.failed.update(failed)
+
     def create_file(self, target_key: str, data: bytes):
         """
         create a file directory in the s3 destination
@@ -188,6 +681,16 @@ class S3Hook(BaseAWSHook):
         obj = self.client.Object(self.bucket_name, target_key)
         obj.put(Body=data)
 
+    def read_file(self, target_key: str) -> Optional[bytes]:
+        """content of the object, None when it does not exist"""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=target_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return response["Body"].read()
+
     def update_metadata(self, metadata: dict, s3_key: str) -> None:
         """
         Update the metadata of specified S3 object
@@ -211,33 +714,134 @@ class S3Hook(BaseAWSHook):
         return obj.metadata
 
 
-class ECSHook:
-    def __init__(self, cluster: str):
-        self.client = boto3.client("ecs")
+@dataclass
+class ECSStopReport:
+    """result of stopping the tasks of a family"""
+
+    family_name: str
+    stopped: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    # tasks that did not reach STOPPED in time, only populated when waiting
+    not_stopped: List[str] = field(default_factory=list)
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.failed and not self.not_stopped
+
+
+class ECSHook(LoggingMixin, BaseHook):
+
+    # error codes worth retrying, the ECS API throttles aggressively on bursts
+    RETRYABLE_ERROR_CODES = {
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "RequestLimitExceeded",
+        "ServerException",
+    }
+    # max number of tasks accepted by DescribeTasks, used by the `tasks_stopped` waiter
+    DESCRIBE_TASKS_BATCH_SIZE = 100
+
+    def __init__(
+        self, cluster: str, region_name: Optional[str] = None, profile_name: Optional[str] = None
+    ):
+        self.client = aws_clients.get_client("ecs", region_name, profile_name)
         self.cluster = cluster
 
-    def stop_tasks_by_family(self, family_name: str):
+    def list_task_arns(self, family_name: str, desired_status: str = "RUNNING") -> List[str]:
+        """list all tasks of the family, across every page of the listing"""
+        paginator = self.client.get_paginator("list_tasks")
+        task_arns = []
+        for page in paginator.paginate(
+            cluster=self.cluster, family=family_name, desiredStatus=desired_status
+        ):
+            task_arns.extend(page["taskArns"])
+        return task_arns
+
+    def stop_tasks_by_family(
+        self,
+        family_name: str,
+        reason: Optional[str] = None,
+        max_workers: int = 10,
+        max_attempts: int = 5,
+        wait: bool = False,
+        waiter_delay: int = 6,
+        waiter_max_attempts: int = 100,
+    ) -> ECSStopReport:
         """
         stop RUNNING ECS task(s) based on their Task definition name
 
-        This omits quite a lot customization
+        The tasks are stopped concurrently, throttled calls are retried with backoff.
+
+        :param reason: reason shown in the ECS console for the stopped tasks
+        :param max_workers: number of concurrent `StopTask` calls
+        :param max_attempts: attempts per task before it's reported as failed
+        :param wait: block until all stopped tasks reached the STOPPED status
+        :param waiter_delay: seconds between two polls of the `tasks_stopped` waiter
+        :param waiter_max_attempts: polls of the `tasks_stopped` waiter before giving up
         """
-        response = self.client.list_tasks(
-            cluster=self.cluster, family=family_name, desiredStatus="RUNNING"
+        task_arns = self.list_task_arns(family_name)
+        report = ECSStopReport(family_name=family_name)
+        self.log.info(f"{len(task_arns)} RUNNING tasks found for family {family_name}. ")
+
+        if task_arns:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self._stop_task, task_arn, reason, max_attempts): task_arn
+                    for task_arn in task_arns
+                }
+                for future, task_arn in futures.items():
+                    try:
+                        future.result()
+                        report.stopped.append(task_arn)
+                    except Exception as e:
+                        report.failed[task_arn] = str(e)
+
+        if wait and report.stopped:
+            self._wait_tasks_stopped(report, waiter_delay, waiter_max_attempts)
+
+        self.log.info(
+            f"Stopped {len(report.stopped)} tasks of family {family_name}, "
+            f"{len(report.failed)} failed, {len(report.not_stopped)} not STOPPED in time. "
         )
+        return report
 
-        assert (
-            response["ResponseMetadata"]["HTTPStatusCode"] == 200
-        ), f"Non 200 status code while listing tasks"
-
-        tasks = response["taskArns"]
-
-        counter = 0
-        if len(tasks):
-            for task in tasks:
-                response = self.client.stop_task(cluster=self.cluster, task=task)
+    def _stop_task(self, task_arn: str, reason: Optional[str], max_attempts: int) -> None:
+        kwargs = {"cluster": self.cluster, "task": task_arn}
+        if reason:
+            kwargs["reason"] = reason
 
-                assert (
-                    response["ResponseMetadata"]["HTTPStatusCode"] == 200
-                ), f"Non 200 status code while stopping tasks"
-                counter += 1
+        for attempt in range(max_attempts):
+            try:
+                # non 2xx responses are raised as ClientError by botocore
+                self.client.stop_task(**kwargs)
+                return
+            except ClientError as e:
+                if (
+                    e.response["Error"]["Code"] not in self.RETRYABLE_ERROR_CODES
+                    or attempt == max_attempts - 1
+                ):
+                    raise
+                delay = exponential_backoff(attempt)
+                self.log.debug(f"Throttled while stopping {task_arn}, retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _wait_tasks_stopped(
+        self, report: ECSStopReport, waiter_delay: int, waiter_max_attempts: int
+    ) -> None:
+        waiter = self.client.get_waiter("tasks_stopped")
+        for batch in chunked(report.stopped, self.DESCRIBE_TASKS_BATCH_SIZE):
+            try:
+                waiter.wait(
+                    cluster=self.cluster,
+                    tasks=batch,
+                    WaiterConfig={"Delay": waiter_delay, "MaxAttempts": waiter_max_attempts},
+                )
+            except WaiterError as e:
+                self.log.warning(f"Tasks did not reach STOPPED in time: {e}")
+                report.not_stopped.extend(self._still_running(batch))
+
+    def _still_running(self, task_arns: List[str]) -> List[str]:
+        response = self.client.describe_tasks(cluster=self.cluster, tasks=task_arns)
+        return [
+            task["taskArn"] for task in response["tasks"] if task["lastStatus"] != "STOPPED"
+        ]
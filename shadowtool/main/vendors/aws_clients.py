@@ -0,0 +1,156 @@
+"""
+Process-wide registry of boto3 sessions, clients and resources shared by the AWS hooks.
+
+Building a boto3 client resolves the credential chain and the endpoint and loads the
+service JSON models, which takes hundreds of milliseconds. Clients are therefore created
+lazily once per (service, region, profile) and reused by every hook of the process.
+
+boto3 clients are thread-safe and are shared between threads. Resources are not, so
+they are cached per thread instead. Neither survive a fork, so the registry resets
+itself in a forked child (e.g. a worker of a process pool).
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+import shadowtool.config as config
+from shadowtool.main.general.logging_utils import LoggingMixin
+
+ClientKey = Tuple[str, Optional[str], Optional[str]]
+
+
+class AWSClientRegistry(LoggingMixin):
+    """
+    lazily creates and caches boto3 clients keyed by (service, region, profile)
+
+    :param max_pool_connections: size of the urllib3 connection pool of each client,
+            should be at least the number of threads sharing a client
+    """
+
+    def __init__(self, max_pool_connections: int = 10):
+        self.max_pool_connections = max_pool_connections
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._sessions: Dict[Optional[str], boto3.session.Session] = {}
+        self._clients: Dict[ClientKey, Any] = {}
+        self._generation = 0
+        self._pid = os.getpid()
+
+    def configure(self, max_pool_connections: Optional[int] = None) -> None:
+        """change the client settings, existing clients are dropped and re-created on demand"""
+        with self._lock:
+            if max_pool_connections is not None:
+                self.max_pool_connections = max_pool_connections
+            self._clients.clear()
+            self._generation += 1
+
+    def reset(self) -> None:
+        """drop every cached session, client and resource"""
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+            self._generation += 1
+
+    def reset_after_fork(self) -> None:
+        """
+        reset in a forked child, the lock is re-created rather than acquired
+        since another thread of the parent could have held it while forking
+        """
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._clients = {}
+        self._generation += 1
+        self._pid = os.getpid()
+
+    def get_session(self, profile_name: Optional[str] = None) -> boto3.session.Session:
+        self._reset_if_forked()
+        with self._lock:
+            session = self._sessions.get(profile_name)
+            if session is None:
+                session = boto3.session.Session(profile_name=profile_name)
+                self._sessions[profile_name] = session
+            return session
+
+    def get_client(
+        self,
+        service_name: str,
+        region_name: Optional[str] = None,
+        profile_name: Optional[str] = None,
+    ) -> Any:
+        """get the shared client of the service, safe to use from multiple threads"""
+        self._reset_if_forked()
+        key = (service_name, region_name, profile_name)
+
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                self.log.debug(f"Creating boto3 client for {key}")
+                # boto3 sessions are not thread-safe, creation stays under the lock
+                client = self.get_session(profile_name).client(
+                    service_name=service_name,
+                    region_name=region_name,
+                    config=self._client_config(),
+                )
+                self._clients[key] = client
+            return client
+
+    def get_resource(
+        self,
+        service_name: str,
+        region_name: Optional[str] = None,
+        profile_name: Optional[str] = None,
+    ) -> Any:
+        """get the resource of the service, cached per thread since resources are not thread-safe"""
+        self._reset_if_forked()
+        key = (service_name, region_name, profile_name)
+
+        resources = getattr(self._local, "resources", None)
+        if resources is None or self._local.generation != self._generation:
+            resources = self._local.resources = {}
+            self._local.generation = self._generation
+
+        resource = resources.get(key)
+        if resource is None:
+            with self._lock:
+                resource = self.get_session(profile_name).resource(
+                    service_name=service_name,
+                    region_name=region_name,
+                    config=self._client_config(),
+                )
+            resources[key] = resource
+        return resource
+
+    def _client_config(self) -> Config:
+        return Config(max_pool_connections=self.max_pool_connections)
+
+    def _reset_if_forked(self) -> None:
+        # covers forks that bypass `os.register_at_fork`, e.g. forks done in C extensions
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+
+
+registry = AWSClientRegistry(
+    max_pool_connections=int(os.getenv(config.ST__AWS_MAX_POOL_CONNECTIONS, 10))
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset_after_fork)
+
+
+def get_client(
+    service_name: str, region_name: Optional[str] = None, profile_name: Optional[str] = None
+) -> Any:
+    return registry.get_client(service_name, region_name, profile_name)
+
+
+def get_resource(
+    service_name: str, region_name: Optional[str] = None, profile_name: Optional[str] = None
+) -> Any:
+    return registry.get_resource(service_name, region_name, profile_name)
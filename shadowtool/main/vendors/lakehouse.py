@@ -0,0 +1,199 @@
+"""
+Process-wide cache of data lakehouse catalog metadata.
+
+Every connector asks the metastore for the DDL of its table before registering it,
+which makes the metastore the bottleneck when hundreds of connectors run in one
+driver. The metadata of a table (DDL, format, partition keys) is therefore cached
+for a short TTL, prefetched for whole batches of tables, and invalidated as soon as
+the process itself changes the table.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import shadowtool.config as config
+from shadowtool.main.general.cache_utils import MISSING, CacheStats, TTLCache
+from shadowtool.main.general.iter_utils import chunked
+from shadowtool.main.general.logging_utils import LoggingMixin
+
+DELTA_MANIFEST_MARKER = "_symlink_format_manifest"
+
+# hive: PARTITIONED BY (`dt` STRING, `hour` INT), presto: partitioned_by = ARRAY['dt','hour']
+# the hive column list is read up to its matching parenthesis, types have their own
+_HIVE_PARTITION_PATTERN = re.compile(r"PARTITIONED\s+BY\s*\(", re.IGNORECASE)
+_PRESTO_PARTITION_PATTERN = re.compile(
+    r"partitioned_by\s*=\s*ARRAY\s*\[(.*?)\]", re.IGNORECASE | re.DOTALL
+)
+
+
+def _split_parenthesised(text: str, start: int) -> List[str]:
+    """
+    the comma separated items from `start` up to the parenthesis closing the list,
+    commas nested in parentheses (e.g. `DECIMAL(10,2)`) don't split
+    """
+    items, depth, item_start = [], 0, start
+    for i in range(start, len(text)):
+        char = text[i]
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            if depth == 0:
+                items.append(text[item_start:i])
+                break
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[item_start:i])
+            item_start = i + 1
+    return [item.strip() for item in items if item.strip()]
+
+
+def parse_partition_keys(ddl: str) -> List[str]:
+    """partition column names declared in a hive or presto DDL"""
+    match = _HIVE_PARTITION_PATTERN.search(ddl)
+    if match is not None:
+        return [
+            column.split()[0].strip("`\"")
+            for column in _split_parenthesised(ddl, match.end())
+        ]
+
+    match = _PRESTO_PARTITION_PATTERN.search(ddl)
+    if match is not None:
+        return [
+            column.strip().strip("'\"")
+            for column in match.group(1).split(",")
+            if column.strip()
+        ]
+
+    return []
+
+
+@dataclass(frozen=True)
+class TableMetadata:
+
+    fq_tbl_name: str
+    # None when the table is not found in the catalog
+    ddl: Optional[str]
+    fetched_at: datetime = field(default_factory=datetime.utcnow, compare=False)
+
+    @property
+    def exists(self) -> bool:
+        return self.ddl is not None
+
+    @property
+    def is_delta(self) -> bool:
+        """delta tables are exposed to the catalog through their symlink manifest"""
+        return self.ddl is not None and DELTA_MANIFEST_MARKER in self.ddl
+
+    @property
+    def data_format(self) -> Optional[str]:
+        if self.ddl is None:
+            return None
+        return "DELTA" if self.is_delta else "PARQUET"
+
+    @property
+    def partition_keys(self) -> List[str]:
+        return [] if self.ddl is None else parse_partition_keys(self.ddl)
+
+
+class CatalogMetadataCache(LoggingMixin):
+    """
+    caches the catalog metadata of tables by fully qualified tbl name
+
+    The metadata is read through a lakehouse hook, i.e. an object with a
+    `get_ddl_from_system(fq_tbl_name)` method. Hooks that also implement
+    `get_ddls_from_system(fq_tbl_names) -> {fq_tbl_name: ddl}` get a batch
+    prefetched with a single query, otherwise the batch is fetched concurrently.
+
+    :param ttl: seconds the metadata of a table is trusted
+    :param max_size: max number of tables kept
+    :param max_workers: concurrent lookups when prefetching without a batch query
+    :param batch_size: max tables per batch query
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        max_size: int = 4096,
+        max_workers: int = 8,
+        batch_size: int = 200,
+    ):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._cache = TTLCache(ttl=ttl, max_size=max_size)
+
+    def get_table_metadata(self, fq_tbl_name: str, lakehouse_hook: Any) -> TableMetadata:
+        metadata = self._cache.get(fq_tbl_name)
+        if metadata is MISSING:
+            metadata = self._fetch(fq_tbl_name, lakehouse_hook)
+            self._cache.set(fq_tbl_name, metadata)
+        return metadata
+
+    def get_ddl(self, fq_tbl_name: str, lakehouse_hook: Any) -> Optional[str]:
+        return self.get_table_metadata(fq_tbl_name, lakehouse_hook).ddl
+
+    def prefetch(
+        self, fq_tbl_names: Iterable[str], lakehouse_hook: Any, force: bool = False
+    ) -> Dict[str, TableMetadata]:
+        """
+        load the metadata of many tables ahead of their connectors
+
+        :param force: refetch the tables that are already cached
+        :return: the metadata of every given table
+        """
+        fq_tbl_names = list(dict.fromkeys(fq_tbl_names))
+        result = {}
+        to_fetch = []
+        for fq_tbl_name in fq_tbl_names:
+            metadata = MISSING if force else self._cache.get(fq_tbl_name)
+            if metadata is MISSING:
+                to_fetch.append(fq_tbl_name)
+            else:
+                result[fq_tbl_name] = metadata
+
+        if to_fetch:
+            self.log.info(f"Prefetching catalog metadata of {len(to_fetch)} tables")
+            for metadata in self._fetch_many(to_fetch, lakehouse_hook):
+                self._cache.set(metadata.fq_tbl_name, metadata)
+                result[metadata.fq_tbl_name] = metadata
+
+        return {fq_tbl_name: result[fq_tbl_name] for fq_tbl_name in fq_tbl_names}
+
+    def invalidate(self, fq_tbl_name: str) -> None:
+        """to be called after the process created, dropped or altered the table"""
+        if self._cache.invalidate(fq_tbl_name):
+            self.log.debug(f"Catalog metadata of {fq_tbl_name} invalidated")
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> CacheStats:
+        return self._cache.stats()
+
+    def _fetch(self, fq_tbl_name: str, lakehouse_hook: Any) -> TableMetadata:
+        return TableMetadata(
+            fq_tbl_name=fq_tbl_name, ddl=lakehouse_hook.get_ddl_from_system(fq_tbl_name)
+        )
+
+    def _fetch_many(self, fq_tbl_names: List[str], lakehouse_hook: Any) -> List[TableMetadata]:
+        if hasattr(lakehouse_hook, "get_ddls_from_system"):
+            result = []
+            for chunk in chunked(fq_tbl_names, self.batch_size):
+                ddls = lakehouse_hook.get_ddls_from_system(chunk)
+                result.extend(
+                    TableMetadata(fq_tbl_name=fq_tbl_name, ddl=ddls.get(fq_tbl_name))
+                    for fq_tbl_name in chunk
+                )
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(
+                executor.map(lambda name: self._fetch(name, lakehouse_hook), fq_tbl_names)
+            )
+
+
+catalog_cache = CatalogMetadataCache(
+    ttl=float(os.getenv(config.ST__CATALOG_CACHE_TTL, 300))
+)
@@ -1,23 +1,67 @@
 """
 This class allows notifications from airflow to send to Teams
 """
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+
+from shadowtool.main.general.iter_utils import chunked
+from shadowtool.main.general.retry_utils import exponential_backoff
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THEME_COLOR = "00FF00"
 
 
 class MicroSoftTeamsWebHook:
     """
     this class handles the interaction between client and MS Teams channel
+
+    All webhooks of the process share one pooled HTTP session, so connections to
+    Teams are kept alive between messages. Rate limited (429) and failed deliveries
+    are retried with backoff, and never raise.
+
+    :param asynchronous: hand the cards over to a background thread instead of
+            waiting for Teams, bursts of cards to the same webhook are then coalesced
+            into digest cards. Queued cards are flushed when the interpreter exits,
+            but are lost if the process is killed or leaves through `os._exit`: pass
+            False, or call `flush`, where the card has to be out before going on.
+    :param timeout: seconds to wait for Teams to answer a single request, defaults to
+            10s for asynchronous webhooks and 3s otherwise
+    :param max_attempts: attempts per card before it's dropped with a warning, defaults
+            to 5 for asynchronous webhooks and 1 otherwise, so a synchronous webhook
+            never blocks a failing pipeline on retries
     """
 
-    def __init__(self, webhook_link):
+    def __init__(
+        self,
+        webhook_link,
+        asynchronous: bool = True,
+        timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+    ):
         self.webhook_link = webhook_link
+        self.asynchronous = asynchronous
+        if timeout is None:
+            timeout = 10 if asynchronous else 3
+        if max_attempts is None:
+            max_attempts = 5 if asynchronous else 1
+        self.timeout = timeout
+        self.max_attempts = max_attempts
 
     def send_msg(
         self,
         title: str,
         content: str,
-        theme_color="00FF00",
+        theme_color=DEFAULT_THEME_COLOR,
         enable_markdown: bool = False,
     ):
         """
@@ -36,10 +80,192 @@ class MicroSoftTeamsWebHook:
     def send_custom_card(self, card_json: dict):
         self._deliver_card(card_json)
 
-    def _deliver_card(self, card_json):
-        resp = requests.post(self.webhook_link, json=card_json)
-        if resp.status_code == 200:
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        wait for the queued cards of all asynchronous webhooks to be delivered
 
-            logging.info(f"Message successfully delivered.")
+        :return: False if the timeout was reached before the queue drained
+        """
+        return TeamsDeliveryQueue.instance().flush(timeout)
+
+    def _deliver_card(self, card_json):
+        if self.asynchronous:
+            TeamsDeliveryQueue.instance().put(self, card_json)
         else:
-            logging.warning(f"Status code: {resp.status_code}, {resp.content}")
+            self._post_card(card_json)
+
+    def _post_card(self, card_json) -> bool:
+        for attempt in range(self.max_attempts):
+            try:
+                resp = get_session().post(
+                    self.webhook_link, json=card_json, timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                logger.warning(f"Failed to reach Teams: {e}")
+                delay = exponential_backoff(attempt)
+            else:
+                if resp.status_code == 200:
+                    logger.info(f"Message successfully delivered.")
+                    return True
+
+                if resp.status_code != 429 and resp.status_code < 500:
+                    logger.warning(f"Status code: {resp.status_code}, {resp.content}")
+                    return False
+
+                delay = _retry_after(resp) or exponential_backoff(attempt)
+                logger.warning(
+                    f"Status code: {resp.status_code}, retrying in {delay:.1f}s"
+                )
+
+            if attempt < self.max_attempts - 1:
+                time.sleep(delay)
+
+        logger.warning(f"Giving up delivering the message after {self.max_attempts} attempts.")
+        return False
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """the keep-alive HTTP session shared by all webhooks of the process"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+                _session = session
+    return _session
+
+
+def build_digest_card(cards: List[dict]) -> dict:
+    """
+    merge several MessageCards into one, each card becomes a titled group of sections
+    The digest takes the color of the first card with a non default color, so alerts stand out.
+    """
+    theme_color = next(
+        (
+            card["themeColor"]
+            for card in cards
+            if card.get("themeColor", DEFAULT_THEME_COLOR) != DEFAULT_THEME_COLOR
+        ),
+        DEFAULT_THEME_COLOR,
+    )
+    title = f"{len(cards)} notifications"
+
+    sections = []
+    for card in cards:
+        sections.append(
+            {"activityTitle": card.get("title") or card.get("summary", ""), "text": ""}
+        )
+        sections.extend(card.get("sections", []))
+
+    return {
+        "@type": "MessageCard",
+        "@context": "http://schema.org/extensions",
+        "themeColor": theme_color,
+        "summary": title,
+        "title": title,
+        "sections": sections,
+    }
+
+
+class TeamsDeliveryQueue:
+    """
+    a background thread delivering the cards of asynchronous webhooks
+
+    Cards arriving within `coalesce_window` seconds of each other are grouped by
+    webhook, and MessageCards of the same group are merged into digest cards of at
+    most `max_cards_per_digest` cards, so a burst of alerts costs a few requests
+    and stays under the Teams rate limit.
+    """
+
+    _instance: Optional["TeamsDeliveryQueue"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, coalesce_window: float = 2.0, max_cards_per_digest: int = 10):
+        self.coalesce_window = coalesce_window
+        self.max_cards_per_digest = max_cards_per_digest
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._pending_changed = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="teams-delivery", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def instance(cls) -> "TeamsDeliveryQueue":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                    atexit.register(cls._instance.flush, 30)
+        return cls._instance
+
+    def put(self, webhook: MicroSoftTeamsWebHook, card_json: dict) -> None:
+        with self._pending_changed:
+            self._pending += 1
+        self._queue.put((webhook, card_json))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._pending_changed:
+            return self._pending_changed.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._deliver_batch(batch)
+            except Exception as e:
+                logger.warning(f"Unexpected error while delivering Teams messages: {e}")
+            finally:
+                with self._pending_changed:
+                    self._pending -= len(batch)
+                    self._pending_changed.notify_all()
+
+    def _deliver_batch(self, batch: list) -> None:
+        groups: Dict[str, list] = OrderedDict()
+        for webhook, card_json in batch:
+            groups.setdefault(webhook.webhook_link, []).append((webhook, card_json))
+
+        for items in groups.values():
+            webhook = items[0][0]
+            message_cards = [c for _, c in items if c.get("@type") == "MessageCard"]
+            other_cards = [c for _, c in items if c.get("@type") != "MessageCard"]
+
+            for chunk in chunked(message_cards, self.max_cards_per_digest):
+                webhook._post_card(chunk[0] if len(chunk) == 1 else build_digest_card(chunk))
+
+            for card_json in other_cards:
+                webhook._post_card(card_json)
+
+
+def _reset_after_fork() -> None:
+    # the delivery thread and pooled connections don't survive a fork
+    global _session
+    _session = None
+    TeamsDeliveryQueue._instance = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,351 @@
+"""
+Content-addressed cache of third party API responses.
+
+Each request is keyed by its endpoint, parameters and time window, and its records are
+stored as one gzipped JSON lines object, under the CACHED layer of the table (on s3) or
+a local folder. Re-runs and backfills then read the stored pages instead of calling the
+rate limited API again.
+
+Values JSON has no type for (datetimes, dates, times, decimals and bytes) are stored
+as tagged objects and decoded back to the same type on a hit.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from shadowtool.main.general.cache_utils import CacheStats
+from shadowtool.main.general.logging_utils import LoggingMixin
+
+RESPONSE_CACHE_FORMAT_VERSION = 2
+RESPONSE_OBJECT_SUFFIX = ".jsonl.gz"
+
+Window = Tuple[Optional[Any], Optional[Any]]
+
+
+@dataclass(frozen=True)
+class CachedObject:
+
+    key: str
+    size: int
+    # epoch seconds
+    modified_at: float
+
+
+class BaseObjectStore(ABC):
+    @abstractmethod
+    def read(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def write(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def list(self) -> List[CachedObject]:
+        ...
+
+    @abstractmethod
+    def delete(self, keys: List[str]) -> None:
+        ...
+
+
+class LocalObjectStore(BaseObjectStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.root, key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def list(self) -> List[CachedObject]:
+        result = []
+        for dir_path, _, files in os.walk(self.root):
+            for file in files:
+                if not file.endswith(RESPONSE_OBJECT_SUFFIX):
+                    continue
+                path = os.path.join(dir_path, file)
+                stat = os.stat(path)
+                result.append(
+                    CachedObject(
+                        key=os.path.relpath(path, self.root).replace(os.sep, "/"),
+                        size=stat.st_size,
+                        modified_at=stat.st_mtime,
+                    )
+                )
+        return result
+
+    def delete(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.root, key))
+            except FileNotFoundError:
+                pass
+
+
+class S3ObjectStore(BaseObjectStore):
+    def __init__(self, s3_hook: Any, prefix: str):
+        self.s3_hook = s3_hook
+        self.prefix = prefix.strip("/") + "/"
+
+    def read(self, key: str) -> Optional[bytes]:
+        return self.s3_hook.read_file(self.prefix + key)
+
+    def write(self, key: str, data: bytes) -> None:
+        self.s3_hook.create_file(self.prefix + key, data)
+
+    def list(self) -> List[CachedObject]:
+        return [
+            CachedObject(
+                key=obj.key[len(self.prefix):],
+                size=obj.size,
+                modified_at=obj.last_modified.timestamp(),
+            )
+            for obj in self.s3_hook.iter_objects(prefix=self.prefix)
+            if obj.key.endswith(RESPONSE_OBJECT_SUFFIX)
+        ]
+
+    def delete(self, keys: List[str]) -> None:
+        self.s3_hook.bulk_delete([self.prefix + key for key in keys])
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+# key of the tagged objects that encode non JSON values in the records
+_TYPE_TAG = "__st_type__"
+
+_ENCODERS = (
+    # datetime before date, datetime being a subclass of date
+    (datetime, "datetime", lambda v: v.isoformat()),
+    (date, "date", lambda v: v.isoformat()),
+    (dt_time, "time", lambda v: v.isoformat()),
+    (Decimal, "decimal", str),
+    (bytes, "bytes", lambda v: base64.b64encode(v).decode("ascii")),
+)
+
+_DECODERS = {
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": dt_time.fromisoformat,
+    "decimal": Decimal,
+    "bytes": base64.b64decode,
+}
+
+
+def _encode_value(value: Any) -> Any:
+    for type_, name, encode in _ENCODERS:
+        if isinstance(value, type_):
+            return {_TYPE_TAG: name, "value": encode(value)}
+    # anything else is stored as its string form
+    return str(value)
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 2 and obj.get(_TYPE_TAG) in _DECODERS and "value" in obj:
+        return _DECODERS[obj[_TYPE_TAG]](obj["value"])
+    return obj
+
+
+def request_cache_key(endpoint: str, params: Optional[Dict[str, Any]], window: Window) -> str:
+    """sha256 of the canonical JSON form of the request, the order of the params does not matter"""
+    canonical = json.dumps(
+        {
+            "version": RESPONSE_CACHE_FORMAT_VERSION,
+            "endpoint": endpoint,
+            "params": params or {},
+            "window": list(window),
+        },
+        sort_keys=True,
+        default=_json_default,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache(LoggingMixin):
+    """
+    cache of API responses, each response being a list of records of JSON values,
+    datetimes, dates, times, decimals or bytes
+
+    :param store: where the responses are kept
+    :param ttl: seconds a response is reused, None to keep it until evicted
+    :param max_bytes: total size of the stored responses, the oldest written are
+            evicted above it
+    :param cache_open_windows: also cache requests whose window ends in the future,
+            whose response is likely to still change
+    """
+
+    def __init__(
+        self,
+        store: BaseObjectStore,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_bytes: int = 1024 ** 3,
+        cache_open_windows: bool = False,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_open_windows = cache_open_windows
+        self._stats = CacheStats()
+
+    @classmethod
+    def from_path(cls, path: str, **kwargs) -> "ResponseCache":
+        """a cache in an `s3://bucket/prefix` path, or a local folder"""
+        if path.startswith(("s3://", "s3a://", "s3n://")):
+            from shadowtool.main.vendors.aws import S3Hook
+
+            bucket_name, _, prefix = path.split("://", 1)[1].partition("/")
+            return cls(S3ObjectStore(S3Hook(bucket_name=bucket_name), prefix), **kwargs)
+        return cls(LocalObjectStore(path), **kwargs)
+
+    def get(
+        self, endpoint: str, params: Optional[Dict[str, Any]] = None, window: Window = (None, None)
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        the cached records of the request, None on a miss, when expired or when the
+        stored object can't be read
+        """
+        object_key = self._object_key(request_cache_key(endpoint, params, window))
+        data = self.store.read(object_key)
+        if data is None:
+            self._stats.misses += 1
+            return None
+
+        try:
+            lines = gzip.decompress(data).decode("utf-8").splitlines()
+            header = json.loads(lines[0])
+            created_at = header["created_at"]
+            records = [json.loads(line, object_hook=_decode_object) for line in lines[1:]]
+        except (OSError, EOFError, zlib.error, ValueError, LookupError, TypeError) as e:
+            # truncated or corrupted objects are fetched again and overwritten
+            self.log.warning(f"Ignoring the unreadable cached response {object_key}: {e!r}")
+            self._stats.misses += 1
+            return None
+
+        if self.ttl is not None and created_at + self.ttl <= time.time():
+            self._stats.expirations += 1
+            self._stats.misses += 1
+            return None
+
+        self._stats.hits += 1
+        return records
+
+    def put(
+        self,
+        endpoint: str,
+        records: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        window: Window = (None, None),
+    ) -> bool:
+        """:return: whether the response was cached"""
+        if not self._is_cacheable(window):
+            return False
+
+        header = {
+            "version": RESPONSE_CACHE_FORMAT_VERSION,
+            "endpoint": endpoint,
+            "params": params or {},
+            "window": list(window),
+            "created_at": time.time(),
+            "records": len(records),
+        }
+        lines = [json.dumps(header, default=_json_default)]
+        lines.extend(json.dumps(record, default=_encode_value) for record in records)
+        self.store.write(
+            self._object_key(request_cache_key(endpoint, params, window)),
+            gzip.compress("\n".join(lines).encode("utf-8")),
+        )
+        return True
+
+    def get_or_fetch(
+        self,
+        endpoint: str,
+        fetch: Callable[[], List[Dict[str, Any]]],
+        params: Optional[Dict[str, Any]] = None,
+        window: Window = (None, None),
+    ) -> List[Dict[str, Any]]:
+        """the cached records of the request, or the fetched ones, cached for next time"""
+        records = self.get(endpoint, params, window)
+        if records is None:
+            records = fetch()
+            self.put(endpoint, records, params, window)
+        return records
+
+    def evict(self) -> int:
+        """
+        delete the expired responses, then the oldest ones until the cache fits
+        in `max_bytes`
+
+        Responses are ordered by the time they were written, not by their last read:
+        the stores keep no access time and a hit does not rewrite the object. This
+        matches the ttl, which also counts from the write.
+
+        :return: number of responses deleted
+        """
+        objects = sorted(self.store.list(), key=lambda o: o.modified_at)
+        now = time.time()
+        expired = {
+            o.key for o in objects if self.ttl is not None and o.modified_at + self.ttl <= now
+        }
+        remaining = [o for o in objects if o.key not in expired]
+
+        to_delete = list(expired)
+        total = sum(o.size for o in remaining)
+        for o in remaining:
+            if total <= self.max_bytes:
+                break
+            to_delete.append(o.key)
+            total -= o.size
+
+        if to_delete:
+            self.store.delete(to_delete)
+            self._stats.evictions += len(to_delete) - len(expired)
+            self._stats.expirations += len(expired)
+            self.log.info(f"Evicted {len(to_delete)} cached responses, {total} bytes left")
+        return len(to_delete)
+
+    def stats(self) -> CacheStats:
+        return CacheStats(**self._stats.to_dict())
+
+    def _is_cacheable(self, window: Window) -> bool:
+        window_end = window[1]
+        if self.cache_open_windows or window_end is None:
+            return True
+        if isinstance(window_end, datetime):
+            now = datetime.now(window_end.tzinfo) if window_end.tzinfo else datetime.utcnow()
+            return window_end <= now
+        if isinstance(window_end, date):
+            return window_end < datetime.utcnow().date()
+        return True
+
+    @staticmethod
+    def _object_key(cache_key: str) -> str:
+        return f"responses/{cache_key[:2]}/{cache_key}{RESPONSE_OBJECT_SUFFIX}"
@@ -0,0 +1,303 @@
+"""
+In-process S3 sync engine, used by the S3Hook in place of the `aws s3 sync` subprocess.
+
+The engine diffs a local directory against an S3 prefix, then hands the transfers
+to a single s3transfer manager, so the whole sync shares one bounded thread pool and
+large objects are moved as ranged GETs / multipart uploads.
+"""
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from boto3.s3.transfer import TransferConfig
+from s3transfer.manager import TransferManager
+
+from shadowtool.main.general.logging_utils import LoggingMixin
+
+MB = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class LocalFileState:
+    path: str
+    size: int
+    mtime: float
+
+
+@dataclass(frozen=True)
+class RemoteFileState:
+    key: str
+    size: int
+    etag: str
+    last_modified: float
+
+
+@dataclass
+class SyncReport:
+    """
+    structured result of a sync, one per `download` / `upload` call
+    """
+
+    direction: str
+    source: str
+    destination: str
+    files_transferred: List[str] = field(default_factory=list)
+    files_skipped: List[str] = field(default_factory=list)
+    files_deleted: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    # relative path -> ETag of every object of the source prefix, downloads only
+    source_etags: Dict[str, str] = field(default_factory=dict)
+    bytes_transferred: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.failed
+
+    def summary(self) -> str:
+        return (
+            f"{self.direction} {self.source} -> {self.destination}: "
+            f"{len(self.files_transferred)} files ({self.bytes_transferred} bytes) transferred, "
+            f"{len(self.files_skipped)} skipped, {len(self.files_deleted)} deleted, "
+            f"{len(self.failed)} failed in {self.elapsed_seconds:.2f}s"
+        )
+
+
+def normalise_prefix(s3_prefix: str) -> str:
+    """treat the prefix as a folder, the same way `aws s3 sync` does"""
+    s3_prefix = s3_prefix.lstrip("/")
+    if s3_prefix and not s3_prefix.endswith("/"):
+        s3_prefix += "/"
+    return s3_prefix
+
+
+def scan_local_files(local_path: str) -> Dict[str, LocalFileState]:
+    """map of posix style relative path -> local file state"""
+    result = {}
+    if not os.path.isdir(local_path):
+        return result
+
+    for root, _, files in os.walk(local_path):
+        for name in files:
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, local_path).replace(os.sep, "/")
+            stat = os.stat(path)
+            result[rel_path] = LocalFileState(
+                path=path, size=stat.st_size, mtime=stat.st_mtime
+            )
+    return result
+
+
+def file_md5(path: str, chunk_size: int = 8 * MB) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def is_same_content(local: LocalFileState, remote: RemoteFileState) -> bool:
+    """
+    compare content by ETag, only possible when the object was not a multipart
+    upload (multipart ETags look like `<md5>-<parts>` and are not a content hash)
+    """
+    etag = remote.etag.strip('"')
+    if "-" in etag:
+        return False
+    return file_md5(local.path) == etag
+
+
+def plan_sync(
+    local_files: Dict[str, LocalFileState],
+    remote_files: Dict[str, RemoteFileState],
+    direction: str,
+    compare_etag: bool = False,
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    diff the two sides of a sync
+
+    A file is transferred when it only exists in the source, when the sizes differ,
+    or when the source copy is newer than the destination copy. With `compare_etag`,
+    a newer file of the same size is skipped if its ETag proves the content is equal.
+
+    :param direction: `download` (S3 -> local) or `upload` (local -> S3)
+    :return: relative paths to transfer, to skip, and to delete in the destination
+    """
+    assert direction in ("download", "upload"), f"Unknown sync direction {direction}"
+
+    if direction == "download":
+        source, destination = remote_files, local_files
+    else:
+        source, destination = local_files, remote_files
+
+    to_transfer, to_skip = [], []
+    for rel_path in sorted(source):
+        if rel_path not in destination:
+            to_transfer.append(rel_path)
+            continue
+
+        local, remote = local_files[rel_path], remote_files[rel_path]
+        if local.size != remote.size:
+            to_transfer.append(rel_path)
+            continue
+
+        # S3 keeps LastModified in whole seconds
+        local_mtime, remote_mtime = int(local.mtime), int(remote.last_modified)
+        source_is_newer = (
+            remote_mtime > local_mtime
+            if direction == "download"
+            else local_mtime > remote_mtime
+        )
+        if source_is_newer and not (compare_etag and is_same_content(local, remote)):
+            to_transfer.append(rel_path)
+        else:
+            to_skip.append(rel_path)
+
+    to_delete = sorted(set(destination) - set(source))
+    return to_transfer, to_skip, to_delete
+
+
+@dataclass
+class S3SyncEngine(LoggingMixin):
+    """
+    sync a local directory with a S3 prefix using the boto3 client
+
+    :param client: the low level boto3 s3 client
+    :param max_workers: size of the thread pool shared by all transfers of a sync
+    :param multipart_threshold: objects larger than this are transferred in ranges / parts
+    :param multipart_chunksize: size of each range / part
+    :param compare_etag: skip newer files whose ETag proves the content is unchanged
+    :param quiet: log each transferred file in debug level only
+    """
+
+    client: Any
+    bucket_name: str
+    max_workers: int = 10
+    multipart_threshold: int = 8 * MB
+    multipart_chunksize: int = 8 * MB
+    compare_etag: bool = False
+    quiet: bool = True
+
+    def _transfer_manager(self) -> TransferManager:
+        config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_workers,
+        )
+        return TransferManager(self.client, config)
+
+    def list_remote_files(self, s3_prefix: str) -> Dict[str, RemoteFileState]:
+        """map of relative path (to the prefix) -> remote object state"""
+        prefix = normalise_prefix(s3_prefix)
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        result = {}
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                # skip the zero byte "folder" placeholders
+                if key.endswith("/"):
+                    continue
+                result[key[len(prefix):]] = RemoteFileState(
+                    key=key,
+                    size=obj["Size"],
+                    etag=obj.get("ETag", ""),
+                    last_modified=obj["LastModified"].timestamp(),
+                )
+        return result
+
+    def download(
+        self, s3_prefix: str, local_path: str, delete: bool = True
+    ) -> SyncReport:
+        """sync S3 prefix -> local directory"""
+        started = time.time()
+        remote_files = self.list_remote_files(s3_prefix)
+        local_files = scan_local_files(local_path)
+        to_transfer, to_skip, to_delete = plan_sync(
+            local_files, remote_files, "download", compare_etag=self.compare_etag
+        )
+
+        report = SyncReport(
+            direction="download",
+            source=f"s3://{self.bucket_name}/{normalise_prefix(s3_prefix)}",
+            destination=local_path,
+            files_skipped=to_skip,
+            source_etags={rel_path: remote.etag for rel_path, remote in remote_files.items()},
+        )
+
+        os.makedirs(local_path, exist_ok=True)
+        futures = []
+        with self._transfer_manager() as manager:
+            for rel_path in to_transfer:
+                remote = remote_files[rel_path]
+                target_path = os.path.join(local_path, *rel_path.split("/"))
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                future = manager.download(self.bucket_name, remote.key, target_path)
+                futures.append((rel_path, target_path, remote, future))
+
+            for rel_path, target_path, remote, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    report.failed[rel_path] = str(e)
+                    continue
+                # align mtime with S3 so the next sync skips the file
+                os.utime(target_path, (remote.last_modified, remote.last_modified))
+                self._record_transfer(report, rel_path, remote.size)
+
+        if delete:
+            for rel_path in to_delete:
+                os.remove(local_files[rel_path].path)
+                report.files_deleted.append(rel_path)
+
+        report.elapsed_seconds = time.time() - started
+        self.log.info(report.summary())
+        return report
+
+    def upload(self, local_path: str, s3_prefix: str) -> SyncReport:
+        """sync local directory -> S3 prefix, remote only objects are left untouched"""
+        started = time.time()
+        prefix = normalise_prefix(s3_prefix)
+        local_files = scan_local_files(local_path)
+        remote_files = self.list_remote_files(s3_prefix)
+        to_transfer, to_skip, _ = plan_sync(
+            local_files, remote_files, "upload", compare_etag=self.compare_etag
+        )
+
+        report = SyncReport(
+            direction="upload",
+            source=local_path,
+            destination=f"s3://{self.bucket_name}/{prefix}",
+            files_skipped=to_skip,
+        )
+
+        futures = []
+        with self._transfer_manager() as manager:
+            for rel_path in to_transfer:
+                local = local_files[rel_path]
+                future = manager.upload(local.path, self.bucket_name, prefix + rel_path)
+                futures.append((rel_path, local, future))
+
+            for rel_path, local, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    report.failed[rel_path] = str(e)
+                    continue
+                self._record_transfer(report, rel_path, local.size)
+
+        report.elapsed_seconds = time.time() - started
+        self.log.info(report.summary())
+        return report
+
+    def _record_transfer(self, report: SyncReport, rel_path: str, size: int) -> None:
+        report.files_transferred.append(rel_path)
+        report.bytes_transferred += size
+
+        message = f"Transferred {rel_path} ({size} bytes)"
+        if self.quiet:
+            self.log.debug(message)
+        else:
+            self.log.info(message)
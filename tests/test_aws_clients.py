@@ -0,0 +1,39 @@
+import threading
+
+from shadowtool.main.vendors.aws_clients import AWSClientRegistry
+
+
+def test_clients_are_shared():
+    registry = AWSClientRegistry(max_pool_connections=25)
+    client = registry.get_client("s3", region_name="ap-southeast-1")
+
+    assert registry.get_client("s3", region_name="ap-southeast-1") is client
+    assert registry.get_client("s3", region_name="us-east-1") is not client
+    assert client.meta.config.max_pool_connections == 25
+
+
+def test_configure_recreates_clients():
+    registry = AWSClientRegistry()
+    client = registry.get_client("s3", region_name="ap-southeast-1")
+    registry.configure(max_pool_connections=50)
+
+    new_client = registry.get_client("s3", region_name="ap-southeast-1")
+    assert new_client is not client
+    assert new_client.meta.config.max_pool_connections == 50
+
+
+def test_resources_are_cached_per_thread():
+    registry = AWSClientRegistry()
+    resource = registry.get_resource("s3", region_name="ap-southeast-1")
+    other_thread_resource = []
+
+    thread = threading.Thread(
+        target=lambda: other_thread_resource.append(
+            registry.get_resource("s3", region_name="ap-southeast-1")
+        )
+    )
+    thread.start()
+    thread.join()
+
+    assert registry.get_resource("s3", region_name="ap-southeast-1") is resource
+    assert other_thread_resource[0] is not resource
@@ -0,0 +1,151 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import shadowtool.main.vendors.aws as aws
+
+
+def test_stop_tasks_by_family_paginates_and_retries(monkeypatch):
+    monkeypatch.setattr(aws.time, "sleep", lambda _: None)
+    hook = aws.ECSHook(cluster="etl", region_name="ap-southeast-1")
+
+    with Stubber(hook.client) as stubber:
+        stubber.add_response("list_tasks", {"taskArns": ["a", "b"], "nextToken": "t"})
+        stubber.add_response("list_tasks", {"taskArns": ["c"]})
+        stubber.add_client_error("stop_task", "ThrottlingException")
+        for _ in range(3):
+            stubber.add_response("stop_task", {})
+
+        report = hook.stop_tasks_by_family("extract", max_workers=1)
+
+    assert sorted(report.stopped) == ["a", "b", "c"]
+    assert report.succeeded
+
+
+def test_secret_disk_cache_requires_its_key(monkeypatch, tmp_path):
+    monkeypatch.delenv("ST__SECRET_CACHE_KEY", raising=False)
+    monkeypatch.setenv("ST__SECRET_CACHE_PATH", str(tmp_path / "secrets.cache"))
+
+    with pytest.raises(ValueError, match="ST__SECRET_CACHE_KEY"):
+        aws.SecretManagerHook()
+
+    # the in-memory cache alone needs no key
+    monkeypatch.delenv("ST__SECRET_CACHE_PATH")
+    assert aws.SecretManagerHook()._disk_cache is None
+
+
+def _session(access_key: str = "AKIAFIRST") -> boto3.session.Session:
+    return boto3.session.Session(
+        region_name="ap-southeast-1",
+        aws_access_key_id=access_key,
+        aws_secret_access_key="secret",
+    )
+
+
+def _secret_value(name: str, value: str) -> dict:
+    return {
+        "ARN": f"arn:aws:secretsmanager:ap-southeast-1:123:secret:{name}",
+        "Name": name,
+        "SecretString": value,
+    }
+
+
+@pytest.fixture
+def secret_cache():
+    aws.SecretManagerHook.clear_cache()
+    yield aws.SecretManagerHook._secret_cache
+    aws.SecretManagerHook.clear_cache()
+
+
+def test_get_secret_is_served_from_the_cache(secret_cache):
+    hook = aws.SecretManagerHook(session=_session())
+    before = aws.SecretManagerHook.cache_stats()
+
+    with Stubber(hook.client) as stubber:
+        stubber.add_response("get_secret_value", _secret_value("db", '{"user": "etl"}'))
+        assert hook.get_secret("db") == {"user": "etl"}
+        # a second call would fail on the exhausted stubber
+        assert hook.get_secret("db") == {"user": "etl"}
+
+    stats = aws.SecretManagerHook.cache_stats()
+    assert stats["hits"] == before["hits"] + 1
+    assert stats["misses"] == before["misses"] + 1
+    assert stats["size"] == 1
+
+
+def test_cached_secret_is_fetched_again_once_expired(secret_cache, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(secret_cache, "_timer", lambda: now[0])
+    hook = aws.SecretManagerHook(session=_session())
+
+    with Stubber(hook.client) as stubber:
+        stubber.add_response("get_secret_value", _secret_value("db", "old"))
+        stubber.add_response("get_secret_value", _secret_value("db", "rotated"))
+        assert hook.get_secret("db") == "old"
+        now[0] += aws.SecretManagerHook.SECRET_CACHE_TTL
+        assert hook.get_secret("db") == "rotated"
+        stubber.assert_no_pending_responses()
+
+    assert aws.SecretManagerHook.cache_stats()["expirations"] >= 1
+
+
+def test_cached_secrets_are_not_shared_between_credentials(secret_cache):
+    first = aws.SecretManagerHook(session=_session("AKIAFIRST"))
+    second = aws.SecretManagerHook(session=_session("AKIASECOND"))
+
+    with Stubber(first.client) as first_stubber, Stubber(second.client) as second_stubber:
+        first_stubber.add_response("get_secret_value", _secret_value("db", "first account"))
+        second_stubber.add_response("get_secret_value", _secret_value("db", "second account"))
+        assert first.get_secret("db") == "first account"
+        assert second.get_secret("db") == "second account"
+
+    assert first._disk_cache_key("db") != second._disk_cache_key("db")
+
+
+def test_get_secrets_uses_batch_get_for_missing_secrets(secret_cache):
+    hook = aws.SecretManagerHook(session=_session())
+
+    with Stubber(hook.client) as stubber:
+        stubber.add_response("get_secret_value", _secret_value("a", "1"))
+        stubber.add_response(
+            "batch_get_secret_value",
+            {"SecretValues": [_secret_value("b", "2"), _secret_value("c", "3")], "Errors": []},
+            {"SecretIdList": ["b", "c"]},
+        )
+        hook.get_secret("a")
+        secrets = hook.get_secrets(["a", "b", "c", "b"])
+        stubber.assert_no_pending_responses()
+
+    assert secrets == {"a": 1, "b": 2, "c": 3}
+
+
+def test_get_secrets_falls_back_to_single_gets_when_batch_get_is_denied(secret_cache, monkeypatch):
+    hook = aws.SecretManagerHook(session=_session(), max_workers=1)
+    warnings = []
+    monkeypatch.setattr(hook.log, "warning", warnings.append)
+
+    with Stubber(hook.client) as stubber:
+        stubber.add_client_error("batch_get_secret_value", "AccessDeniedException")
+        stubber.add_response("get_secret_value", _secret_value("a", "1"), {"SecretId": "a"})
+        stubber.add_response("get_secret_value", _secret_value("b", "2"), {"SecretId": "b"})
+        assert hook.get_secrets(["a", "b"]) == {"a": 1, "b": 2}
+
+        # the denial is remembered, the batch API is not tried again
+        stubber.add_response("get_secret_value", _secret_value("c", "3"), {"SecretId": "c"})
+        assert hook.get_secrets(["c"]) == {"c": 3}
+        stubber.assert_no_pending_responses()
+
+    assert len(warnings) == 1
+
+
+def test_encrypted_file_cache_round_trip(tmp_path):
+    pytest.importorskip("cryptography")
+    from shadowtool.main.general.cache_utils import MISSING, EncryptedFileCache
+
+    path = str(tmp_path / "secrets.cache")
+    EncryptedFileCache(path, passphrase="pass").set("scope/region/db", {"user": "etl"})
+
+    assert b"etl" not in (tmp_path / "secrets.cache").read_bytes()
+    assert EncryptedFileCache(path, passphrase="pass").get("scope/region/db") == {"user": "etl"}
+    # a wrong passphrase reads as an empty cache
+    assert EncryptedFileCache(path, passphrase="other").get("scope/region/db") is MISSING
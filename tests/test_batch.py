@@ -0,0 +1,109 @@
+import threading
+from types import SimpleNamespace
+
+from shadowtool.interfaces.batch import FAILED, SKIPPED, SUCCEEDED, BatchRunner
+from shadowtool.main.registra.models import RegistraTask
+from shadowtool.main.vendors.lakehouse import catalog_cache
+
+
+class FakeSparkContext:
+    def __init__(self):
+        self.local = threading.local()
+        self.pools = set()
+
+    def setLocalProperty(self, key, value):
+        if key == "spark.scheduler.pool" and value is not None:
+            self.pools.add(value)
+        setattr(self.local, key, value)
+
+    def setJobGroup(self, group_id, description):
+        self.local.job_group = group_id
+
+
+class FakeLakehouseHook:
+    def __init__(self):
+        self.batches = []
+
+    def get_ddls_from_system(self, fq_tbl_names):
+        self.batches.append(list(fq_tbl_names))
+        return {}
+
+
+class FakeConnector:
+    ran = []
+
+    def __init__(
+        self, source_name, db_name, tbl_name, spark_session, lakehouse_hook, registra_manager
+    ):
+        if tbl_name == "broken_init":
+            raise ValueError("bad config")
+        assert registra_manager is FakeRegistraManager
+        self.tbl_name = tbl_name
+        self.spark_session = spark_session
+        self.lakehouse_hook = lakehouse_hook
+        self._data_directory = SimpleNamespace(fq_tbl_name=f"clean_{db_name}.{tbl_name}")
+
+    def run(self):
+        if self.tbl_name == "broken_run":
+            raise RuntimeError("write failed")
+        FakeConnector.ran.append(self.tbl_name)
+
+
+class FakeRegistraManager:
+    registra_index = object()
+
+
+def test_batch_runner_reports_every_table():
+    catalog_cache.clear()
+    spark_session = SimpleNamespace(sparkContext=FakeSparkContext())
+    hook = FakeLakehouseHook()
+    tasks = [
+        RegistraTask("shop", "db", tbl_name)
+        for tbl_name in ["orders", "broken_init", "refunds", "broken_run", "users"]
+    ]
+
+    report = BatchRunner(
+        connector_cls=FakeConnector,
+        source_name="shop",
+        tasks=tasks,
+        spark_session=spark_session,
+        connector_kwargs={"lakehouse_hook": hook},
+        max_concurrency=2,
+        registra_manager=FakeRegistraManager,
+    ).run()
+
+    assert [r.tbl_name for r in report.results] == [t.tbl_name for t in tasks]
+    assert [r.status for r in report.results] == [
+        SUCCEEDED,
+        FAILED,
+        SUCCEEDED,
+        FAILED,
+        SUCCEEDED,
+    ]
+    assert "bad config" in report.results[1].error
+    assert sorted(FakeConnector.ran) == ["orders", "refunds", "users"]
+    assert not report.all_succeeded
+    assert "3 succeeded, 2 failed" in report.summary()
+
+    # one prefetch for the whole batch, and at most one pool per worker
+    assert hook.batches == [
+        ["clean_db.orders", "clean_db.refunds", "clean_db.broken_run", "clean_db.users"]
+    ]
+    assert spark_session.sparkContext.pools <= {"shadowtool_0", "shadowtool_1"}
+
+
+def test_batch_runner_fail_fast():
+    spark_session = SimpleNamespace(sparkContext=FakeSparkContext())
+    tasks = [RegistraTask("shop", "db", "broken_init"), RegistraTask("shop", "db", "orders")]
+
+    report = BatchRunner(
+        connector_cls=FakeConnector,
+        source_name="shop",
+        tasks=tasks,
+        spark_session=spark_session,
+        connector_kwargs={"lakehouse_hook": FakeLakehouseHook()},
+        fail_fast=True,
+        registra_manager=FakeRegistraManager,
+    ).run()
+
+    assert [r.status for r in report.results] == [FAILED, SKIPPED]
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from shadowtool.main.general.checkpoint_utils import (
+    Checkpoint,
+    LocalCheckpointStore,
+    S3CheckpointStore,
+    get_checkpoint_store,
+    plan_fingerprint,
+)
+
+
+def test_checkpoint_resumes_after_the_last_written_chunk(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path / "checkpoints"))
+    assert store.get("clean_shop.orders") is None
+
+    checkpoint = Checkpoint("clean_shop.orders", plan=["id < 10", "id >= 10 AND id < 20", "id >= 20"])
+    checkpoint.watermark_from_plan = True
+    store.put(checkpoint)
+    checkpoint.mark_done("id < 10", written=False)
+    checkpoint.mark_done("id >= 10 AND id < 20", written=True, pending_watermark=datetime(2021, 1, 1))
+    store.put(checkpoint)
+
+    resumed = LocalCheckpointStore(store.root).get("clean_shop.orders")
+    assert resumed.pending_chunks() == ["id >= 20"]
+    assert resumed.written and not resumed.is_complete
+    assert resumed.pending_watermark == datetime(2021, 1, 1)
+    assert resumed.watermark_from_plan
+    assert resumed.started_at == checkpoint.started_at
+
+    resumed.mark_done("id >= 20", written=False)
+    assert resumed.is_complete and resumed.written
+
+    store.delete("clean_shop.orders")
+    store.delete("clean_shop.orders")
+    assert store.get("clean_shop.orders") is None
+
+
+def test_plan_fingerprint_of_the_plan_settings():
+    settings = {"pagination_key": "id", "pagination_size": 1000, "watermark": datetime(2021, 1, 1)}
+
+    assert plan_fingerprint(settings) == plan_fingerprint(dict(reversed(list(settings.items()))))
+    assert plan_fingerprint(settings) != plan_fingerprint({**settings, "pagination_size": 500})
+    assert plan_fingerprint(settings) != plan_fingerprint({**settings, "watermark": None})
+
+
+def test_checkpoint_undoes_the_last_write(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path))
+    checkpoint = Checkpoint("clean_shop.orders", plan=["a", "b", "c"], plan_hash="abc")
+    checkpoint.mark_done("a", written=True)
+    checkpoint.mark_done("b", written=True)
+    checkpoint.mark_done("c", written=False)
+    store.put(checkpoint)
+
+    resumed = store.get("clean_shop.orders")
+    assert resumed.plan_hash == "abc" and resumed.written_chunks == ["a", "b"]
+
+    # e.g. a Delta rollback after a failed DQC reverted the write of `b`
+    assert resumed.undo_last_write() == "b"
+    assert resumed.pending_chunks() == ["b"] and resumed.written
+    assert Checkpoint("clean_shop.orders", plan=["a"]).undo_last_write() is None
+
+
+def test_checkpoints_of_older_versions_are_read():
+    raw = Checkpoint("clean_shop.orders", plan=["full"]).to_dict()
+    for key in ("written_chunks", "plan_hash", "watermark_from_plan"):
+        del raw[key]
+
+    checkpoint = Checkpoint.from_dict(raw)
+    assert checkpoint.plan_hash is None and checkpoint.written_chunks == []
+
+
+class _FakeS3Hook:
+    def __init__(self):
+        self.objects = {}
+
+    def read_file(self, target_key):
+        return self.objects.get(target_key)
+
+    def create_file(self, target_key, data):
+        self.objects[target_key] = data
+
+    def delete_file(self, target_key=None):
+        self.objects.pop(target_key, None)
+
+
+def test_s3_checkpoint_store():
+    hook = _FakeS3Hook()
+    store = S3CheckpointStore(hook, "/state/checkpoints/")
+    store.put(Checkpoint("clean_shop.orders", plan=["full"]))
+
+    assert list(hook.objects) == ["state/checkpoints/clean_shop.orders.json"]
+    assert store.get("clean_shop.orders").plan == ["full"]
+    assert not store.get("clean_shop.orders").watermark_from_plan
+    store.delete("clean_shop.orders")
+    assert not hook.objects
+
+
+def test_get_checkpoint_store(tmp_path, monkeypatch):
+    monkeypatch.delenv("ST__CHECKPOINT_STORE_URL", raising=False)
+    assert isinstance(get_checkpoint_store(), LocalCheckpointStore)
+    assert get_checkpoint_store(f"file://{tmp_path}").root == str(tmp_path)
+
+    monkeypatch.setenv("ST__CHECKPOINT_STORE_URL", str(tmp_path))
+    assert get_checkpoint_store().root == str(tmp_path)
+
+    with pytest.raises(ValueError):
+        get_checkpoint_store("ftp://host/checkpoints")
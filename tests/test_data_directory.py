@@ -0,0 +1,194 @@
+import enum
+import importlib
+import importlib.util
+import pickle
+import sys
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+
+class _DataLayer(enum.Enum):
+    RAW = "raw"
+    CLEAN = "clean"
+    CACHED = "cached"
+
+    def to_s3_path_value(self):
+        return self.value
+
+
+def _xenpy_stub():
+    """
+    the few xenpy helpers the data directories derive their paths and tbl names
+    from, standing in for xenpy where it's not installed
+    """
+    utils = ModuleType("xenpy.utils")
+    utils.tbl_parts_to_s3_data_prefix = (
+        lambda db_name, tbl_name, functional_prefix, team, test_env: (
+            f"s3://{'test-' if test_env else ''}lake/{functional_prefix}/{team}/{db_name}/{tbl_name}"
+        )
+    )
+    utils.tbl_parts_to_tbl_name = lambda functional_prefix, db_name, tbl_name, test_env: (
+        f"{'test_' if test_env else ''}{functional_prefix}_{db_name}.{tbl_name}"
+    )
+    utils.normalise_data_path_and_table = lambda name: name.lower().replace("-", "_")
+    utils.get_parts_from_tbl_name = lambda name: tuple(name.split(".", 1))
+
+    s3 = ModuleType("xenpy.s3")
+    s3.dbfs_path = lambda path: "/dbfs/mnt/" + path.split("://", 1)[1]
+    s3.s3n_path = lambda path: "s3n://" + path.split("://", 1)[1]
+
+    models = ModuleType("xenpy.models")
+    models.DataLayer = _DataLayer
+
+    xenpy = ModuleType("xenpy")
+    xenpy.utils, xenpy.s3, xenpy.models = utils, s3, models
+    return {"xenpy": xenpy, "xenpy.utils": utils, "xenpy.s3": s3, "xenpy.models": models}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def data_directory():
+    """the data_directory module, on the xenpy stub when xenpy is not installed"""
+    stubbed = {}
+    if importlib.util.find_spec("xenpy") is None:
+        stubbed = _xenpy_stub()
+        sys.modules.update(stubbed)
+    try:
+        yield importlib.import_module("shadowtool.interfaces.data_directory")
+    finally:
+        if stubbed:
+            # the module is bound to the stub, it's imported again by anyone else
+            sys.modules.pop("shadowtool.interfaces.data_directory", None)
+            for name in stubbed:
+                sys.modules.pop(name, None)
+
+
+@pytest.fixture(scope="module")
+def layers(data_directory):
+    return SimpleNamespace(
+        clean=data_directory.models.DataLayer.CLEAN.to_s3_path_value(),
+        raw=data_directory.models.DataLayer.RAW.to_s3_path_value(),
+    )
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(data_directory):
+    data_directory.clear_data_directory_cache()
+    yield
+    data_directory.clear_data_directory_cache()
+
+
+@pytest.fixture
+def make_directory(data_directory, layers):
+    def make(cls=None, **kwargs):
+        args = {"functional_prefix": layers.clean, "team": "data", "db_name": "shop", "tbl_name": "orders"}
+        args.update(kwargs)
+        return (cls or data_directory.ReplicationDataDirectory)(**args)
+
+    return make
+
+
+def test_directories_are_interned_and_immutable(data_directory, make_directory):
+    directory = make_directory(source_name="mysql")
+
+    assert make_directory(source_name="mysql") is directory
+    assert make_directory(source_name="mysql", test_env=True) is not directory
+    assert make_directory(cls=data_directory.StandardDataDirectory, source_name="mysql") is not directory
+    assert pickle.loads(pickle.dumps(directory)) is directory
+
+    with pytest.raises(AttributeError):
+        directory.tbl_name = "refunds"
+    with pytest.raises(AttributeError):
+        del directory.team
+
+
+def test_directory_equality_and_hashing(data_directory, make_directory, layers):
+    directory = make_directory()
+    standard = make_directory(cls=data_directory.StandardDataDirectory)
+
+    assert directory == make_directory()
+    assert hash(directory) == hash(make_directory())
+    assert directory != standard and directory != make_directory(tbl_name="refunds")
+    assert len({directory, make_directory(), standard}) == 2
+    assert directory.key == (layers.clean, "data", "shop", "orders", None, False)
+    assert repr(directory).startswith("ReplicationDataDirectory(functional_prefix=")
+
+
+def test_derived_paths_are_cached(data_directory, make_directory, layers):
+    directory = make_directory(source_name="mysql")
+    clean_path = directory.clean_s3_data_path
+
+    assert data_directory._s3_data_prefix.cache_info().currsize == 1
+    assert directory.s3_data_path == clean_path
+    assert directory.dbfs_clean_s3_data_path == directory.dbfs_s3_data_path
+    assert directory.s3n_clean_s3_data_path == directory.s3n_s3_data_path
+    assert directory.raw_s3_data_path != clean_path
+    misses = data_directory._s3_data_prefix.cache_info().misses
+
+    # the directory of another layer of the same table reuses its paths
+    raw = make_directory(cls=data_directory.StandardDataDirectory, functional_prefix=layers.raw, source_name="mysql")
+    assert raw.s3_data_path == directory.raw_s3_data_path
+    assert raw.fq_tbl_name == directory.raw_fq_tbl_name
+    assert data_directory._s3_data_prefix.cache_info().misses == misses
+    assert directory.path_db_name == directory.enriched_db_name
+    assert make_directory().path_db_name == "shop"
+
+    data_directory.clear_data_directory_cache()
+    assert data_directory._s3_data_prefix.cache_info().currsize == 0
+    assert make_directory(source_name="mysql").clean_s3_data_path == clean_path
+
+
+class _RegistraIndex:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def get_table(self, source_name, db_name, tbl_name):
+        return self.tables.get((source_name, db_name, tbl_name))
+
+
+@pytest.mark.parametrize("use_enriched_db_name", [False, True])
+def test_plan_matches_data_directories(data_directory, layers, use_enriched_db_name):
+    registra_manager = SimpleNamespace(
+        registra_index=_RegistraIndex(
+            {
+                ("mysql", "shop", "orders"): SimpleNamespace(team="finance", tbl_name_alias=None),
+                ("mysql", "shop", "refunds"): SimpleNamespace(team=None, tbl_name_alias="returns"),
+            }
+        )
+    )
+    tasks = [
+        SimpleNamespace(source_name="mysql", db_name="shop", tbl_name="orders"),
+        SimpleNamespace(source_name="mysql", db_name="shop", tbl_name="refunds"),
+        SimpleNamespace(source_name="pg", db_name="auth", tbl_name="users"),
+    ]
+
+    plan = data_directory.plan_data_directories(
+        tasks,
+        registra_manager=registra_manager,
+        team="data",
+        use_enriched_db_name=use_enriched_db_name,
+    )
+
+    assert len(plan) == 3
+    assert plan["team"] == ["finance", "data", "data"]
+    assert plan["final_tbl_name"] == ["orders", "returns", "users"]
+    for row, task in zip(plan.rows(), tasks):
+        directory = data_directory.ReplicationDataDirectory(
+            functional_prefix=layers.clean,
+            team=row["team"],
+            db_name=task.db_name,
+            tbl_name=row["final_tbl_name"],
+            source_name=task.source_name if use_enriched_db_name else None,
+        )
+        assert row["path_db_name"] == directory.path_db_name
+        assert row["clean_fq_tbl_name"] == directory.fq_tbl_name
+        assert row["raw_fq_tbl_name"] == directory.raw_fq_tbl_name
+        assert row["clean_s3_data_path"] == directory.clean_s3_data_path
+        assert row["clean_dbfs_s3_data_path"] == directory.dbfs_clean_s3_data_path
+        assert row["clean_s3n_s3_data_path"] == directory.s3n_clean_s3_data_path
+        assert row["raw_s3_data_path"] == directory.raw_s3_data_path
+        assert row["raw_dbfs_s3_data_path"] == directory.dbfs_raw_s3_data_path
+        assert row["raw_s3n_s3_data_path"] == directory.s3n_raw_s3_data_path
+        assert row["cached_s3_data_path"] == directory.cached_s3_data_path
+        assert row["cached_dbfs_s3_data_path"] == directory.dbfs_cached_s3_data_path
+        assert row["cached_s3n_s3_data_path"] == directory.s3n_cached_s3_data_path
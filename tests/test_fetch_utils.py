@@ -0,0 +1,144 @@
+import asyncio
+import threading
+
+import pytest
+
+import shadowtool.exceptions as exc
+from shadowtool.main.general.fetch_utils import (
+    ApiRequest,
+    AsyncFetchEngine,
+    RecordBatchBuilder,
+    TokenBucket,
+    fetch_record_batches,
+    get_rate_limiter,
+)
+
+# record batches need the parquet extra
+pytest.importorskip("pyarrow")
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    clock = _Clock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+    assert bucket.try_acquire() == 0 and bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    clock.now = 0.5
+    assert bucket.try_acquire() == 0
+    clock.now = 100
+    assert [bucket.try_acquire() for _ in range(3)][-1] == pytest.approx(0.5)
+
+
+def test_rate_limiter_is_shared_per_vendor():
+    assert get_rate_limiter("test-vendor", 5) is get_rate_limiter("test-vendor", 10)
+    assert get_rate_limiter("test-vendor", 5) is not get_rate_limiter("other-vendor", 5)
+
+
+def _requests(n):
+    return [ApiRequest("kline", {"symbol": f"S{i}"}) for i in range(n)]
+
+
+def test_engine_bounds_concurrency_and_retries():
+    in_flight, peak, attempts = [0], [0], {}
+    lock = threading.Lock()
+
+    async def fetch(request):
+        symbol = request.params["symbol"]
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        with lock:
+            attempts[symbol] = attempts.get(symbol, 0) + 1
+        if symbol == "S3" and attempts[symbol] < 3:
+            raise ConnectionError("throttled")
+        return [{"symbol": symbol, "close": float(i)} for i in range(5)]
+
+    engine = AsyncFetchEngine(fetch, max_concurrency=4, max_retries=3, base_delay=0)
+    batches, report = fetch_record_batches(_requests(20), engine, batch_size=30)
+
+    assert peak[0] <= 4
+    assert [b.num_rows for b in batches] == [30, 30, 30, 10]
+    assert report.fetched == 20 and report.retries == 2 and report.records == 100
+    assert not report.failed
+
+
+def test_engine_reports_requests_failing_for_good():
+    def fetch(request):
+        if request.params["symbol"] == "S1":
+            raise TimeoutError("gateway down")
+        return [{"symbol": request.params["symbol"]}]
+
+    engine = AsyncFetchEngine(fetch, max_concurrency=2, max_retries=1, base_delay=0)
+    with pytest.raises(exc.ApiFetchFailure) as e:
+        fetch_record_batches(_requests(3), engine)
+    assert len(e.value.report.failed) == 1 and e.value.report.fetched == 2
+
+    def broken(request):
+        raise KeyError("not retried")
+
+    with pytest.raises(KeyError):
+        fetch_record_batches(_requests(3), AsyncFetchEngine(broken, max_concurrency=2))
+
+
+def test_engine_cache_hits_skip_the_rate_limiter():
+    class _Cache:
+        def __init__(self):
+            self.responses = {}
+
+        def get(self, endpoint, params, window):
+            return self.responses.get(params["symbol"])
+
+        def put(self, endpoint, records, params, window):
+            self.responses[params["symbol"]] = records
+
+    clock = _Clock()
+    limiter = TokenBucket(rate=1, capacity=100, clock=clock)
+    cache = _Cache()
+
+    def fetch(request):
+        return [{"symbol": request.params["symbol"]}]
+
+    engine = AsyncFetchEngine(fetch, rate_limiter=limiter, cache=cache)
+    _, first_report = fetch_record_batches(_requests(10), engine)
+    batches, report = fetch_record_batches(_requests(10), engine)
+
+    # every fetch of the engine gets its own report
+    assert report is not first_report and first_report.fetched == 10
+    assert report.requests == 10 and report.cache_hits == 10 and report.fetched == 0
+    assert limiter.try_acquire(90) == 0 and limiter.try_acquire(1) > 0
+    assert sum(b.num_rows for b in batches) == 10
+
+
+def test_record_batch_builder_unifies_late_keys():
+    builder = RecordBatchBuilder(batch_size=2)
+    builder.add([{"a": 1, "b": None}, {"a": 2}])
+    builder.add([{"b": "y", "a": 3.5, "c": True}])
+    first, second = builder.flush()
+
+    assert first.schema == second.schema
+    assert first.schema.names == ["a", "b", "c"]
+    assert first.to_pydict() == {"a": [1.0, 2.0], "b": [None, None], "c": [None, None]}
+    assert second.to_pydict() == {"a": [3.5], "b": ["y"], "c": [True]}
+
+
+def test_record_batch_builder_warns_on_keys_missing_from_the_schema(monkeypatch):
+    import pyarrow as pa
+
+    warnings = []
+    builder = RecordBatchBuilder(batch_size=1, schema=pa.schema([("a", pa.int64())]))
+    monkeypatch.setattr(builder.log, "warning", warnings.append)
+    builder.add([{"a": 1}, {"a": 2, "late": "x"}, {"late": "y"}])
+    batches = builder.flush()
+
+    assert [b.to_pydict() for b in batches] == [{"a": [1]}, {"a": [2]}, {"a": [None]}]
+    assert warnings == ["Dropping the keys missing from the schema: ['late']"]
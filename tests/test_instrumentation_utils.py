@@ -0,0 +1,141 @@
+import json
+import socket
+
+import pytest
+
+from shadowtool.main.general.instrumentation_utils import (
+    Instrumentation,
+    JsonFileSink,
+    LoggingSink,
+    RunRecord,
+    StatsdSink,
+    StepRecord,
+    get_instrumentation,
+    get_sink,
+)
+
+
+class _ListSink:
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_disabled_instrumentation_is_a_no_op(monkeypatch):
+    monkeypatch.delenv("ST__INSTRUMENTATION_SINKS", raising=False)
+    instrumentation = get_instrumentation()
+    assert not instrumentation.enabled
+
+    with instrumentation.run() as record:
+        with instrumentation.step("extract") as step:
+            step.set(rows=10)
+    assert record is None and not step.enabled
+    assert instrumentation.step("write") is instrumentation.step("dqc")
+
+
+def test_run_record_nests_sub_steps(tmp_path):
+    sink = _ListSink()
+    path = str(tmp_path / "records" / "runs.jsonl")
+    instrumentation = Instrumentation([sink, JsonFileSink(path)], tags={"fq_tbl_name": "clean_shop.orders"})
+
+    with pytest.raises(RuntimeError):
+        with instrumentation.run(streaming=False):
+            with instrumentation.step("extract") as step:
+                step.set(rows=3, bytes=120)
+            with instrumentation.step("create_lakehouse_table"):
+                with instrumentation.step("register_lakehouse_table"):
+                    pass
+            with instrumentation.step("dqc"):
+                raise RuntimeError("DQC failed")
+
+    (record,) = sink.records
+    assert record.status == "failed"
+    assert record.tags == {"fq_tbl_name": "clean_shop.orders", "streaming": False}
+    assert [s.path for s in record.steps] == [
+        "extract",
+        "create_lakehouse_table.register_lakehouse_table",
+        "create_lakehouse_table",
+        "dqc",
+    ]
+    assert record.steps[0].rows == 3 and record.steps[0].bytes == 120
+    assert record.steps[-1].status == "failed" and "DQC failed" in record.steps[-1].error
+    assert all(s.wall_seconds >= 0 and s.cpu_seconds >= 0 for s in record.steps)
+
+    with open(path) as f:
+        (line,) = f.readlines()
+    assert json.loads(line)["run_id"] == record.run_id
+
+
+def test_steps_outside_of_a_run_are_grouped_by_outermost_step():
+    sink = _ListSink()
+    instrumentation = Instrumentation([sink])
+    with instrumentation.step("create_lakehouse_table"):
+        with instrumentation.step("grant_tbl_access"):
+            pass
+        with instrumentation.step("repair_hive_table"):
+            pass
+
+    (record,) = sink.records
+    assert [s.name for s in record.steps] == [
+        "grant_tbl_access",
+        "repair_hive_table",
+        "create_lakehouse_table",
+    ]
+
+
+def test_failing_sink_does_not_fail_the_run():
+    class _Broken:
+        def emit(self, record):
+            raise OSError("disk full")
+
+    sink = _ListSink()
+    with Instrumentation([_Broken(), sink]).run():
+        pass
+    assert len(sink.records) == 1
+
+
+def _record():
+    return RunRecord(
+        run_id="r",
+        started_at="2021-01-01T00:00:00",
+        tags={"fq_tbl_name": "clean_shop.orders"},
+        wall_seconds=2.0,
+        steps=[StepRecord("write", wall_seconds=1.5, cpu_seconds=0.25, rows=10)],
+    )
+
+
+def test_statsd_sink_sends_timers_and_gauges():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5)
+    try:
+        sink = StatsdSink(host="127.0.0.1", port=receiver.getsockname()[1], prefix="st")
+        sink.emit(_record())
+        lines = receiver.recv(65535).decode().split("\n")
+    finally:
+        receiver.close()
+
+    tags = "|#fq_tbl_name:clean_shop.orders,status:success"
+    assert lines[:4] == [
+        f"st.run.wall_ms:2000|ms{tags}",
+        f"st.write.wall_ms:1500|ms{tags}",
+        f"st.write.cpu_ms:250|ms{tags}",
+        f"st.write.rows:10|g{tags}",
+    ]
+
+
+def test_statsd_sink_splits_packets():
+    sink = StatsdSink(use_tags=False, max_packet_size=100)
+    packets = list(sink._packets(sink.metric_lines(_record())))
+    assert len(packets) == 2 and all(len(p) <= 100 for p in packets)
+
+
+def test_get_sink(tmp_path):
+    assert isinstance(get_sink("log"), LoggingSink)
+    statsd = get_sink("statsd://agent:9125/etl/connector")
+    assert statsd.address == ("agent", 9125) and statsd.prefix == "etl.connector"
+    assert get_sink(f"file://{tmp_path}/runs.jsonl").path == f"{tmp_path}/runs.jsonl"
+    with pytest.raises(ValueError):
+        get_sink("kafka://broker/topic")
@@ -0,0 +1,6 @@
+from shadowtool.main.general.iter_utils import chunked
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked(iter([]), 3)) == []
@@ -0,0 +1,88 @@
+import pytest
+
+from shadowtool.main.vendors.lakehouse import CatalogMetadataCache, parse_partition_keys
+
+DELTA_DDL = (
+    "CREATE EXTERNAL TABLE `clean_shop`.`orders` (`id` BIGINT)\n"
+    "PARTITIONED BY (`dt` STRING, `hour` INT)\n"
+    "LOCATION 's3://bucket/clean/orders/_symlink_format_manifest'"
+)
+
+
+class FakeLakehouseHook:
+    def __init__(self, ddls):
+        self.ddls = ddls
+        self.calls = []
+
+    def get_ddl_from_system(self, fq_tbl_name):
+        self.calls.append(fq_tbl_name)
+        return self.ddls.get(fq_tbl_name)
+
+
+class FakeBatchLakehouseHook(FakeLakehouseHook):
+    def get_ddls_from_system(self, fq_tbl_names):
+        self.calls.append(tuple(fq_tbl_names))
+        return {name: self.ddls[name] for name in fq_tbl_names if name in self.ddls}
+
+
+def test_parse_partition_keys():
+    assert parse_partition_keys(DELTA_DDL) == ["dt", "hour"]
+    assert parse_partition_keys(
+        "CREATE TABLE t (id bigint) WITH (format = 'PARQUET', partitioned_by = ARRAY['dt'])"
+    ) == ["dt"]
+    assert parse_partition_keys("CREATE TABLE t (id bigint)") == []
+
+
+def test_parse_partition_keys_with_parameterised_types():
+    ddl = (
+        "CREATE TABLE `clean_shop`.`payments` (`id` BIGINT, `amount` DECIMAL(10,2))\n"
+        "PARTITIONED BY (`amount` DECIMAL(10,2), dt STRING, `ts` TIMESTAMP)\n"
+        "LOCATION 's3://bucket/clean/payments'"
+    )
+    assert parse_partition_keys(ddl) == ["amount", "dt", "ts"]
+    assert parse_partition_keys(
+        "CREATE TABLE t (id INT) partitioned by (\n  bucket DECIMAL(4, 0),\n  dt STRING\n)"
+    ) == ["bucket", "dt"]
+
+
+def test_table_metadata_is_cached_until_invalidated():
+    hook = FakeLakehouseHook({"clean_shop.orders": DELTA_DDL})
+    cache = CatalogMetadataCache()
+
+    metadata = cache.get_table_metadata("clean_shop.orders", hook)
+    assert metadata.exists and metadata.is_delta
+    assert metadata.data_format == "DELTA"
+    assert metadata.partition_keys == ["dt", "hour"]
+
+    cache.get_table_metadata("clean_shop.orders", hook)
+    assert hook.calls == ["clean_shop.orders"]
+
+    cache.invalidate("clean_shop.orders")
+    cache.get_table_metadata("clean_shop.orders", hook)
+    assert len(hook.calls) == 2
+
+    # missing tables are cached as well
+    assert not cache.get_table_metadata("clean_shop.missing", hook).exists
+    assert cache.get_ddl("clean_shop.missing", hook) is None
+    assert len(hook.calls) == 3
+
+
+@pytest.mark.parametrize("hook_cls", [FakeLakehouseHook, FakeBatchLakehouseHook])
+def test_prefetch(hook_cls):
+    hook = hook_cls({"a.t1": "CREATE TABLE t1", "a.t2": DELTA_DDL})
+    cache = CatalogMetadataCache(batch_size=2)
+    cache.get_table_metadata("a.t1", hook)
+    hook.calls.clear()
+
+    result = cache.prefetch(["a.t1", "a.t2", "a.t3", "a.t2"], hook)
+    assert list(result) == ["a.t1", "a.t2", "a.t3"]
+    assert result["a.t2"].is_delta and not result["a.t3"].exists
+
+    if hook_cls is FakeBatchLakehouseHook:
+        assert hook.calls == [("a.t2", "a.t3")]
+    else:
+        assert sorted(hook.calls) == ["a.t2", "a.t3"]
+
+    hook.calls.clear()
+    cache.get_table_metadata("a.t3", hook)
+    assert hook.calls == []
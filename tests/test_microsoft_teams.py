@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+import requests
+
+import shadowtool.main.vendors.microsoft_teams as microsoft_teams
+from shadowtool.main.vendors.microsoft_teams import MicroSoftTeamsWebHook, build_digest_card
+
+
+def test_build_digest_card():
+    cards = [
+        {"title": "ok", "themeColor": "00FF00", "sections": [{"text": "a"}]},
+        {"title": "failed", "themeColor": "FF0000", "sections": [{"text": "b"}]},
+    ]
+
+    digest = build_digest_card(cards)
+
+    assert digest["title"] == "2 notifications"
+    assert digest["themeColor"] == "FF0000"
+    assert [s.get("activityTitle") for s in digest["sections"]] == ["ok", None, "failed", None]
+
+
+class _UnreachableSession:
+    def __init__(self):
+        self.timeouts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.timeouts.append(timeout)
+        raise requests.ConnectionError("Teams is down")
+
+
+def test_synchronous_webhook_makes_one_short_attempt(monkeypatch):
+    session = _UnreachableSession()
+    monkeypatch.setattr(microsoft_teams, "get_session", lambda: session)
+    monkeypatch.setattr(microsoft_teams.time, "sleep", lambda delay: session.timeouts.append("sleep"))
+
+    webhook = MicroSoftTeamsWebHook("https://teams.invalid/hook", asynchronous=False)
+    webhook.send_msg("failed", "dag x")
+    assert session.timeouts == [3]
+
+    session.timeouts.clear()
+    MicroSoftTeamsWebHook(
+        "https://teams.invalid/hook", asynchronous=False, max_attempts=2
+    )._post_card({})
+    assert session.timeouts == [3, "sleep", 3]
+
+    webhook = MicroSoftTeamsWebHook("https://teams.invalid/hook")
+    assert (webhook.asynchronous, webhook.timeout, webhook.max_attempts) == (True, 10, 5)
+
+
+class _RecordingWebHook(MicroSoftTeamsWebHook):
+    def __init__(self, webhook_link, posted):
+        super().__init__(webhook_link)
+        self.posted = posted
+
+    def _post_card(self, card_json):
+        self.posted.append((self.webhook_link, card_json, threading.current_thread().name))
+        return True
+
+
+@pytest.fixture
+def delivery_queue(monkeypatch):
+    registered = []
+    monkeypatch.setattr(microsoft_teams.atexit, "register", lambda *args: registered.append(args))
+    monkeypatch.setattr(microsoft_teams.TeamsDeliveryQueue, "_instance", None)
+    delivery_queue = microsoft_teams.TeamsDeliveryQueue.instance()
+    delivery_queue.coalesce_window = 0.2
+    delivery_queue.registered = registered
+    yield delivery_queue
+    assert delivery_queue.flush(5)
+
+
+def _card(title):
+    return {"@type": "MessageCard", "title": title, "sections": [{"text": title}]}
+
+
+def test_webhooks_queue_cards_by_default(delivery_queue):
+    posted = []
+    webhook = _RecordingWebHook("https://teams.invalid/a", posted)
+
+    webhook.send_msg("loaded", "orders")
+
+    assert delivery_queue.flush(5)
+    ((link, card, thread_name),) = posted
+    assert link == "https://teams.invalid/a" and card["title"] == "loaded"
+    assert thread_name == "teams-delivery"
+    assert delivery_queue.registered == [(delivery_queue.flush, 30)]
+
+
+def test_bursts_are_coalesced_into_digests_per_webhook(delivery_queue):
+    delivery_queue.max_cards_per_digest = 2
+    posted = []
+    first = _RecordingWebHook("https://teams.invalid/a", posted)
+    second = _RecordingWebHook("https://teams.invalid/b", posted)
+
+    for i in range(3):
+        first.send_custom_card(_card(f"a{i}"))
+    second.send_custom_card(_card("b0"))
+    adaptive_card = {"type": "message", "attachments": []}
+    second.send_custom_card(adaptive_card)
+
+    assert delivery_queue.flush(5)
+    assert [(link, card["title"]) for link, card, _ in posted[:3]] == [
+        ("https://teams.invalid/a", "2 notifications"),
+        ("https://teams.invalid/a", "a2"),
+        ("https://teams.invalid/b", "b0"),
+    ]
+    # only MessageCards can be merged
+    assert posted[3][1] is adaptive_card
+
+
+def test_flush_waits_for_the_queued_cards(delivery_queue):
+    release = threading.Event()
+    posted = []
+
+    class _SlowWebHook(_RecordingWebHook):
+        def _post_card(self, card_json):
+            release.wait(5)
+            return super()._post_card(card_json)
+
+    _SlowWebHook("https://teams.invalid/a", posted).send_msg("loaded", "orders")
+
+    assert not delivery_queue.flush(0.3) and posted == []
+    release.set()
+    assert delivery_queue.flush(5) and len(posted) == 1
+
+
+def test_delivery_queue_is_reset_after_fork(delivery_queue, monkeypatch):
+    monkeypatch.setattr(microsoft_teams, "_session", microsoft_teams.get_session())
+
+    microsoft_teams._reset_after_fork()
+
+    assert microsoft_teams._session is None
+    assert microsoft_teams.TeamsDeliveryQueue._instance is None
+    fresh = microsoft_teams.TeamsDeliveryQueue.instance()
+    assert fresh is not delivery_queue and fresh._thread.is_alive()
+    assert delivery_queue.registered[-1] == (fresh.flush, 30)
@@ -0,0 +1,218 @@
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+import sqlalchemy
+
+from shadowtool.main.general.partition_utils import (
+    RowBudget,
+    fetch_partitions_concurrently,
+    fetch_rows,
+    jdbc_partitioning_options,
+    quantile_bounds,
+    range_predicates,
+    resolve_split_strategy,
+    row_converter,
+    sample_keys_query,
+    spark_schema_ddl,
+    spark_type_name,
+    sqlalchemy_url_to_jdbc,
+    uniform_bounds,
+    watermark_predicate,
+)
+
+
+def test_uniform_bounds():
+    assert uniform_bounds(0, 100, 4) == [0, 25, 50, 75, 100]
+    assert uniform_bounds(1, 3, 10) == [1, 2, 3]
+    assert uniform_bounds(5, 5, 3) == [5, 5]
+    assert uniform_bounds(0.0, 1.0, 2) == [0.0, 0.5, 1.0]
+    assert uniform_bounds(Decimal("0"), Decimal("1"), 2) == [0, Decimal("0.5"), 1]
+
+
+def test_uniform_bounds_of_dates():
+    assert uniform_bounds(date(2021, 1, 1), date(2021, 1, 3), 4) == [
+        date(2021, 1, 1),
+        date(2021, 1, 2),
+        date(2021, 1, 3),
+    ]
+    assert uniform_bounds(datetime(2021, 1, 1), datetime(2021, 1, 2), 2) == [
+        datetime(2021, 1, 1),
+        datetime(2021, 1, 1, 12),
+        datetime(2021, 1, 2),
+    ]
+
+
+def test_non_numeric_keys_are_split_on_quantiles():
+    with pytest.raises(ValueError, match="quantile"):
+        uniform_bounds("a", "z", 4)
+
+    assert resolve_split_strategy("uniform", "a", "z") == "quantile"
+    assert resolve_split_strategy("uniform", 1, 10) == "uniform"
+    assert resolve_split_strategy("uniform", date(2021, 1, 1), date(2021, 2, 1)) == "uniform"
+    assert resolve_split_strategy("quantile", 1, 10) == "quantile"
+
+
+def test_sample_keys_query_keeps_the_watermark_filter():
+    where = watermark_predicate("updated_at", "2021-01-01")
+
+    assert sample_keys_query("postgresql", "orders", "id", 0.5, where=where) == (
+        "SELECT id FROM orders TABLESAMPLE BERNOULLI (50.0) WHERE updated_at > '2021-01-01'"
+    )
+    assert sample_keys_query("mysql", "orders", "id", 0.5, where=where) == (
+        "SELECT id FROM orders WHERE RAND() < 0.5 AND updated_at > '2021-01-01'"
+    )
+    assert sample_keys_query("mysql", "orders", "id", 1.0) == "SELECT id FROM orders WHERE RAND() < 1.0"
+    assert sample_keys_query("sqlite", "orders", "id", 1.0, where=where) is None
+
+
+def test_quantile_bounds_follow_skew():
+    sample = [1] * 50 + list(range(2, 52)) + [None]
+    bounds = quantile_bounds(sample, 4)
+    assert bounds[0] == 1 and bounds[-1] == 51
+    assert bounds == sorted(set(bounds))
+    assert quantile_bounds([7, 7, 7], 4) == [7, 7]
+    assert quantile_bounds([], 4) == []
+
+
+def test_jdbc_partitioning_keeps_watermark_predicates():
+    bounds = [0, 10, 20, 30]
+    assert jdbc_partitioning_options("id", bounds, range_predicates("id", bounds)) == {
+        "column": "id",
+        "lowerBound": 0,
+        "upperBound": 30,
+        "numPartitions": 3,
+    }
+
+    predicates = [f"({p}) AND id > 5" for p in range_predicates("id", bounds)]
+    options = jdbc_partitioning_options("id", bounds, predicates, filtered=True)
+    assert options == {"predicates": predicates}
+    assert all(p.endswith("AND id > 5") for p in options["predicates"])
+
+
+def test_range_predicates_filter_on_a_watermark_of_another_key():
+    where = watermark_predicate("updated_at", datetime(2021, 1, 1, 12))
+    assert where == "updated_at > '2021-01-01 12:00:00'"
+
+    # paginated by id, incremental on updated_at
+    assert range_predicates("id", [0, 10, 20], where=where) == [
+        "(id < 10 OR id IS NULL) AND updated_at > '2021-01-01 12:00:00'",
+        "(id >= 10) AND updated_at > '2021-01-01 12:00:00'",
+    ]
+    assert range_predicates("id", [], where=where) == [
+        "(1 = 1) AND updated_at > '2021-01-01 12:00:00'"
+    ]
+
+
+def test_range_predicates_cover_every_value():
+    predicates = range_predicates("id", [0, 10, 20, 30])
+    assert predicates == [
+        "id < 10 OR id IS NULL",
+        "id >= 10 AND id < 20",
+        "id >= 20",
+    ]
+    assert range_predicates("id", [5, 5]) == ["1 = 1"]
+    assert range_predicates("day", ["a", "o'b", "z"]) == [
+        "day < 'o''b' OR day IS NULL",
+        "day >= 'o''b'",
+    ]
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("mysql+pymysql://u:p@db:3306/shop", "jdbc:mysql://db:3306/shop"),
+        ("postgresql://u:p@db/shop", "jdbc:postgresql://db/shop"),
+        ("mssql+pyodbc://u:p@db:1433/shop", "jdbc:sqlserver://db:1433;databaseName=shop"),
+    ],
+)
+def test_sqlalchemy_url_to_jdbc(url, expected):
+    assert sqlalchemy_url_to_jdbc(url) == (expected, {"user": "u", "password": "p"})
+
+
+def test_fetch_partitions_concurrently_caps_connections():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def fetch(predicate):
+        with lock:
+            active.append(predicate)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(predicate)
+        return predicate.upper()
+
+    predicates = [f"p{i}" for i in range(10)]
+    slots = threading.BoundedSemaphore(2)
+    assert fetch_partitions_concurrently(fetch, predicates, 4, slots=slots) == [
+        p.upper() for p in predicates
+    ]
+    assert max(peak) <= 2
+
+
+@pytest.fixture
+def orders_engine():
+    engine = sqlalchemy.create_engine("sqlite://")
+    engine.execute(
+        "CREATE TABLE orders (id BIGINT, amount NUMERIC(12, 2), rate FLOAT, paid BOOLEAN, "
+        "created_at DATETIME, day DATE, note VARCHAR(20), payload BLOB)"
+    )
+    return engine
+
+
+def test_reflected_columns_make_a_typed_schema(orders_engine):
+    columns = [
+        (column["name"], spark_type_name(column["type"]))
+        for column in sqlalchemy.inspect(orders_engine).get_columns("orders")
+    ]
+    assert spark_schema_ddl(columns) == (
+        "`id` bigint, `amount` decimal(12,2), `rate` double, `paid` boolean, "
+        "`created_at` timestamp, `day` date, `note` string, `payload` binary"
+    )
+    assert spark_type_name(sqlalchemy.Numeric()) == "decimal(38,18)"
+    assert spark_type_name(sqlalchemy.Interval()) == "string"
+
+
+def test_fetch_rows_converts_and_handles_empty_results(orders_engine):
+    convert = row_converter(
+        ["bigint", "decimal(12,2)", "double", "boolean", "timestamp", "date", "string", "binary"]
+    )
+    budget = RowBudget(max_rows=10)
+    with orders_engine.connect() as conn:
+        empty = conn.execute(sqlalchemy.text("SELECT * FROM orders"))
+        assert fetch_rows(empty, budget, convert) == []
+
+        conn.execute(
+            sqlalchemy.text("INSERT INTO orders VALUES (1, 9.5, 2, 1, NULL, NULL, 7, x'00ff')")
+        )
+        result = conn.execute(sqlalchemy.text("SELECT * FROM orders"))
+        ((row_id, amount, rate, paid, created_at, day, note, payload),) = fetch_rows(
+            result, budget, convert
+        )
+    assert (row_id, amount, rate, paid) == (1, Decimal("9.5"), 2.0, True)
+    assert isinstance(rate, float) and created_at is None and day is None
+    assert note == "7" and payload == b"\x00\xff"
+    assert budget.rows == 1
+
+    assert row_converter(["timestamp", "date"])((datetime(2021, 1, 1), date(2021, 1, 1))) == (
+        datetime(2021, 1, 1),
+        date(2021, 1, 1),
+    )
+
+
+def test_row_budget_caps_the_rows_held_in_memory(orders_engine):
+    with orders_engine.connect() as conn:
+        for i in range(5):
+            conn.execute(sqlalchemy.text(f"INSERT INTO orders (id) VALUES ({i})"))
+        budget = RowBudget(max_rows=3)
+        result = conn.execute(sqlalchemy.text("SELECT * FROM orders"))
+        with pytest.raises(ValueError, match="more than 3 rows"):
+            fetch_rows(result, budget, batch_size=2)
+
+    unlimited = RowBudget(max_rows=None)
+    unlimited.consume(10 ** 9)
+    assert unlimited.rows == 10 ** 9
@@ -0,0 +1,288 @@
+import os
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+import shadowtool.main.registra.models as models
+from shadowtool.bin.manage import cli
+from shadowtool.main.registra.manager import RegistraManager
+import shadowtool.main.registra.parsers as parsers
+from shadowtool.main.registra.parsers import BaseRegistraParser
+
+
+class ReplicationParser(BaseRegistraParser):
+    def parse(self) -> models.ReplicationSourceRegistra:
+        raw = dict(self.raw_yaml_dict)
+        raw.pop("registra_type")
+        return models.ReplicationSourceRegistra(**raw)
+
+
+def write_source(registra_path, module, source_name, tables, is_active=True):
+    folder = registra_path / module
+    folder.mkdir(exist_ok=True)
+    content = {
+        "registra_type": "REPLICATION",
+        "source_name": source_name,
+        "source_type": "DATABASE",
+        "is_active": is_active,
+        "data_config": {
+            db_name: {"tables": {tbl_name: {"etl_mode": "INCREMENTAL"} for tbl_name in tbl_names}}
+            for db_name, tbl_names in tables.items()
+        },
+    }
+    path = folder / f"{source_name}.yaml"
+    path.write_text(yaml.safe_dump(content))
+    return path
+
+
+@pytest.fixture
+def registra_path(tmp_path):
+    path = tmp_path / "registra"
+    path.mkdir()
+    write_source(path, "mysql", "Orders", {"shop": ["orders", "refunds"]})
+    write_source(path, "mysql", "users", {"auth": ["users"]})
+    write_source(path, "api", "futu", {"market": ["quotes"]}, is_active=False)
+    return path
+
+
+@pytest.fixture
+def manager(registra_path):
+    return type(
+        "TestRegistraManager",
+        (RegistraManager,),
+        {
+            "_registra": None,
+            "local_registra_path": str(registra_path),
+            "registra_parsers": {"REPLICATION": ReplicationParser},
+        },
+    )
+
+
+def test_load_registra(manager):
+    assert sorted(manager.registra) == ["orders", "users"]
+    assert manager.has_table("orders", "shop", "refunds")
+
+
+def test_load_registra_reuses_snapshot(manager, registra_path, monkeypatch):
+    manager.load_registra()
+
+    def fail_parsing(*args, **kwargs):
+        raise AssertionError("snapshot should have been used")
+
+    monkeypatch.setattr(manager, "_parse_registra_files", fail_parsing)
+    assert sorted(manager.load_registra()) == ["orders", "users"]
+
+    # any change of the yaml files invalidates the snapshot
+    monkeypatch.undo()
+    write_source(registra_path, "api", "futu", {"market": ["quotes"]})
+    assert sorted(manager.load_registra()) == ["futu", "orders", "users"]
+
+
+def test_parser_version_bump_invalidates_snapshot(manager, monkeypatch):
+    manager.load_registra()
+    parse_registra_files = manager._parse_registra_files
+    reparsed = []
+
+    def tracking_parse(registra_files):
+        reparsed.extend(registra_files)
+        return parse_registra_files(registra_files)
+
+    monkeypatch.setattr(manager, "_parse_registra_files", tracking_parse)
+    manager.load_registra()
+    assert reparsed == []
+
+    bumped = type("ReplicationParser", (ReplicationParser,), {"version": "2"})
+    manager.registra_parsers = {"REPLICATION": bumped}
+    assert sorted(manager.load_registra()) == ["orders", "users"]
+    assert len(reparsed) == 3
+
+
+def test_compile_command_writes_the_snapshot_used_by_load(manager, registra_path, monkeypatch):
+    # the command configures the base manager, the test manager shares its parsers
+    monkeypatch.setattr(RegistraManager, "local_registra_path", None, raising=False)
+    monkeypatch.setattr(RegistraManager, "registra_parsers", manager.registra_parsers)
+
+    result = CliRunner().invoke(cli, ["registra", "compile", str(registra_path)])
+
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith("Compiled 2 sources from 3 files")
+    assert os.path.isfile(manager.get_snapshot_path())
+
+    def fail_parsing(*args, **kwargs):
+        raise AssertionError("the compiled snapshot should have been used")
+
+    monkeypatch.setattr(manager, "_parse_registra_files", fail_parsing)
+    assert sorted(manager.load_registra()) == ["orders", "users"]
+
+
+def test_compile_command_output_and_setup_modules(registra_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(RegistraManager, "local_registra_path", None, raising=False)
+    monkeypatch.setattr(RegistraManager, "registra_parsers", {"REPLICATION": ReplicationParser})
+    output = tmp_path / "compiled" / "registra.pkl"
+
+    result = CliRunner().invoke(
+        cli, ["registra", "compile", str(registra_path), "-o", str(output), "-m", "json"]
+    )
+    assert result.exit_code == 0, result.output
+    assert str(output) in result.output and output.is_file()
+
+    result = CliRunner().invoke(
+        cli, ["registra", "compile", str(registra_path), "-m", "shadowtool_missing_module"]
+    )
+    assert isinstance(result.exception, ModuleNotFoundError)
+
+
+def test_parallel_load_matches_serial(manager, registra_path):
+    for i in range(6):
+        write_source(registra_path, "bulk", f"source_{i}", {"db": [f"tbl_{i}"]})
+
+    manager.use_snapshot = False
+    serial = manager.load_registra()
+
+    manager.parallel_load_workers = 2
+    manager.parallel_load_min_files = 1
+    parallel = manager.load_registra()
+
+    assert list(parallel) == list(serial)
+    assert parallel["source_3"] == serial["source_3"]
+
+
+def test_parallel_load_detects_duplicated_sources(manager, registra_path):
+    write_source(registra_path, "other", "users", {"auth": ["users"]})
+    manager.parallel_load_workers = 2
+    manager.parallel_load_min_files = 1
+
+    with pytest.raises(AssertionError, match="duplicated source name `users`"):
+        manager.load_registra()
+
+
+def test_reload_registra_only_parses_changed_files(manager, registra_path, monkeypatch):
+    assert sorted(manager.registra) == ["orders", "users"]
+
+    parsed_files = []
+    parse_registra_file = manager._parse_registra_file
+
+    def tracking_parse(file_path):
+        parsed_files.append(file_path)
+        return parse_registra_file(file_path)
+
+    monkeypatch.setattr(manager, "_parse_registra_file", tracking_parse)
+
+    assert not manager.reload_registra().has_changes
+
+    changed = write_source(registra_path, "mysql", "users", {"auth": ["users", "roles"]})
+    added = write_source(registra_path, "api", "futu", {"market": ["quotes"]})
+    (registra_path / "mysql" / "Orders.yaml").unlink()
+
+    report = manager.reload_registra()
+
+    assert sorted(parsed_files) == sorted([str(changed), str(added)])
+    assert report.updated_sources == ["futu", "users"]
+    assert report.removed_sources == ["orders"]
+    assert sorted(manager.registra) == ["futu", "users"]
+    assert manager.has_table("users", "auth", "roles")
+
+
+def test_registra_tasks_from_index(manager):
+    all_tasks = manager.get_all_available_registra_tasks()
+    assert [(t.source_name, t.db_name, t.tbl_name) for t in all_tasks] == [
+        ("orders", "shop", "orders"),
+        ("orders", "shop", "refunds"),
+        ("users", "auth", "users"),
+    ]
+    assert manager.get_all_available_registra_tasks() is all_tasks
+    assert len(manager.get_all_available_registra_tasks("orders")) == 2
+    assert len(manager.get_all_available_registra_tasks("orders", "shop", "refunds")) == 1
+
+    assert manager.get_tbl_registra("orders", "shop", "refunds").etl_mode == "INCREMENTAL"
+    assert manager.get_tbl_registra("orders", "shop", "missing") is None
+    assert manager.get_tbl_registra("missing", "shop", "refunds") is None
+
+
+def test_lazy_load_only_parses_requested_sources(manager, registra_path, monkeypatch):
+    manager.use_snapshot = False
+    manager.set_lazy_load()
+    parsed_files = []
+    parse_registra_file = manager._parse_registra_file
+
+    def tracking_parse(file_path):
+        parsed_files.append(file_path)
+        return parse_registra_file(file_path)
+
+    monkeypatch.setattr(manager, "_parse_registra_file", tracking_parse)
+
+    assert sorted(manager.registra) == ["orders", "users"]
+    assert parsed_files == []
+
+    assert manager.get_all_available_registra_tasks("users") == (
+        models.RegistraTask(source_name="users", db_name="auth", tbl_name="users"),
+    )
+    assert parsed_files == [str(registra_path / "mysql" / "users.yaml")]
+
+    write_source(registra_path, "mysql", "users", {"auth": ["users", "roles"]})
+    report = manager.reload_registra()
+    assert report.updated_sources == ["users"]
+    assert manager.get_all_available_registra_tasks("users", "auth") == (
+        models.RegistraTask(source_name="users", db_name="auth", tbl_name="roles"),
+        models.RegistraTask(source_name="users", db_name="auth", tbl_name="users"),
+    )
+    assert not manager.registra.is_fully_parsed
+
+
+def test_lazy_reload_drops_deleted_sources_without_parsing(manager, registra_path):
+    manager.use_snapshot = False
+    manager.set_lazy_load()
+    assert sorted(manager.registra) == ["orders", "users"]
+
+    (registra_path / "mysql" / "Orders.yaml").unlink()
+    report = manager.reload_registra()
+
+    assert report.removed_sources == ["orders"]
+    assert sorted(manager.registra) == ["users"]
+    assert not manager.registra.parsed_source_names
+
+
+def test_lazy_reload_drops_renamed_sources_without_parsing(manager, registra_path):
+    manager.use_snapshot = False
+    manager.set_lazy_load()
+    assert sorted(manager.registra) == ["orders", "users"]
+
+    renamed = write_source(registra_path, "mysql", "people", {"auth": ["users"]})
+    renamed.replace(registra_path / "mysql" / "users.yaml")
+    report = manager.reload_registra()
+
+    assert report.removed_sources == ["users"]
+    assert report.updated_sources == ["people"]
+    assert sorted(manager.registra) == ["orders", "people"]
+    assert manager.has_table("people", "auth", "users")
+
+
+def test_parse_cache_skips_unchanged_files(manager, registra_path, monkeypatch):
+    manager.use_snapshot = False
+    manager.load_registra()
+
+    def fail_parsing(self):
+        raise AssertionError("the parse cache should have been used")
+
+    monkeypatch.setattr(ReplicationParser, "parse", fail_parsing)
+    assert sorted(manager.load_registra()) == ["orders", "users"]
+
+    # a new parser version invalidates its cached results
+    monkeypatch.setattr(ReplicationParser, "version", "2")
+    with pytest.raises(AssertionError, match="parse cache"):
+        manager.load_registra()
+
+
+def test_parser_registry():
+    registry = parsers.RegistraParserRegistry(entry_point_group="shadowtool.tests.none")
+
+    @registry.register("REPLICATION")
+    class OtherParser(ReplicationParser):
+        pass
+
+    assert registry.get("REPLICATION") is OtherParser
+    assert registry.as_mapping() == {"REPLICATION": OtherParser}
+
+    registry.unregister("REPLICATION")
+    assert registry.get("REPLICATION") is None
@@ -0,0 +1,32 @@
+import shadowtool.main.registra.models as models
+
+
+RAW_SOURCE = {
+    "source_name": "orders",
+    "source_type": "DATABASE",
+    "data_config": {
+        "shop": {
+            "tables": {
+                "orders": {"etl_mode": "INCREMENTAL", "owner": "sales"},
+                "refunds": {"upsert_key": ["id"]},
+            }
+        }
+    },
+}
+
+
+def test_table_registra_collects_extra():
+    tbl = models.BaseTableRegistraTemplate(etl_mode="FULL", owner="sales", ttl=3)
+    assert tbl.etl_mode == "FULL"
+    assert tbl.extra == {"owner": "sales", "ttl": 3}
+    assert "extra" not in models.get_field_aliases(models.BaseTableRegistraTemplate)
+
+
+def test_source_registra_validation():
+    source = models.ReplicationSourceRegistra(**RAW_SOURCE)
+
+    assert source.is_active
+    assert source.source_type is models.SourceType.DATABASE
+    assert source.data_config["shop"].tables["orders"].extra == {"owner": "sales"}
+    assert source.data_config["shop"].tables["refunds"].etl_mode is None
+    assert models.get_field_aliases.cache_info().currsize >= 1
@@ -0,0 +1,142 @@
+import gzip
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from shadowtool.main.vendors.aws import S3ObjectSummary
+from shadowtool.main.vendors.response_cache import (
+    LocalObjectStore,
+    ResponseCache,
+    S3ObjectStore,
+    request_cache_key,
+)
+
+WINDOW = (date(2021, 1, 1), date(2021, 1, 2))
+
+
+def test_request_cache_key_ignores_params_order():
+    assert request_cache_key("quotes", {"a": 1, "b": 2}, WINDOW) == request_cache_key(
+        "quotes", {"b": 2, "a": 1}, WINDOW
+    )
+    assert request_cache_key("quotes", {"a": 1}, WINDOW) != request_cache_key(
+        "quotes", {"a": 1}, (date(2021, 1, 2), date(2021, 1, 3))
+    )
+    assert request_cache_key("quotes", None, WINDOW) != request_cache_key("trades", None, WINDOW)
+
+
+def test_get_or_fetch_hits_the_cache_on_rerun(tmp_path):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"symbol": "AAPL", "price": 1.5, "at": datetime(2021, 1, 1, 9, 30)}]
+
+    cache = ResponseCache(LocalObjectStore(str(tmp_path)))
+    first = cache.get_or_fetch("quotes", fetch, params={"symbol": "AAPL"}, window=WINDOW)
+
+    rerun = ResponseCache(LocalObjectStore(str(tmp_path)))
+    second = rerun.get_or_fetch("quotes", fetch, params={"symbol": "AAPL"}, window=WINDOW)
+
+    assert len(calls) == 1
+    assert first[0]["at"] == datetime(2021, 1, 1, 9, 30)
+    assert second == first
+    assert rerun.stats().hits == 1
+
+
+def test_cached_records_keep_their_types(tmp_path):
+    records = [
+        {
+            "at": datetime(2021, 1, 1, 9, 30, tzinfo=timezone.utc),
+            "day": date(2021, 1, 1),
+            "amount": Decimal("10.25"),
+            "raw": b"\x00\xff",
+            "nested": {"fills": [{"at": datetime(2021, 1, 1, 9, 31), "qty": 2}]},
+            "plain": {"a": [1, "b", None]},
+        }
+    ]
+    cache = ResponseCache(LocalObjectStore(str(tmp_path)))
+    cache.put("quotes", records, window=WINDOW)
+
+    cached = ResponseCache(LocalObjectStore(str(tmp_path))).get("quotes", window=WINDOW)
+
+    assert cached == records
+    assert type(cached[0]["day"]) is date and type(cached[0]["amount"]) is Decimal
+
+
+def test_unreadable_cached_response_is_a_miss(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    cache = ResponseCache(store)
+    cache.put("quotes", [{"a": 1}], window=WINDOW)
+    (obj,) = store.list()
+
+    for corrupted in (b"not gzip", gzip.compress(b"{not json"), store.read(obj.key)[:20]):
+        store.write(obj.key, corrupted)
+        assert cache.get("quotes", window=WINDOW) is None
+
+    assert cache.stats().misses == 3
+    assert cache.get_or_fetch("quotes", lambda: [{"a": 2}], window=WINDOW) == [{"a": 2}]
+    assert cache.get("quotes", window=WINDOW) == [{"a": 2}]
+
+
+def test_open_windows_and_ttl(tmp_path):
+    cache = ResponseCache(LocalObjectStore(str(tmp_path)), ttl=60)
+
+    now = datetime.now(timezone.utc)
+    assert not cache.put("quotes", [{"a": 1}], window=(now - timedelta(hours=1), now + timedelta(hours=1)))
+    assert cache.put("quotes", [{"a": 1}], window=WINDOW)
+
+    cache.ttl = 0
+    assert cache.get("quotes", window=WINDOW) is None
+    assert cache.stats().expirations == 1
+
+
+def test_evict_expired_then_oldest(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    cache = ResponseCache(store, ttl=3600, max_bytes=10 ** 6)
+    for day in range(1, 4):
+        cache.put("quotes", [{"v": "x" * 200}], window=(date(2021, 1, day), date(2021, 1, day + 1)))
+
+    objects = sorted(store.list(), key=lambda o: o.key)
+    for i, obj in enumerate(objects):
+        age = 7200 if i == 0 else 100 - i
+        mtime = time.time() - age
+        os.utime(os.path.join(str(tmp_path), obj.key), (mtime, mtime))
+
+    cache.max_bytes = max(o.size for o in objects)
+    assert cache.evict() == 2
+    remaining = store.list()
+    assert [o.key for o in remaining] == [objects[2].key]
+
+
+class _FakeS3Hook:
+    def __init__(self):
+        self.objects = {}
+
+    def read_file(self, target_key):
+        return self.objects.get(target_key)
+
+    def create_file(self, target_key, data):
+        self.objects[target_key] = data
+
+    def iter_objects(self, prefix=""):
+        for key, data in self.objects.items():
+            if key.startswith(prefix):
+                yield S3ObjectSummary(key, len(data), '"-"', datetime.now(timezone.utc))
+
+    def bulk_delete(self, keys):
+        for key in keys:
+            self.objects.pop(key, None)
+
+
+def test_s3_object_store_keeps_the_prefix():
+    hook = _FakeS3Hook()
+    cache = ResponseCache(S3ObjectStore(hook, "/cached/shop/quotes/"), ttl=None)
+    cache.put("quotes", [{"a": 1}], window=WINDOW)
+
+    (key,) = hook.objects
+    assert key.startswith("cached/shop/quotes/responses/") and key.endswith(".jsonl.gz")
+    assert cache.get("quotes", window=WINDOW) == [{"a": 1}]
+
+    cache.max_bytes = 0
+    assert cache.evict() == 1 and not hook.objects
@@ -0,0 +1,144 @@
+from datetime import datetime
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+import shadowtool.exceptions as exc
+import shadowtool.main.vendors.aws as aws
+
+
+@pytest.fixture
+def moto_hook(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_s3():
+        session = boto3.session.Session(region_name="us-east-1")
+        session.client("s3").create_bucket(Bucket="lake")
+        yield aws.S3Hook(bucket_name="lake", session=session)
+
+
+@pytest.fixture
+def stubbed_hook(monkeypatch):
+    monkeypatch.setattr(aws.time, "sleep", lambda _: None)
+    session = boto3.session.Session(
+        region_name="us-east-1", aws_access_key_id="testing", aws_secret_access_key="testing"
+    )
+    hook = aws.S3Hook(bucket_name="lake", session=session)
+    with Stubber(hook.s3_client) as stubber:
+        yield hook, stubber
+        stubber.assert_no_pending_responses()
+
+
+def _put_keys(hook, keys):
+    for key in keys:
+        hook.s3_client.put_object(Bucket="lake", Key=key, Body=b"")
+
+
+def _remaining_keys(hook, prefix=""):
+    return sorted(obj.key for obj in hook.iter_objects(prefix=prefix))
+
+
+def test_bulk_delete_sends_batches_of_1000_keys(moto_hook):
+    keys = [f"raw/orders/part-{i:05d}" for i in range(2001)]
+    _put_keys(moto_hook, keys)
+
+    batch_sizes = []
+    delete_objects = moto_hook.s3_client.delete_objects
+
+    def counting_delete_objects(**kwargs):
+        batch_sizes.append(len(kwargs["Delete"]["Objects"]))
+        return delete_objects(**kwargs)
+
+    moto_hook.s3_client.delete_objects = counting_delete_objects
+    report = moto_hook.bulk_delete(iter(keys), max_workers=2)
+
+    assert sorted(batch_sizes) == [1, 1000, 1000]
+    assert report.deleted == 2001 and report.succeeded
+    assert _remaining_keys(moto_hook) == []
+
+
+def test_delete_file_and_folder_return_a_report(moto_hook):
+    _put_keys(moto_hook, ["clean/tbl/a", "clean/tbl/b", "clean/tbl_v2/a", "clean/other"])
+
+    report = moto_hook.delete_file(target_key="clean/other")
+    assert isinstance(report, aws.S3DeleteReport) and report.deleted == 1
+
+    report = moto_hook.delete_folder("clean/tbl")
+    assert report.deleted == 2 and report.succeeded
+    assert _remaining_keys(moto_hook, "clean/") == ["clean/tbl_v2/a"]
+
+
+def _delete_params(keys):
+    return {"Bucket": "lake", "Delete": {"Objects": [{"Key": key} for key in keys], "Quiet": True}}
+
+
+def test_delete_batch_retries_throttled_keys_only(stubbed_hook):
+    hook, stubber = stubbed_hook
+    stubber.add_response(
+        "delete_objects",
+        {
+            "Errors": [
+                {"Key": "b", "Code": "SlowDown", "Message": "Please reduce your request rate."},
+                {"Key": "c", "Code": "AccessDenied", "Message": "Access Denied"},
+            ]
+        },
+        _delete_params(["a", "b", "c"]),
+    )
+    stubber.add_response("delete_objects", {}, _delete_params(["b"]))
+
+    report = hook.bulk_delete(["a", "b", "c"])
+
+    assert report.deleted == 2
+    assert report.failed == {"c": "AccessDenied: Access Denied"}
+
+
+def test_delete_batch_retries_throttled_requests(stubbed_hook):
+    hook, stubber = stubbed_hook
+    stubber.add_client_error("delete_objects", "SlowDown", http_status_code=503)
+    stubber.add_response("delete_objects", {}, _delete_params(["a", "b"]))
+
+    report = hook.bulk_delete(["a", "b"])
+
+    assert report.deleted == 2 and report.succeeded
+
+
+def test_delete_batch_reports_keys_failing_after_the_last_attempt(stubbed_hook):
+    hook, stubber = stubbed_hook
+    for _ in range(aws.S3Hook.DELETE_MAX_ATTEMPTS):
+        stubber.add_response(
+            "delete_objects", {"Errors": [{"Key": "a", "Code": "InternalError", "Message": "oops"}]}
+        )
+
+    report = hook.bulk_delete(["a"])
+
+    assert report.deleted == 0 and report.failed == {"a": "InternalError: oops"}
+
+
+def _listed(key):
+    return {"Key": key, "Size": 1, "ETag": '"-"', "LastModified": datetime(2021, 1, 1)}
+
+
+def test_delete_file_raises_on_partial_failure(stubbed_hook):
+    hook, stubber = stubbed_hook
+    stubber.add_response(
+        "list_objects_v2",
+        {"Contents": [_listed("clean/tbl/a"), _listed("clean/tbl/b")]},
+        {"Bucket": "lake", "Prefix": "clean/tbl/", "MaxKeys": ANY},
+    )
+    stubber.add_response(
+        "delete_objects",
+        {"Errors": [{"Key": "clean/tbl/b", "Code": "AccessDenied", "Message": "Access Denied"}]},
+    )
+
+    with pytest.raises(exc.S3DeleteFailure) as e:
+        hook.delete_file(prefix="clean/tbl/")
+
+    assert e.value.report.deleted == 1
+    assert list(e.value.report.failed) == ["clean/tbl/b"]
+
+    # a request failing for good fails every key of the batch, without retries
+    stubber.add_client_error("delete_objects", "AccessDenied", http_status_code=403)
+    with pytest.raises(exc.S3DeleteFailure, match="1 key"):
+        hook.delete_file(target_key="clean/tbl/c")
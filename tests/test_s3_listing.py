@@ -0,0 +1,97 @@
+import threading
+
+import boto3
+import pytest
+
+import shadowtool.main.vendors.aws as aws
+
+moto = pytest.importorskip("moto")
+
+PREFIX = "clean/orders/"
+PARTITIONS = ["dt=2021-01-01", "dt=2021-01-02", "dt=2021-01-03"]
+
+
+@pytest.fixture
+def s3_hook(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_s3():
+        session = boto3.session.Session(region_name="us-east-1")
+        client = session.client("s3")
+        client.create_bucket(Bucket="lake")
+        client.put_object(Bucket="lake", Key=f"{PREFIX}_SUCCESS", Body=b"")
+        for partition in PARTITIONS:
+            for i in range(5):
+                client.put_object(
+                    Bucket="lake", Key=f"{PREFIX}{partition}/part-{i}.parquet", Body=b"x" * i
+                )
+        client.put_object(Bucket="lake", Key="clean/refunds/part-0.parquet", Body=b"")
+        yield aws.S3Hook(bucket_name="lake", session=session)
+
+
+def _all_keys():
+    return sorted(
+        [f"{PREFIX}_SUCCESS"]
+        + [f"{PREFIX}{p}/part-{i}.parquet" for p in PARTITIONS for i in range(5)]
+    )
+
+
+def test_iter_object_pages_pages_through_the_prefix(s3_hook):
+    pages = list(s3_hook.iter_object_pages(prefix=PREFIX, page_size=4))
+
+    assert [len(page) for page in pages] == [4, 4, 4, 4]
+    assert sorted(o.key for page in pages for o in page) == _all_keys()
+    sizes = {o.key: o.size for page in pages for o in page}
+    assert sizes[f"{PREFIX}dt=2021-01-02/part-3.parquet"] == 3
+
+
+def test_list_sub_prefixes(s3_hook):
+    objects, sub_prefixes = s3_hook.list_sub_prefixes(prefix=PREFIX, delimiter="/")
+
+    assert [o.key for o in objects] == [f"{PREFIX}_SUCCESS"]
+    assert sub_prefixes == [f"{PREFIX}{p}/" for p in PARTITIONS]
+
+
+def test_iter_objects_fans_out_over_sub_prefixes(s3_hook):
+    listed = sorted(o.key for o in s3_hook.iter_objects(prefix=PREFIX, page_size=2))
+    fanned_out = sorted(
+        o.key
+        for o in s3_hook.iter_objects(
+            prefix=PREFIX, fan_out_delimiter="/", max_workers=2, page_size=2
+        )
+    )
+
+    assert listed == fanned_out == _all_keys()
+    assert sorted(s3_hook.list_files_in_bucket(prefix=PREFIX, fan_out_delimiter="/")) == _all_keys()
+
+
+def test_concurrent_listing_stops_its_workers_on_early_break(s3_hook):
+    threads_before = threading.active_count()
+    prefixes = [f"{PREFIX}{p}/" for p in PARTITIONS]
+
+    # one worker and a queue of two pages: the workers block on the full queue
+    pages = s3_hook._iter_object_pages_concurrently(prefixes, max_workers=1, page_size=1)
+    first = next(pages)
+    pages.close()
+
+    assert len(first) == 1
+    assert threading.active_count() == threads_before
+
+
+def test_concurrent_listing_raises_listing_errors(s3_hook, monkeypatch):
+    threads_before = threading.active_count()
+    iter_object_pages = s3_hook.iter_object_pages
+
+    def failing_pages(prefix="", page_size=1000):
+        if "2021-01-02" in prefix:
+            raise RuntimeError("access denied")
+        return iter_object_pages(prefix=prefix, page_size=page_size)
+
+    monkeypatch.setattr(s3_hook, "iter_object_pages", failing_pages)
+    prefixes = [f"{PREFIX}{p}/" for p in PARTITIONS]
+
+    with pytest.raises(RuntimeError, match="access denied"):
+        for _ in s3_hook._iter_object_pages_concurrently(prefixes, max_workers=2, page_size=1):
+            pass
+    assert threading.active_count() == threads_before
+    assert list(s3_hook._iter_object_pages_concurrently([], max_workers=2, page_size=1)) == []
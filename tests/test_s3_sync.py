@@ -0,0 +1,218 @@
+import hashlib
+import os
+import time
+
+import boto3
+import pytest
+
+import shadowtool.exceptions as exc
+import shadowtool.main.vendors.aws as aws
+from shadowtool.main.vendors.s3_sync import (
+    MB,
+    LocalFileState,
+    RemoteFileState,
+    S3SyncEngine,
+    normalise_prefix,
+    plan_sync,
+)
+
+
+def _local(path, size, mtime):
+    return LocalFileState(path=path, size=size, mtime=mtime)
+
+
+def _remote(key, size, last_modified, etag='"-"'):
+    return RemoteFileState(key=key, size=size, etag=etag, last_modified=last_modified)
+
+
+def test_normalise_prefix():
+    assert normalise_prefix("registra/batch") == "registra/batch/"
+    assert normalise_prefix("/registra/") == "registra/"
+    assert normalise_prefix("") == ""
+
+
+def test_plan_download():
+    local = {
+        "same.yaml": _local("same.yaml", 10, 100.0),
+        "resized.yaml": _local("resized.yaml", 10, 100.0),
+        "outdated.yaml": _local("outdated.yaml", 10, 100.0),
+        "stale.yaml": _local("stale.yaml", 10, 100.0),
+    }
+    remote = {
+        "same.yaml": _remote("p/same.yaml", 10, 100.5),
+        "resized.yaml": _remote("p/resized.yaml", 11, 100.0),
+        "outdated.yaml": _remote("p/outdated.yaml", 10, 200.0),
+        "new.yaml": _remote("p/new.yaml", 10, 100.0),
+    }
+
+    to_transfer, to_skip, to_delete = plan_sync(local, remote, "download")
+
+    assert to_transfer == ["new.yaml", "outdated.yaml", "resized.yaml"]
+    assert to_skip == ["same.yaml"]
+    assert to_delete == ["stale.yaml"]
+
+
+def test_plan_upload_skips_remote_newer():
+    local = {"a.yaml": _local("a.yaml", 10, 100.0), "b.yaml": _local("b.yaml", 10, 300.0)}
+    remote = {"a.yaml": _remote("p/a.yaml", 10, 200.0), "b.yaml": _remote("p/b.yaml", 10, 200.0)}
+
+    to_transfer, to_skip, _ = plan_sync(local, remote, "upload")
+
+    assert to_transfer == ["b.yaml"]
+    assert to_skip == ["a.yaml"]
+
+
+def test_plan_compare_etag(tmp_path):
+    content = b"source_name: futu"
+    path = tmp_path / "a.yaml"
+    path.write_bytes(content)
+    etag = f'"{hashlib.md5(content).hexdigest()}"'
+
+    local = {"a.yaml": _local(str(path), len(content), 100.0)}
+    remote = {"a.yaml": _remote("p/a.yaml", len(content), 200.0, etag=etag)}
+
+    assert plan_sync(local, remote, "download")[0] == ["a.yaml"]
+    assert plan_sync(local, remote, "download", compare_etag=True)[0] == []
+
+
+PREFIX = "registra/batch/"
+OBJECTS = {"a.yaml": b"a: 1", "nested/b.yaml": b"b: 22", "nested/deep/c.yaml": b"c: 333"}
+
+
+@pytest.fixture
+def s3_hook(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    # recent botocore sends checksummed aws-chunked uploads by default, which older
+    # moto versions store as is
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    with moto.mock_s3():
+        session = boto3.session.Session(region_name="us-east-1")
+        client = session.client("s3")
+        client.create_bucket(Bucket="lake")
+        for rel_path, body in OBJECTS.items():
+            client.put_object(Bucket="lake", Key=PREFIX + rel_path, Body=body)
+        yield aws.S3Hook(bucket_name="lake", session=session)
+
+
+def _read_local(local_path):
+    result = {}
+    for root, _, files in os.walk(local_path):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                result[os.path.relpath(path, local_path).replace(os.sep, "/")] = f.read()
+    return result
+
+
+def test_bulk_download_syncs_the_prefix(s3_hook, tmp_path):
+    local_path = str(tmp_path / "registra")
+
+    report = s3_hook.bulk_download_files(PREFIX, local_path)
+
+    assert _read_local(local_path) == OBJECTS
+    assert sorted(report.files_transferred) == sorted(OBJECTS)
+    assert report.bytes_transferred == sum(len(body) for body in OBJECTS.values())
+    assert report.source == f"s3://lake/{PREFIX}" and report.succeeded
+    assert report.source_etags == {
+        rel_path: s3_hook.s3_client.head_object(Bucket="lake", Key=PREFIX + rel_path)["ETag"]
+        for rel_path in OBJECTS
+    }
+
+    # the local mtimes follow S3, so nothing is transferred again
+    rerun = s3_hook.bulk_download_files(PREFIX, local_path)
+    assert rerun.files_transferred == [] and sorted(rerun.files_skipped) == sorted(OBJECTS)
+    assert rerun.source_etags == report.source_etags
+
+
+def test_bulk_download_deletes_local_only_files(s3_hook, tmp_path):
+    local_path = tmp_path / "registra"
+    s3_hook.bulk_download_files(PREFIX, str(local_path))
+    (local_path / "stale.yaml").write_bytes(b"stale")
+
+    kept = s3_hook.bulk_download_files(PREFIX, str(local_path), delete=False)
+    assert kept.files_deleted == [] and (local_path / "stale.yaml").exists()
+
+    report = s3_hook.bulk_download_files(PREFIX, str(local_path))
+    assert report.files_deleted == ["stale.yaml"]
+    assert _read_local(str(local_path)) == OBJECTS
+
+
+def test_bulk_download_raises_the_failed_transfers(s3_hook, tmp_path, monkeypatch):
+    list_remote_files = S3SyncEngine.list_remote_files
+
+    def list_with_a_vanished_object(engine, s3_prefix):
+        # the object is deleted between the listing and its download
+        remote_files = list_remote_files(engine, s3_prefix)
+        remote_files["gone.yaml"] = RemoteFileState(
+            key=PREFIX + "gone.yaml", size=3, etag='"-"', last_modified=time.time()
+        )
+        return remote_files
+
+    monkeypatch.setattr(S3SyncEngine, "list_remote_files", list_with_a_vanished_object)
+
+    with pytest.raises(exc.S3SyncFailure) as e:
+        s3_hook.bulk_download_files(PREFIX, str(tmp_path))
+
+    report = e.value.report
+    assert list(report.failed) == ["gone.yaml"] and not report.succeeded
+    assert sorted(report.files_transferred) == sorted(OBJECTS)
+    assert "1 file(s) failed to sync" in str(e.value)
+
+
+def test_bulk_upload_syncs_the_local_path(s3_hook, tmp_path):
+    local_path = tmp_path / "upload"
+    (local_path / "nested").mkdir(parents=True)
+    (local_path / "a.yaml").write_bytes(b"a: 2")
+    (local_path / "nested" / "new.yaml").write_bytes(b"new: 1")
+
+    report = s3_hook.bulk_upload_files("staging/", str(local_path))
+
+    assert sorted(report.files_transferred) == ["a.yaml", "nested/new.yaml"]
+    assert report.destination == "s3://lake/staging/" and report.source_etags == {}
+    body = s3_hook.s3_client.get_object(Bucket="lake", Key="staging/nested/new.yaml")["Body"]
+    assert body.read() == b"new: 1"
+
+    # remote copies are newer now, and remote only objects are left alone
+    s3_hook.s3_client.put_object(Bucket="lake", Key="staging/remote_only.yaml", Body=b"")
+    rerun = s3_hook.bulk_upload_files("staging/", str(local_path))
+    assert rerun.files_transferred == [] and len(rerun.files_skipped) == 2
+    assert s3_hook.read_file("staging/remote_only.yaml") == b""
+
+
+def test_bulk_upload_compare_etag_skips_touched_files(s3_hook, tmp_path):
+    local_path = tmp_path / "upload"
+    local_path.mkdir()
+    (local_path / "a.yaml").write_bytes(OBJECTS["a.yaml"])
+    # newer than the object, with the same content
+    future = time.time() + 3600
+    os.utime(str(local_path / "a.yaml"), (future, future))
+
+    compared = s3_hook.bulk_upload_files(PREFIX, str(local_path), compare_etag=True)
+    assert compared.files_skipped == ["a.yaml"] and compared.files_transferred == []
+
+    uploaded = s3_hook.bulk_upload_files(PREFIX, str(local_path))
+    assert uploaded.files_transferred == ["a.yaml"]
+
+
+def test_multipart_transfers_round_trip(s3_hook, tmp_path):
+    # the smallest part size S3 accepts
+    engine = S3SyncEngine(
+        client=s3_hook.s3_client,
+        bucket_name="lake",
+        multipart_threshold=5 * MB,
+        multipart_chunksize=5 * MB,
+    )
+    upload_path, download_path = tmp_path / "upload", tmp_path / "download"
+    upload_path.mkdir()
+    body = os.urandom(6 * MB)
+    (upload_path / "large.bin").write_bytes(body)
+
+    assert engine.upload(str(upload_path), "large").files_transferred == ["large.bin"]
+    # multipart ETags are not an md5 of the content
+    assert engine.list_remote_files("large")["large.bin"].etag.strip('"').endswith("-2")
+
+    report = engine.download("large", str(download_path))
+    assert report.bytes_transferred == len(body)
+    assert (download_path / "large.bin").read_bytes() == body
@@ -0,0 +1,101 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from shadowtool.main.general.watermark_utils import (
+    LocalFileWatermarkStore,
+    PostgresWatermarkStore,
+    Watermark,
+    decode_watermark_value,
+    encode_watermark_value,
+    get_watermark_store,
+)
+
+
+@pytest.mark.parametrize(
+    "value", [42, 1.5, "2021-01-01", datetime(2021, 1, 1, 12, 30), date(2021, 1, 1), Decimal("1.10")]
+)
+def test_watermark_values_keep_their_type(value):
+    decoded = decode_watermark_value(encode_watermark_value(value))
+    assert decoded == value and type(decoded) is type(value)
+
+
+def test_local_file_store_only_moves_forward(tmp_path):
+    store = LocalFileWatermarkStore(str(tmp_path / "state" / "watermarks.json"))
+    assert store.get("clean_shop.orders") is None
+
+    assert store.commit(Watermark("clean_shop.orders", "id", 100))
+    assert not store.commit(Watermark("clean_shop.orders", "id", 90))
+    assert store.get("clean_shop.orders").value == 100
+
+    # forced, e.g. after a full reload, or a different key
+    assert store.commit(Watermark("clean_shop.orders", "id", 90), force=True)
+    assert store.commit(Watermark("clean_shop.orders", "updated_at", datetime(2021, 1, 1)))
+
+    reopened = LocalFileWatermarkStore(store.path)
+    assert reopened.get("clean_shop.orders").value == datetime(2021, 1, 1)
+
+    reopened.delete("clean_shop.orders")
+    assert store.get("clean_shop.orders") is None
+
+
+def test_get_watermark_store(tmp_path):
+    assert isinstance(get_watermark_store(str(tmp_path / "w.json")), LocalFileWatermarkStore)
+    assert get_watermark_store(f"file://{tmp_path}/w.json").path == f"{tmp_path}/w.json"
+    assert isinstance(get_watermark_store("postgresql://u:p@db/state"), PostgresWatermarkStore)
+    with pytest.raises(ValueError):
+        get_watermark_store("redis://cache")
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, statement, params=None):
+        self.conn.statements.append((statement, params))
+
+    def fetchone(self):
+        return self.conn.returned
+
+
+class _FakeConnection:
+    def __init__(self, returned):
+        self.returned = returned
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+def test_postgres_store_commits_in_a_single_conditional_upsert(monkeypatch):
+    store = PostgresWatermarkStore(dsn="postgresql://u:p@db/state")
+    conn = _FakeConnection(returned=None)
+    monkeypatch.setattr(store, "_connect", lambda: conn)
+
+    # a lower value: the upsert's WHERE left the row untouched
+    assert not store.commit(Watermark("clean_shop.orders", "id", 90))
+    (statement, params), = conn.statements
+    assert "ON CONFLICT (fq_tbl_name) DO UPDATE" in statement
+    assert "WHERE current.key <> EXCLUDED.key" in statement
+    assert statement.endswith("RETURNING fq_tbl_name")
+    assert params[:3] == ("clean_shop.orders", "id", '{"type": "int", "value": 90}')
+
+    conn.returned = ("clean_shop.orders",)
+    assert store.commit(Watermark("clean_shop.orders", "id", 90), force=True)
+    assert " WHERE " not in conn.statements[-1][0]